@@ -184,9 +184,18 @@ Q_CLUSTER = {
     'queue_limit': 500,
     'cpu_affinity': 1,
     'label': 'Django Q',
+    # Workers não-daemônicos podem abrir o pool de parse MIME (tasks.parsing)
+    'daemonize_workers': False,
     'redis': env('REDIS_URL', default='redis://127.0.0.1:6379/0')
 }
 
+# Quantos emails cada job `process_email_batch` processa (enfileirado pelo fetch_emails).
+# Mantenha o grupo pequeno o bastante para caber no 'timeout' do Q_CLUSTER.
+PROCESS_EMAIL_GROUP_SIZE = env.int('PROCESS_EMAIL_GROUP_SIZE', default=10)
+# Passado este tempo, o job reenfileira os ids que faltam. Deixe folga no 'timeout' para
+# o email em andamento (retries e cascada de modelos).
+PROCESS_EMAIL_TIME_BUDGET_SECONDS = env.int('PROCESS_EMAIL_TIME_BUDGET_SECONDS', default=30)
+
 
 # --- INTEGRAÇÕES ---
 
@@ -208,4 +217,130 @@ TELEGRAM_CHAT_ID = env('TELEGRAM_CHAT_ID', default=None)
 IMAP_HOST = env('IMAP_HOST', default=None)
 IMAP_PORT = env.int('IMAP_PORT')
 IMAP_USERNAME = env('IMAP_USERNAME', default=None)
-IMAP_PASSWORD = env('IMAP_PASSWORD', default=None)
\ No newline at end of file
+IMAP_PASSWORD = env('IMAP_PASSWORD', default=None)
+
+# Ingestão push (IMAP IDLE) - daemon `python manage.py imap_idle`
+# Quando ativo, novas MailBoxes não ganham o Schedule de polling de 5 minutos, e o daemon
+# pausa o das existentes enquanto mantém a sessão IDLE delas.
+IMAP_IDLE_ENABLED = env.bool('IMAP_IDLE_ENABLED', default=False)
+IMAP_IDLE_REFRESH_SECONDS = env.int('IMAP_IDLE_REFRESH_SECONDS', default=25 * 60)
+IMAP_IDLE_POLL_SECONDS = env.int('IMAP_IDLE_POLL_SECONDS', default=60)
+
+# Orquestrador de fetch: um único Schedule de 1 minuto (tasks.orchestrator.fetch_due_mailboxes)
+# busca em paralelo as MailBoxes vencidas, no lugar de um Schedule de 5 minutos por caixa.
+IMAP_FETCH_ORCHESTRATOR = env.bool('IMAP_FETCH_ORCHESTRATOR', default=False)
+IMAP_FETCH_INTERVAL_SECONDS = env.int('IMAP_FETCH_INTERVAL_SECONDS', default=5 * 60)
+IMAP_FETCH_CONCURRENCY = env.int('IMAP_FETCH_CONCURRENCY', default=16)
+# Logins simultâneos por host IMAP (ex: imap.gmail.com) dentro de um tick.
+IMAP_MAX_CONNECTIONS_PER_HOST = env.int('IMAP_MAX_CONNECTIONS_PER_HOST', default=4)
+# Conexões autenticadas reaproveitadas entre ticks; acima disso são descartadas.
+IMAP_POOL_MAX_IDLE_SECONDS = env.int('IMAP_POOL_MAX_IDLE_SECONDS', default=4 * 60)
+# MailBoxes que não começarem dentro deste prazo ficam para o próximo tick (< 'timeout' do Q_CLUSTER);
+# as já começadas param entre lotes de 200 UIDs quando ele passa.
+IMAP_FETCH_TICK_BUDGET_SECONDS = env.int('IMAP_FETCH_TICK_BUDGET_SECONDS', default=40)
+
+# Cadência adaptativa (tasks.cadence): intervalo = tempo esperado para chegar
+# IMAP_POLL_TARGET_MESSAGES emails, entre o piso e o teto abaixo. Com IMAP_FETCH_ORCHESTRATOR
+# o piso efetivo é o tick de 60s do orquestrador.
+IMAP_POLL_MIN_SECONDS = env.int('IMAP_POLL_MIN_SECONDS', default=30)
+IMAP_POLL_MAX_SECONDS = env.int('IMAP_POLL_MAX_SECONDS', default=60 * 60)
+IMAP_POLL_TARGET_MESSAGES = env.float('IMAP_POLL_TARGET_MESSAGES', default=1.0)
+# Janela da média móvel da taxa de chegada.
+IMAP_ARRIVAL_RATE_WINDOW_SECONDS = env.int('IMAP_ARRIVAL_RATE_WINDOW_SECONDS', default=60 * 60)
+
+# Fetch parcial (header-first): ENVELOPE/BODYSTRUCTURE e só a parte de texto, sem anexos.
+IMAP_PARTIAL_FETCH = env.bool('IMAP_PARTIAL_FETCH', default=False)
+# Teto de bytes baixados por mensagem na fase 2 do fetch parcial.
+IMAP_MAX_MESSAGE_BYTES = env.int('IMAP_MAX_MESSAGE_BYTES', default=1024 * 1024)
+
+# Parse MIME em pool de processos (tasks.parsing). 0 desliga o pool (parse serial).
+IMAP_PARSE_WORKERS = env.int('IMAP_PARSE_WORKERS', default=max(1, (os.cpu_count() or 2) - 1))
+# Lotes menores que isso são parseados no próprio worker (não compensa o IPC).
+IMAP_PARSE_POOL_MIN_BATCH = env.int('IMAP_PARSE_POOL_MIN_BATCH', default=32)
+IMAP_PARSE_START_METHOD = env('IMAP_PARSE_START_METHOD', default='forkserver')
+
+# Arquivo do RFC822 bruto endereçado por SHA-256 (emails.archive), para replay sem IMAP.
+# Backend: '' (desligado), 'filesystem' ou 's3' (requer boto3). Compressão: 'zstd' (requer zstandard) ou 'gzip';
+# vazio = zstd se disponível.
+RAW_ARCHIVE_BACKEND = env('RAW_ARCHIVE_BACKEND', default='')
+RAW_ARCHIVE_COMPRESSION = env('RAW_ARCHIVE_COMPRESSION', default='')
+RAW_ARCHIVE_ROOT = env('RAW_ARCHIVE_ROOT', default=str(BASE_DIR / 'raw_archive'))
+RAW_ARCHIVE_BUCKET = env('RAW_ARCHIVE_BUCKET', default=None)
+RAW_ARCHIVE_PREFIX = env('RAW_ARCHIVE_PREFIX', default='raw')
+RAW_ARCHIVE_ENDPOINT_URL = env('RAW_ARCHIVE_ENDPOINT_URL', default=None)
+
+# Cache de resultados da extração (extraction.cache): chave = hash(texto normalizado, schema, prompt, modelo).
+# Escopo por usuário, a menos que o ExtractionProfile use cache_scope=SHARED.
+EXTRACTION_REDIS_URL = env('EXTRACTION_REDIS_URL', default=env('REDIS_URL', default='redis://127.0.0.1:6379/0'))
+EXTRACTION_CACHE_ENABLED = env.bool('EXTRACTION_CACHE_ENABLED', default=True)
+EXTRACTION_CACHE_TTL_SECONDS = env.int('EXTRACTION_CACHE_TTL_SECONDS', default=7 * 24 * 3600)
+# Camada local (por processo), na frente do Redis
+EXTRACTION_CACHE_LOCAL_MAX_ENTRIES = env.int('EXTRACTION_CACHE_LOCAL_MAX_ENTRIES', default=1024)
+EXTRACTION_CACHE_LOCAL_TTL_SECONDS = env.int('EXTRACTION_CACHE_LOCAL_TTL_SECONDS', default=600)
+# Resultados maiores que isso não são guardados (0 = sem limite)
+EXTRACTION_CACHE_MAX_VALUE_BYTES = env.int('EXTRACTION_CACHE_MAX_VALUE_BYTES', default=64 * 1024)
+
+# Motor de extração assíncrono (extraction.async_engine), opt-in: o process_email_batch faz as chamadas
+# do grupo em paralelo. Com ele ligado, vale aumentar PROCESS_EMAIL_GROUP_SIZE (respeitando o 'timeout').
+EXTRACTION_ASYNC_ENABLED = env.bool('EXTRACTION_ASYNC_ENABLED', default=False)
+EXTRACTION_CONCURRENCY = env.int('EXTRACTION_CONCURRENCY', default=16)
+# Limites da conta OpenAI, compartilhados por todos os workers via Redis (extraction.ratelimit). 0 desliga o balde.
+EXTRACTION_RATE_LIMIT_RPM = env.int('EXTRACTION_RATE_LIMIT_RPM', default=500)
+EXTRACTION_RATE_LIMIT_TPM = env.int('EXTRACTION_RATE_LIMIT_TPM', default=200_000)
+# Tokens de saída reservados por chamada (a diferença para o uso real é acertada após a resposta)
+EXTRACTION_OUTPUT_TOKENS_ESTIMATE = env.int('EXTRACTION_OUTPUT_TOKENS_ESTIMATE', default=400)
+
+# Batch API da OpenAI para perfis com delivery_mode=BATCH (tasks.batch). O Schedule roda a cada
+# EXTRACTION_BATCH_POLL_MINUTES; um lote sai com MIN_ITEMS itens ou quando o mais antigo espera MAX_WAIT.
+EXTRACTION_BATCH_POLL_MINUTES = env.int('EXTRACTION_BATCH_POLL_MINUTES', default=5)
+EXTRACTION_BATCH_MIN_ITEMS = env.int('EXTRACTION_BATCH_MIN_ITEMS', default=100)
+EXTRACTION_BATCH_MAX_WAIT_SECONDS = env.int('EXTRACTION_BATCH_MAX_WAIT_SECONDS', default=30 * 60)
+EXTRACTION_BATCH_MAX_ITEMS = env.int('EXTRACTION_BATCH_MAX_ITEMS', default=10_000)
+EXTRACTION_BATCH_COMPLETION_WINDOW = env('EXTRACTION_BATCH_COMPLETION_WINDOW', default='24h')
+
+# Pré-processamento do corpo antes da IA (extraction.preprocess): remove citações, assinaturas e
+# avisos legais e corta no orçamento do perfil (ExtractionProfile.max_input_tokens), mantendo início e fim.
+EXTRACTION_PREPROCESS_ENABLED = env.bool('EXTRACTION_PREPROCESS_ENABLED', default=True)
+# Fração do orçamento dada ao início do texto no corte (o resto fica com o fim)
+EXTRACTION_HEAD_RATIO = env.float('EXTRACTION_HEAD_RATIO', default=0.7)
+# Regexes extras de avisos legais (parágrafos removidos), separadas por vírgula
+EXTRACTION_DISCLAIMER_PATTERNS = env.list('EXTRACTION_DISCLAIMER_PATTERNS', default=[])
+
+# Pré-extrator determinístico (extraction.fastpath): número CNJ, prazo e campos
+# constantes saem por regex e a IA recebe só o schema dos campos restantes
+EXTRACTION_FASTPATH_ENABLED = env.bool('EXTRACTION_FASTPATH_ENABLED', default=True)
+
+# Cascata de modelos (extraction.cascade, ExtractionProfile.model_cascade): preços em USD por
+# 1M de tokens [entrada, saída], só para o custo estimado por nível em /api/v1/extraction/metrics/
+EXTRACTION_MODEL_PRICES = env.json('EXTRACTION_MODEL_PRICES', default={
+    'gpt-3.5-turbo': [0.5, 1.5],
+    'gpt-4o-mini': [0.15, 0.6],
+    'gpt-4o': [2.5, 10.0],
+})
+
+# Reparo local da saída da IA (extraction.repair) antes de um re-prompt: blocos de código,
+# vírgulas sobrando, "95%", datas dd/mm/aaaa e Literal com caixa errada
+EXTRACTION_REPAIR_ENABLED = env.bool('EXTRACTION_REPAIR_ENABLED', default=True)
+
+# Structured outputs estritos (extraction.strict_schema): o schema vai no response_format (json_schema)
+# em vez do prompt. Só para modelos com estes prefixos; os demais (e recusas da API) usam json_object.
+EXTRACTION_STRICT_OUTPUT_ENABLED = env.bool('EXTRACTION_STRICT_OUTPUT_ENABLED', default=True)
+EXTRACTION_STRICT_MODELS = env.list('EXTRACTION_STRICT_MODELS', default=[
+    'gpt-4o', 'gpt-4.1', 'gpt-5', 'o1', 'o3', 'o4-mini',
+])
+
+# Empacotamento (extraction.packing): no motor assíncrono, até EXTRACTION_PACK_SIZE emails curtos
+# (até EXTRACTION_PACK_MAX_EMAIL_TOKENS cada) do mesmo perfil vão numa só requisição. Benchmark: bench_packing
+EXTRACTION_PACK_ENABLED = env.bool('EXTRACTION_PACK_ENABLED', default=False)
+EXTRACTION_PACK_SIZE = env.int('EXTRACTION_PACK_SIZE', default=8)
+EXTRACTION_PACK_MAX_EMAIL_TOKENS = env.int('EXTRACTION_PACK_MAX_EMAIL_TOKENS', default=300)
+
+# Regras de automação compiladas por MailBox (emails.matching): cache no processo e no Redis
+# (EXTRACTION_REDIS_URL). Sem Redis, a cópia local expira neste intervalo.
+RULE_MATCHER_LOCAL_TTL_SECONDS = env.int('RULE_MATCHER_LOCAL_TTL_SECONDS', default=60)
+RULE_MATCHER_REDIS_TTL_SECONDS = env.int('RULE_MATCHER_REDIS_TTL_SECONDS', default=24 * 3600)
+
+# Simulação de regras sobre o histórico (emails.simulation): tamanho do bloco lido por vez e
+# tempo máximo da varredura; passado o limite, devolve o resultado parcial (truncated).
+SIMULATION_CHUNK_SIZE = env.int('SIMULATION_CHUNK_SIZE', default=5000)
+SIMULATION_MAX_SECONDS = env.float('SIMULATION_MAX_SECONDS', default=20.0)
\ No newline at end of file
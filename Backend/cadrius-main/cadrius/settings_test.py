@@ -0,0 +1,13 @@
+# Settings da suíte de testes: python manage.py test --settings=cadrius.settings_test
+# Não depende de .env, Postgres nem chave da OpenAI (os testes não chamam a API).
+import os
+
+os.environ.setdefault('OPENAI_API_KEY', 'sk-test')
+
+from .settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'test_db.sqlite3'},
+}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
@@ -18,6 +18,8 @@ from core.views import ( # Views de páginas/core
 )
 from accounts.views import RegisterUserView, GetUserProfileView, CustomTokenObtainPairView # Novas views de usuário
 
+from extraction.views import ExtractionMetricsView
+
 from emails.views import (
     MailBoxViewSet, 
     EmailMessageViewSet, 
@@ -64,6 +66,7 @@ urlpatterns = [
     path('api/v1/auth/register/', RegisterUserView.as_view(), name='user_register'), # Rota corrigida
     path('api/v1/auth/user/', GetUserProfileView.as_view(), name='user_profile'), # Rota corrigida
     path('api/v1/dashboard/stats/', DashboardStatsView.as_view(), name='dashboard_stats'),
+    path('api/v1/extraction/metrics/', ExtractionMetricsView.as_view(), name='extraction_metrics'),
 
     # --- Documentação ---
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
@@ -1,12 +1,17 @@
 from django.contrib import admin
-from .models import MailBox, EmailMessage, AutomationRule
+from .models import MailBox, MailBoxSyncState, EmailMessage, AutomationRule
 
 @admin.register(MailBox)
 class MailBoxAdmin(admin.ModelAdmin):
-    list_display = ('name', 'user', 'imap_host', 'username', 'last_fetch_at', 'is_active')
+    list_display = ('name', 'user', 'imap_host', 'username', 'last_fetch_at', 'poll_interval_seconds', 'arrival_rate_per_hour', 'is_active')
     list_filter = ('is_active', 'user')
     search_fields = ('name', 'username', 'imap_host')
 
+@admin.register(MailBoxSyncState)
+class MailBoxSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('mailbox', 'folder', 'uidvalidity', 'last_uid', 'highest_modseq', 'updated_at')
+    list_filter = ('mailbox',)
+
 @admin.register(EmailMessage)
 class EmailMessageAdmin(admin.ModelAdmin):
     list_display = ('id', 'subject', 'sender', 'mailbox', 'status', 'received_at')
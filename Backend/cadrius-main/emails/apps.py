@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EmailsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'emails'
+
+    def ready(self):
+        # registra os sinais que invalidam as regras compiladas (emails.matching)
+        from emails import matching  # noqa: F401
@@ -0,0 +1,214 @@
+"""
+Arquivo do RFC822 bruto, endereçado por conteúdo (SHA-256).
+
+Cada mensagem baixada no fetch completo é gravada uma única vez, comprimida
+(zstd se o pacote `zstandard` estiver instalado, senão gzip), no sistema de
+arquivos local ou em um bucket S3-compatível (`boto3`). O EmailMessage guarda
+só o hash (`raw_sha256`); reparse e reextração leem daqui, sem voltar ao IMAP.
+
+Layout das chaves: <prefixo>/ab/cd/<sha256>.eml.zst (ou .eml.gz)
+"""
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'zstd': '.eml.zst', 'gzip': '.eml.gz'}
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _compress(raw: bytes, compression: str) -> bytes:
+    if compression == 'zstd':
+        return _zstd().ZstdCompressor(level=10).compress(raw)
+    return gzip.compress(raw, compresslevel=6)
+
+
+def _decompressing_stream(fileobj, compression: str):
+    """Envolve um arquivo comprimido em um stream de leitura descomprimido."""
+    if compression == 'zstd':
+        zstandard = _zstd()
+        if zstandard is None:
+            raise ImproperlyConfigured("Mensagem arquivada em zstd, mas o pacote 'zstandard' não está instalado.")
+        return zstandard.ZstdDecompressor().stream_reader(fileobj)
+    return gzip.GzipFile(fileobj=fileobj, mode='rb')
+
+
+def content_key(sha256: str, compression: str) -> str:
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{EXTENSIONS[compression]}"
+
+
+class RawMessageStore:
+    """Interface comum: put/exists/open/read. `open` é um context manager com o stream descomprimido."""
+
+    def __init__(self, compression: str = None):
+        if compression is None:
+            compression = 'zstd' if _zstd() is not None else 'gzip'
+        if compression not in EXTENSIONS:
+            raise ImproperlyConfigured(f"RAW_ARCHIVE_COMPRESSION inválido: {compression!r}")
+        if compression == 'zstd' and _zstd() is None:
+            raise ImproperlyConfigured("RAW_ARCHIVE_COMPRESSION='zstd' requer o pacote 'zstandard'.")
+        self.compression = compression
+
+    def put(self, raw: bytes, sha256: str = None) -> str:
+        sha256 = sha256 or hashlib.sha256(raw).hexdigest()
+        if not self.exists(sha256):
+            self._write(content_key(sha256, self.compression), _compress(raw, self.compression))
+        return sha256
+
+    def exists(self, sha256: str) -> bool:
+        return self._locate(sha256) is not None
+
+    @contextmanager
+    def open(self, sha256: str):
+        located = self._locate(sha256)
+        if located is None:
+            raise FileNotFoundError(f"Mensagem {sha256} não está no arquivo.")
+        key, compression = located
+        fileobj = self._open_key(key)
+        try:
+            with _decompressing_stream(fileobj, compression) as stream:
+                yield stream
+        finally:
+            fileobj.close()
+
+    def read(self, sha256: str) -> bytes:
+        with self.open(sha256) as stream:
+            return stream.read()
+
+    def _locate(self, sha256: str):
+        # o formato atual primeiro; aceita mensagens gravadas antes de uma troca de compressão
+        for compression in (self.compression, *(c for c in EXTENSIONS if c != self.compression)):
+            key = content_key(sha256, compression)
+            if self._key_exists(key):
+                return key, compression
+        return None
+
+    # --- implementados pelos backends ---
+    def _write(self, key: str, data: bytes):
+        raise NotImplementedError
+
+    def _key_exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def _open_key(self, key: str):
+        raise NotImplementedError
+
+
+class FilesystemRawStore(RawMessageStore):
+
+    def __init__(self, root, compression: str = None):
+        super().__init__(compression)
+        self.root = str(root)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def _write(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # escrita atômica: dois workers gravando o mesmo hash não corrompem o arquivo
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _key_exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def _open_key(self, key: str):
+        return open(self._path(key), 'rb')
+
+
+class S3RawStore(RawMessageStore):
+
+    def __init__(self, bucket: str, prefix: str = '', endpoint_url: str = None, compression: str = None, client=None):
+        super().__init__(compression)
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise ImproperlyConfigured("RAW_ARCHIVE_BACKEND='s3' requer o pacote 'boto3'.")
+            client = boto3.client('s3', endpoint_url=endpoint_url or None)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _write(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data)
+
+    def _key_exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except Exception as e:
+            status = getattr(e, 'response', {}).get('ResponseMetadata', {}).get('HTTPStatusCode')
+            if status == 404:
+                return False
+            raise
+
+    def _open_key(self, key: str):
+        # StreamingBody do botocore: gzip/zstd leem sequencialmente, sem seek
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))['Body']
+
+
+@lru_cache(maxsize=None)
+def get_raw_store():
+    """Store configurado em RAW_ARCHIVE_BACKEND ('' desliga o arquivo)."""
+    backend = (settings.RAW_ARCHIVE_BACKEND or '').lower()
+    compression = settings.RAW_ARCHIVE_COMPRESSION or None
+    if not backend:
+        return None
+    if backend == 'filesystem':
+        return FilesystemRawStore(settings.RAW_ARCHIVE_ROOT, compression)
+    if backend == 's3':
+        return S3RawStore(
+            settings.RAW_ARCHIVE_BUCKET,
+            prefix=settings.RAW_ARCHIVE_PREFIX,
+            endpoint_url=settings.RAW_ARCHIVE_ENDPOINT_URL,
+            compression=compression,
+        )
+    raise ImproperlyConfigured(f"RAW_ARCHIVE_BACKEND desconhecido: {backend!r}")
+
+
+def iter_raw_messages(queryset, store=None, chunk_size: int = 500):
+    """
+    Leitor em streaming para replay: gera (email, raw_bytes) para cada
+    EmailMessage arquivado do queryset, sem carregar o lote inteiro em memória.
+    Emails sem arquivo (ou com arquivo ausente) são pulados com aviso.
+    """
+    store = store or get_raw_store()
+    if store is None:
+        raise ImproperlyConfigured("RAW_ARCHIVE_BACKEND não configurado.")
+
+    for email in queryset.exclude(raw_sha256__isnull=True).exclude(raw_sha256='').iterator(chunk_size=chunk_size):
+        try:
+            with store.open(email.raw_sha256) as stream:
+                raw = stream.read()
+        except FileNotFoundError:
+            logger.warning("EmailMessage %s: RFC822 %s ausente no arquivo.", email.pk, email.raw_sha256)
+            continue
+        yield email, raw
+
@@ -0,0 +1,310 @@
+"""
+Condições ricas das AutomationRule (campo `conditions`).
+
+Uma condição é um objeto JSON. Folhas:
+- {"subject_contains": "intimação"}, {"sender_contains": "@tjsp.jus.br"},
+  {"body_contains": "prazo fatal"}: substring sem diferença de caixa;
+- {"subject_regex": "^\\[urgente\\]"}, {"sender_regex": ...}, {"body_regex": ...}:
+  `re.search` sem diferença de caixa. Padrões com quantificadores aninhados
+  (ex: "(a+)+", risco de backtracking catastrófico) ou maiores que
+  REGEX_MAX_PATTERN_LENGTH são recusados, e a busca olha só os primeiros
+  REGEX_MAX_TEXT_CHARS caracteres do campo;
+- {"header": "List-Id", "equals": "avisos.tjsp.jus.br"}: cabeçalho igual
+  (sem diferença de caixa e espaços nas pontas);
+- {"received_after": "2025-01-01"}, {"received_before": "2025-07-01T18:00"}:
+  janela de datas (após = a partir de, antes = estritamente antes; sem fuso = fuso do projeto);
+- {"received_hours": [8, 18]}: hora local de recebimento em [início, fim).
+
+Nas folhas de texto e de cabeçalho, uma lista de valores vale como "qualquer um".
+Grupos: {"all": [...]}, {"any": [...]}, {"not": {...}}. Um objeto com várias
+chaves equivale a "all" delas; `{}` não restringe nada.
+
+A DSL é compilada uma vez numa árvore de predicados (regex pré-compiladas) e
+avaliada sobre um EmailView, que guarda as versões minúsculas dos campos só
+quando são pedidas. Dentro de cada grupo os filhos mais baratos rodam primeiro
+e a avaliação para no primeiro resultado decisivo, então as regex do corpo só
+rodam quando o resto da regra já passou.
+"""
+import re
+from datetime import datetime, time as dt_time
+from functools import cached_property
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+try:
+    from re import _parser as _sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse as _sre_parse
+
+REGEX_MAX_PATTERN_LENGTH = 300
+REGEX_MAX_TEXT_CHARS = 50_000
+
+
+class ConditionError(ValueError):
+    """Condição mal formada (chave desconhecida, regex inválida, data ilegível...)."""
+
+
+class EmailView:
+    """Visão normalizada de um email compartilhada por todas as condições de uma avaliação."""
+
+    def __init__(self, subject='', sender='', body='', headers=None, received_at=None):
+        self.raw_subject = subject or ''
+        self.raw_sender = sender or ''
+        self.raw_body = body or ''
+        self.raw_headers = headers or {}
+        self.received_at = received_at
+
+    @classmethod
+    def of(cls, email) -> 'EmailView':
+        return cls(email.subject, email.sender, email.body_text, email.headers, email.received_at)
+
+    @cached_property
+    def subject(self):
+        return self.raw_subject.lower()
+
+    @cached_property
+    def sender(self):
+        return self.raw_sender.lower()
+
+    @cached_property
+    def body(self):
+        return self.raw_body.lower()
+
+    @cached_property
+    def headers(self):
+        return {str(name).lower(): str(value).strip().lower() for name, value in self.raw_headers.items()}
+
+    @cached_property
+    def local_received_at(self):
+        if self.received_at is None:
+            return None
+        if timezone.is_naive(self.received_at):
+            return self.received_at
+        return timezone.localtime(self.received_at)
+
+
+# Custo relativo de cada folha: define a ordem de avaliação dentro dos grupos
+_TEXT_COST = {'subject': 1, 'sender': 1, 'body': 20}
+_REGEX_FACTOR = 3
+
+
+class Predicate:
+    cost = 1
+
+    def __call__(self, view: EmailView) -> bool:
+        raise NotImplementedError
+
+
+class Contains(Predicate):
+
+    def __init__(self, field, values):
+        self.field = field
+        self.values = [v.lower() for v in values]
+        self.cost = _TEXT_COST[field] * len(self.values)
+
+    def __call__(self, view):
+        text = getattr(view, self.field)
+        return any(value in text for value in self.values)
+
+
+def _subpatterns(value):
+    if isinstance(value, _sre_parse.SubPattern):
+        yield value
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            yield from _subpatterns(item)
+
+
+def _has_nested_quantifier(parsed, in_unbounded_repeat=False) -> bool:
+    """Repetição de tamanho variável dentro de uma repetição sem limite, como "(a+)+" ou "(\\w+\\s?)*"."""
+    for op, av in parsed:
+        if op in (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT):
+            low, high, body = av
+            if in_unbounded_repeat and high > 1 and low != high:
+                return True
+            if _has_nested_quantifier(body, in_unbounded_repeat or high == _sre_parse.MAXREPEAT):
+                return True
+        elif any(_has_nested_quantifier(sub, in_unbounded_repeat) for sub in _subpatterns(av)):
+            return True
+    return False
+
+
+def _compile_regex(field, pattern):
+    if len(pattern) > REGEX_MAX_PATTERN_LENGTH:
+        raise ConditionError(f"Regex longa demais em {field}_regex (máximo {REGEX_MAX_PATTERN_LENGTH} caracteres).")
+    try:
+        compiled = re.compile(pattern, re.IGNORECASE)
+        parsed = _sre_parse.parse(pattern, re.IGNORECASE)
+    except re.error as e:
+        raise ConditionError(f"Regex inválida em {field}_regex: {pattern!r} ({e}).") from None
+    if _has_nested_quantifier(parsed):
+        raise ConditionError(f"Regex recusada em {field}_regex: {pattern!r} tem quantificadores aninhados "
+                             "(risco de backtracking catastrófico).")
+    return compiled
+
+
+class Regex(Predicate):
+
+    def __init__(self, field, patterns):
+        self.field = field
+        self.patterns = [_compile_regex(field, pattern) for pattern in patterns]
+        self.cost = _TEXT_COST[field] * _REGEX_FACTOR * len(self.patterns)
+
+    def __call__(self, view):
+        text = getattr(view, 'raw_' + self.field)[:REGEX_MAX_TEXT_CHARS]
+        return any(pattern.search(text) for pattern in self.patterns)
+
+
+class HeaderEquals(Predicate):
+
+    def __init__(self, name, values):
+        self.name = name.strip().lower()
+        self.values = {v.strip().lower() for v in values}
+
+    def __call__(self, view):
+        return view.headers.get(self.name) in self.values
+
+
+class ReceivedWindow(Predicate):
+
+    def __init__(self, after=None, before=None):
+        self.after, self.before = after, before
+
+    def __call__(self, view):
+        received = view.received_at
+        if received is None:
+            return False
+        if timezone.is_naive(received):
+            received = timezone.make_aware(received, timezone.get_current_timezone())
+        if self.after is not None and received < self.after:
+            return False
+        if self.before is not None and received >= self.before:
+            return False
+        return True
+
+
+class ReceivedHours(Predicate):
+
+    def __init__(self, start, end):
+        self.start, self.end = start, end
+
+    def __call__(self, view):
+        local = view.local_received_at
+        if local is None:
+            return False
+        if self.start <= self.end:
+            return self.start <= local.hour < self.end
+        # janela que cruza a meia-noite, ex: [22, 6]
+        return local.hour >= self.start or local.hour < self.end
+
+
+class All(Predicate):
+
+    def __init__(self, children):
+        self.children = sorted(children, key=lambda c: c.cost)
+        self.cost = sum(c.cost for c in self.children)
+
+    def __call__(self, view):
+        return all(child(view) for child in self.children)
+
+
+class Any(Predicate):
+
+    def __init__(self, children):
+        self.children = sorted(children, key=lambda c: c.cost)
+        self.cost = sum(c.cost for c in self.children)
+
+    def __call__(self, view):
+        return any(child(view) for child in self.children)
+
+
+class Not(Predicate):
+
+    def __init__(self, child):
+        self.child = child
+        self.cost = child.cost
+
+    def __call__(self, view):
+        return not self.child(view)
+
+
+def _values(key, value) -> list:
+    values = value if isinstance(value, list) else [value]
+    if not values or not all(isinstance(v, str) and v.strip() for v in values):
+        raise ConditionError(f"'{key}' espera um texto não vazio ou uma lista de textos.")
+    return values
+
+
+def _moment(key, value) -> datetime:
+    if not isinstance(value, str):
+        raise ConditionError(f"'{key}' espera uma data ISO (aaaa-mm-dd ou aaaa-mm-ddThh:mm).")
+    try:
+        parsed = parse_datetime(value)
+        day = parse_date(value) if parsed is None else None
+    except ValueError:
+        parsed = day = None
+    if parsed is None:
+        if day is None:
+            raise ConditionError(f"'{key}': data ilegível {value!r}.")
+        parsed = datetime.combine(day, dt_time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.get_current_timezone())
+    return parsed
+
+
+def _hours(value) -> tuple:
+    if (not isinstance(value, list) or len(value) != 2
+            or not all(isinstance(h, int) and not isinstance(h, bool) and 0 <= h <= 24 for h in value)):
+        raise ConditionError("'received_hours' espera [hora_inicial, hora_final] entre 0 e 24.")
+    return tuple(value)
+
+
+def _group(key, value) -> list:
+    if not isinstance(value, list) or not value:
+        raise ConditionError(f"'{key}' espera uma lista não vazia de condições.")
+    return [_compile(child) for child in value]
+
+
+def _compile(node) -> Predicate:
+    if not isinstance(node, dict) or not node:
+        raise ConditionError("Cada condição deve ser um objeto JSON não vazio.")
+
+    parts = []
+    keys = set(node)
+    if 'header' in keys or 'equals' in keys:
+        if not isinstance(node.get('header'), str) or not node['header'].strip() or 'equals' not in node:
+            raise ConditionError("Condição de cabeçalho espera {'header': <nome>, 'equals': <valor ou lista>}.")
+        parts.append(HeaderEquals(node['header'], _values('equals', node['equals'])))
+        keys -= {'header', 'equals'}
+    if 'received_after' in keys or 'received_before' in keys:
+        after = _moment('received_after', node['received_after']) if 'received_after' in node else None
+        before = _moment('received_before', node['received_before']) if 'received_before' in node else None
+        parts.append(ReceivedWindow(after, before))
+        keys -= {'received_after', 'received_before'}
+
+    for key in sorted(keys):
+        value = node[key]
+        field, _, kind = key.rpartition('_')
+        if field in _TEXT_COST and kind == 'contains':
+            parts.append(Contains(field, _values(key, value)))
+        elif field in _TEXT_COST and kind == 'regex':
+            parts.append(Regex(field, _values(key, value)))
+        elif key == 'received_hours':
+            parts.append(ReceivedHours(*_hours(value)))
+        elif key == 'all':
+            parts.append(All(_group(key, value)))
+        elif key == 'any':
+            parts.append(Any(_group(key, value)))
+        elif key == 'not':
+            parts.append(Not(_compile(value)))
+        else:
+            raise ConditionError(f"Condição desconhecida: '{key}'.")
+    return parts[0] if len(parts) == 1 else All(parts)
+
+
+def compile_conditions(conditions) -> Predicate | None:
+    """Árvore de predicados da DSL, ou None quando a regra não tem condições extras."""
+    if not conditions:
+        return None
+    return _compile(conditions)
@@ -0,0 +1,280 @@
+"""
+Avaliação compilada das AutomationRule de uma MailBox.
+
+Em vez de buscar as regras no banco a cada email e testar `in` regra a regra,
+cada MailBox ganha um RuleMatcher: dois autômatos Aho-Corasick (assunto e
+remetente) com todos os `subject_contains`/`sender_contains` ativos. Uma
+passada pelo assunto e outra pelo remetente dizem quais padrões aparecem; a
+regra escolhida é a de menor prioridade (depois menor id) cujas condições
+foram todas atendidas — a mesma semântica do laço antigo. Regras com
+`conditions` (emails.conditions) só têm a árvore de predicados avaliada depois
+que os dois campos simples casaram, em ordem de precedência.
+
+Cache em dois níveis:
+- no processo, por MailBox;
+- no Redis (EXTRACTION_REDIS_URL), a lista de regras serializada e um número de
+  versão; o worker confere a versão (um GET) em vez de consultar o banco.
+Sem Redis, a entrada local expira em RULE_MATCHER_LOCAL_TTL_SECONDS.
+post_save/post_delete de AutomationRule invalidam as duas camadas.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from emails.conditions import ConditionError, EmailView, compile_conditions
+from emails.models import AutomationRule
+from extraction.redis_conn import RedisBreaker, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'cadrius:rules'
+
+
+class AhoCorasick:
+    """Autômato de múltiplos padrões: `search(text)` devolve os índices dos padrões presentes."""
+
+    def __init__(self, patterns: list):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [set()]
+        for index, pattern in enumerate(patterns):
+            self._add(pattern, index)
+        self._build()
+
+    def _add(self, pattern: str, index: int):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+            state = next_state
+        self._out[state].add(index)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                # filhos da raiz já começam com falha 0 (nunca entram aqui como `state`)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._out[child] |= self._out[self._fail[child]]
+
+    def search(self, text: str) -> set:
+        found, state = set(), 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+def contains_pattern(value) -> str | None:
+    # mesma regra do laço antigo: vazio/só espaços = sem condição; o padrão não é aparado
+    return value.lower() if value and value.strip() else None
+
+
+@dataclass(frozen=True)
+class RuleSpec:
+    id: int
+    priority: int
+    subject: str | None
+    sender: str | None
+    conditions: dict | None = None
+
+
+class RuleMatcher:
+
+    def __init__(self, specs: list):
+        self.specs = sorted(specs, key=lambda s: (s.priority, s.id))
+        self._subject_patterns, self._sender_patterns = {}, {}
+        self._by_subject = {}
+        self._unconditional_subject = []
+        for position, spec in enumerate(self.specs):
+            if spec.subject is None:
+                self._unconditional_subject.append(position)
+            else:
+                pattern_id = self._subject_patterns.setdefault(spec.subject, len(self._subject_patterns))
+                self._by_subject.setdefault(pattern_id, []).append(position)
+            if spec.sender is not None:
+                self._sender_patterns.setdefault(spec.sender, len(self._sender_patterns))
+        self._predicates = {}
+        for position, spec in enumerate(self.specs):
+            if not spec.conditions:
+                continue
+            try:
+                self._predicates[position] = compile_conditions(spec.conditions)
+            except ConditionError as e:
+                # condição inválida gravada sem passar pela validação: a regra nunca casa
+                logger.warning("AutomationRule %s com condições inválidas (%s); ignorada.", spec.id, e)
+                self._predicates[position] = _never
+        self._subject_automaton = AhoCorasick(list(self._subject_patterns))
+        self._sender_automaton = AhoCorasick(list(self._sender_patterns))
+
+    @classmethod
+    def from_rules(cls, rules) -> 'RuleMatcher':
+        return cls([
+            RuleSpec(rule.pk, rule.priority, contains_pattern(rule.subject_contains),
+                     contains_pattern(rule.sender_contains), getattr(rule, 'conditions', None) or None)
+            for rule in rules
+        ])
+
+    def match(self, subject: str, sender: str, email=None) -> int | None:
+        """
+        Id da regra de maior precedência que casa com o email, ou None.
+        `email` (EmailMessage ou EmailView) só é lido se alguma candidata tiver `conditions`.
+        """
+        if not self.specs:
+            return None
+        subject_hits = self._subject_automaton.search((subject or '').lower())
+        candidates = list(self._unconditional_subject)
+        for pattern_id in subject_hits:
+            candidates.extend(self._by_subject[pattern_id])
+        if not candidates:
+            return None
+
+        sender_hits = view = None
+        for position in sorted(candidates):
+            spec = self.specs[position]
+            if spec.sender is not None:
+                if sender_hits is None:
+                    sender_hits = self._sender_automaton.search((sender or '').lower())
+                if self._sender_patterns[spec.sender] not in sender_hits:
+                    continue
+            predicate = self._predicates.get(position)
+            if predicate is not None:
+                if view is None:
+                    view = _view(email, subject, sender)
+                if not predicate(view):
+                    continue
+            return spec.id
+        return None
+
+    def to_json(self) -> str:
+        return json.dumps([[s.id, s.priority, s.subject, s.sender, s.conditions] for s in self.specs])
+
+    @classmethod
+    def from_json(cls, payload) -> 'RuleMatcher':
+        return cls([RuleSpec(*row) for row in json.loads(payload)])
+
+
+def _never(view):
+    return False
+
+
+def _view(email, subject, sender) -> EmailView:
+    if isinstance(email, EmailView):
+        return email
+    if email is None:
+        return EmailView(subject, sender)
+    return EmailView.of(email)
+
+
+_local = {}
+_lock = threading.Lock()
+# depois de uma falha do Redis, o processo fica só no cache local por REDIS_RETRY_SECONDS
+_breaker = RedisBreaker()
+
+
+def _keys(mailbox_id):
+    return f'{KEY_PREFIX}:{mailbox_id}:version', f'{KEY_PREFIX}:{mailbox_id}:spec'
+
+
+def _load_from_db(mailbox_id) -> RuleMatcher:
+    rules = AutomationRule.objects.filter(mailbox_id=mailbox_id, is_active=True).only(
+        'id', 'priority', 'subject_contains', 'sender_contains', 'conditions')
+    return RuleMatcher.from_rules(rules)
+
+
+def _redis_matcher(client, mailbox_id):
+    version_key, spec_key = _keys(mailbox_id)
+    version = client.get(version_key)
+    version = int(version) if version is not None else 0
+    cached = _local.get(mailbox_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    payload = client.get(f'{spec_key}:{version}')
+    if payload is not None:
+        matcher = RuleMatcher.from_json(payload)
+    else:
+        matcher = _load_from_db(mailbox_id)
+        client.set(f'{spec_key}:{version}', matcher.to_json(), ex=settings.RULE_MATCHER_REDIS_TTL_SECONDS)
+    with _lock:
+        _local[mailbox_id] = (version, matcher)
+    return matcher
+
+
+def get_rule_matcher(mailbox_id) -> RuleMatcher:
+    now = time.monotonic()
+    client = get_redis_client()
+    if client is not None and _breaker.available():
+        try:
+            return _redis_matcher(client, mailbox_id)
+        except Exception as e:
+            logger.warning("Regras compiladas: Redis indisponível (%s); usando cache local.", e)
+            _breaker.trip()
+
+    cached = _local.get(mailbox_id)
+    if cached is not None and cached[0] == 'local' and cached[2] > now:
+        return cached[1]
+    matcher = _load_from_db(mailbox_id)
+    with _lock:
+        _local[mailbox_id] = ('local', matcher, now + settings.RULE_MATCHER_LOCAL_TTL_SECONDS)
+    return matcher
+
+
+def match_rule(email):
+    """
+    AutomationRule (com o perfil de extração) que casa com o email, ou None.
+    Só consulta o banco para buscar a regra escolhida.
+    """
+    for _ in range(2):
+        rule_id = get_rule_matcher(email.mailbox_id).match(email.subject, email.sender, email)
+        if rule_id is None:
+            return None
+        rule = AutomationRule.objects.select_related('extraction_profile').filter(
+            pk=rule_id, is_active=True).first()
+        if rule is not None:
+            return rule
+        # regra apagada/desativada sem o sinal ter chegado a este processo
+        invalidate(email.mailbox_id)
+    return None
+
+
+def invalidate(mailbox_id):
+    with _lock:
+        _local.pop(mailbox_id, None)
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.incr(_keys(mailbox_id)[0])
+    except Exception as e:
+        logger.warning("Regras compiladas: falha ao invalidar a MailBox %s no Redis (%s).", mailbox_id, e)
+
+
+@receiver(post_save, sender=AutomationRule, dispatch_uid='emails_rule_matcher_saved')
+@receiver(post_delete, sender=AutomationRule, dispatch_uid='emails_rule_matcher_deleted')
+def _invalidate_rule(sender, instance, **kwargs):
+    invalidate(instance.mailbox_id)
+    # de novo após o commit: um worker pode ter recompilado com as regras antigas no meio da transação
+    transaction.on_commit(lambda: invalidate(instance.mailbox_id))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0005_automationrule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailBoxSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('folder', models.CharField(default='INBOX', max_length=255)),
+                ('uidvalidity', models.BigIntegerField(blank=True, null=True, verbose_name='UIDVALIDITY')),
+                ('last_uid', models.BigIntegerField(blank=True, null=True, verbose_name='Maior UID ingerido')),
+                ('highest_modseq', models.BigIntegerField(blank=True, null=True, verbose_name='HIGHESTMODSEQ (CONDSTORE)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('mailbox', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_states', to='emails.mailbox')),
+            ],
+            options={
+                'verbose_name': 'Checkpoint de Sincronização IMAP',
+                'verbose_name_plural': 'Checkpoints de Sincronização IMAP',
+                'unique_together': {('mailbox', 'folder')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0006_mailboxsyncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailbox',
+            name='arrival_rate_per_hour',
+            field=models.FloatField(default=0.0, verbose_name='Taxa de Chegada (emails/hora, EWMA)'),
+        ),
+        migrations.AddField(
+            model_name='mailbox',
+            name='next_fetch_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Próxima Busca'),
+        ),
+        migrations.AddField(
+            model_name='mailbox',
+            name='poll_interval_override',
+            field=models.PositiveIntegerField(blank=True, help_text='Se preenchido, ignora a cadência adaptativa para esta caixa.', null=True, verbose_name='Intervalo de Polling Fixo (s)'),
+        ),
+        migrations.AddField(
+            model_name='mailbox',
+            name='poll_interval_seconds',
+            field=models.PositiveIntegerField(default=300, verbose_name='Intervalo de Polling Atual (s)'),
+        ),
+    ]
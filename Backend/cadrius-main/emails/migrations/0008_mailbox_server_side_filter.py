@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0007_mailbox_adaptive_polling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailbox',
+            name='server_side_filter',
+            field=models.BooleanField(default=False, help_text='Baixa apenas emails que casam com as regras ativas (SEARCH FROM/SUBJECT). Os demais nunca são baixados, nem depois de uma mudança nas regras.', verbose_name='Filtrar no Servidor IMAP'),
+        ),
+    ]
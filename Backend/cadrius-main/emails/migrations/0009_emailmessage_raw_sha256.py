@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0008_mailbox_server_side_filter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='raw_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='SHA-256 do RFC822 Arquivado'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0009_emailmessage_raw_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='input_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Tokens do Texto Pré-processado'),
+        ),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='preprocessed_text',
+            field=models.TextField(blank=True, null=True, verbose_name='Texto Pré-processado (Enviado à IA)'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0010_emailmessage_preprocessed_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='automationrule',
+            name='conditions',
+            field=models.JSONField(blank=True, default=dict, help_text='Condições extras em JSON, ex: {"any": [{"body_regex": "prazo de \\d+ dias"}, {"header": "List-Id", "equals": "avisos.tjsp.jus.br"}]}.'),
+        ),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='headers',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Cabeçalhos'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0011_rule_conditions_headers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='matched_rule',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='matched_emails', to='emails.automationrule', verbose_name='Regra de Automação Correspondente'),
+        ),
+        migrations.AlterField(
+            model_name='emailmessage',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pendente de Processamento'), ('PROCESSING', 'Em Processamento'), ('EXTRACTED', 'Dados Extraídos com Sucesso'), ('REVIEW', 'Requer Revisão Humana (IA Falhou)'), ('INTEGRATED', 'Integrado (Trello/Telegram OK)'), ('FAILED', 'Falha Crítica'), ('IGNORED', 'Ignorado (Nenhuma Regra Corresponde)')], default='PENDING', max_length=20),
+        ),
+    ]
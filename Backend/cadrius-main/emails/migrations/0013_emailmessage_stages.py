@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0012_emailmessage_matched_rule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='stages',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Etapas do Processamento'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 # julliodutra/cadrius/cadrius-d2664e7d9d3cdaaeb4729d29c9fafb13438707c0/emails/models.py
 
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils import timezone
@@ -14,6 +16,7 @@ class EmailStatus(models.TextChoices):
     REQUIRES_REVIEW = 'REVIEW', 'Requer Revisão Humana (IA Falhou)'
     INTEGRATED = 'INTEGRATED', 'Integrado (Trello/Telegram OK)'
     FAILED = 'FAILED', 'Falha Crítica'
+    IGNORED = 'IGNORED', 'Ignorado (Nenhuma Regra Corresponde)'
 
 
 class MailBox(models.Model):
@@ -63,6 +66,23 @@ class MailBox(models.Model):
     last_fetch_at = models.DateTimeField(null=True, blank=True, verbose_name="Última Busca")
     is_active = models.BooleanField(default=True)
 
+    # Cadência adaptativa de polling (tasks.cadence): calculada a partir do tráfego observado
+    arrival_rate_per_hour = models.FloatField(default=0.0, verbose_name="Taxa de Chegada (emails/hora, EWMA)")
+    poll_interval_seconds = models.PositiveIntegerField(default=300, verbose_name="Intervalo de Polling Atual (s)")
+    poll_interval_override = models.PositiveIntegerField(
+        null=True, blank=True,
+        verbose_name="Intervalo de Polling Fixo (s)",
+        help_text="Se preenchido, ignora a cadência adaptativa para esta caixa."
+    )
+    next_fetch_at = models.DateTimeField(null=True, blank=True, verbose_name="Próxima Busca")
+
+    server_side_filter = models.BooleanField(
+        default=False,
+        verbose_name="Filtrar no Servidor IMAP",
+        help_text="Baixa apenas emails que casam com as regras ativas (SEARCH FROM/SUBJECT). "
+                  "Os demais nunca são baixados, nem depois de uma mudança nas regras."
+    )
+
     class Meta:
         verbose_name = "Caixa de Email"
         verbose_name_plural = "Caixas de Email"
@@ -71,6 +91,36 @@ class MailBox(models.Model):
         return self.name
 
 
+class MailBoxSyncState(models.Model):
+    """
+    Checkpoint incremental do IMAP por MailBox/pasta.
+    Guarda o UIDVALIDITY da pasta, o maior UID já ingerido e o HIGHESTMODSEQ
+    (CONDSTORE), para que cada fetch peça ao servidor apenas o que é novo.
+    """
+    mailbox = models.ForeignKey(MailBox, on_delete=models.CASCADE, related_name='sync_states')
+    folder = models.CharField(max_length=255, default='INBOX')
+
+    uidvalidity = models.BigIntegerField(null=True, blank=True, verbose_name="UIDVALIDITY")
+    last_uid = models.BigIntegerField(null=True, blank=True, verbose_name="Maior UID ingerido")
+    highest_modseq = models.BigIntegerField(null=True, blank=True, verbose_name="HIGHESTMODSEQ (CONDSTORE)")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Checkpoint de Sincronização IMAP"
+        verbose_name_plural = "Checkpoints de Sincronização IMAP"
+        unique_together = ('mailbox', 'folder')
+
+    def __str__(self):
+        return f'{self.mailbox.name}/{self.folder} (UID {self.last_uid})'
+
+    def reset(self, uidvalidity):
+        """UIDVALIDITY mudou: os UIDs antigos não valem mais nada nesta pasta."""
+        self.uidvalidity = uidvalidity
+        self.last_uid = None
+        self.highest_modseq = None
+
+
 class EmailMessage(models.Model):
     """
     Armazena o email capturado e seu status de processamento.
@@ -84,6 +134,26 @@ class EmailMessage(models.Model):
     sender = models.EmailField()
     received_at = models.DateTimeField(verbose_name="Recebido em (Timestamp IMAP)")
     body_text = models.TextField(verbose_name="Corpo do Email (Texto Limpo)")
+
+    # RFC822 bruto no arquivo endereçado por conteúdo (emails.archive); vazio se não arquivado
+    raw_sha256 = models.CharField(
+        max_length=64, null=True, blank=True, db_index=True,
+        verbose_name="SHA-256 do RFC822 Arquivado"
+    )
+    # Regra escolhida na ingestão (emails.matching); o process_email não reavalia as regras.
+    # Sem constraint no banco: o matcher em cache pode apontar uma regra recém-apagada, e o
+    # worker então reavalia (o lote de ingestão não pode falhar por isso).
+    matched_rule = models.ForeignKey(
+        'AutomationRule',
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        db_constraint=False,
+        related_name='matched_emails',
+        verbose_name="Regra de Automação Correspondente"
+    )
+
+    # Cabeçalhos do RFC822 (nome em minúsculas -> valor decodificado), sem os de rastreio
+    headers = models.JSONField(default=dict, blank=True, verbose_name="Cabeçalhos")
     
     # Status e Logs
     status = models.CharField(
@@ -92,6 +162,16 @@ class EmailMessage(models.Model):
         default=EmailStatus.PENDING
     )
     
+    # Texto efetivamente enviado à IA (extraction.preprocess) e seu tamanho, para auditoria
+    preprocessed_text = models.TextField(
+        null=True, blank=True,
+        verbose_name="Texto Pré-processado (Enviado à IA)"
+    )
+    input_tokens = models.PositiveIntegerField(
+        null=True, blank=True,
+        verbose_name="Tokens do Texto Pré-processado"
+    )
+
     # Dados Extraídos (Preenchido por Juliano após o Wrapper de IA)
     # JSONField é ideal para armazenar a saída do ChatGPT validada pelo Pydantic.
     extracted_data = models.JSONField(
@@ -101,6 +181,8 @@ class EmailMessage(models.Model):
     
     # Controles de Processamento
     processing_attempts = models.IntegerField(default=0)
+    # Checkpoint de cada etapa do pipeline (tasks.stages): retries retomam da primeira incompleta
+    stages = models.JSONField(default=dict, blank=True, verbose_name="Etapas do Processamento")
     last_processed_at = models.DateTimeField(null=True, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
@@ -135,7 +217,7 @@ class AutomationRule(models.Model):
     """
     # Multi-Tenancy: A regra é do usuário
     user = models.ForeignKey(
-        'auth.User', # Usamos 'auth.User' para evitar importar get_user_model() se já não estiver
+        settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE, 
         related_name='automation_rules', 
         verbose_name="Proprietário"
@@ -166,6 +248,14 @@ class AutomationRule(models.Model):
         null=True, 
         help_text="Texto que o Remetente DEVE conter (deixe vazio para ignorar)."
     )
+    # Condições extras (emails.conditions): regex, corpo, cabeçalhos, datas e grupos all/any/not.
+    # Valem junto com os dois campos acima (E lógico).
+    conditions = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Condições extras em JSON, ex: {"any": [{"body_regex": "prazo de \\d+ dias"}, '
+                  '{"header": "List-Id", "equals": "avisos.tjsp.jus.br"}]}.'
+    )
     
     # AÇÃO: O que fazer se a condição for atendida (ENTÃO)
     # O perfil de extração define o Schema Pydantic e o Prompt
@@ -193,4 +283,11 @@ class AutomationRule(models.Model):
     def __str__(self):
         return f'{self.name} ({self.mailbox.name})'
 
+    def clean(self):
+        from emails.conditions import ConditionError, compile_conditions
+        try:
+            compile_conditions(self.conditions)
+        except ConditionError as e:
+            raise ValidationError({'conditions': str(e)})
+
 # Create your models here.
\ No newline at end of file
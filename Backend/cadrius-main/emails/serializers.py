@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from emails.conditions import ConditionError, compile_conditions
 from emails.models import MailBox, EmailMessage, EmailStatus, AutomationRule # NOVO: AutomationRule
 from integrations.models import IntegrationLog, IntegrationConfig # NOVO: IntegrationConfig
 from extraction.models import ExtractionProfile
@@ -17,8 +18,11 @@ class MailBoxSerializer(serializers.ModelSerializer):
     class Meta:
         model = MailBox
         fields = ['id', 'name', 'imap_host', 'imap_port', 'username', 'is_active', 'last_fetch_at', 
-                  'integration_config', 'extraction_profile', 'integration_config_name', 'extraction_profile_name', 'user']
-        read_only_fields = ['last_fetch_at', 'user', 'integration_config_name', 'extraction_profile_name']
+                  'integration_config', 'extraction_profile', 'integration_config_name', 'extraction_profile_name', 'user',
+                  'poll_interval_override', 'poll_interval_seconds', 'arrival_rate_per_hour', 'next_fetch_at',
+                  'server_side_filter']
+        read_only_fields = ['last_fetch_at', 'user', 'integration_config_name', 'extraction_profile_name',
+                            'poll_interval_seconds', 'arrival_rate_per_hour', 'next_fetch_at']
         extra_kwargs = {
             'password': {'write_only': True}
         }
@@ -47,9 +51,28 @@ class ExtractionProfileSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = ExtractionProfile
-        fields = ['id', 'name', 'system_prompt_template', 'pydantic_schema_name', 'user']
+        fields = ['id', 'name', 'system_prompt_template', 'pydantic_schema_name', 'cache_scope', 'delivery_mode',
+                  'model_cascade', 'min_confidence', 'user']
         read_only_fields = ['user']
 
+    def validate_model_cascade(self, value):
+        if not isinstance(value, list) or not all(isinstance(m, str) and m.strip() for m in value):
+            raise serializers.ValidationError("Informe uma lista de nomes de modelos.")
+        return [m.strip() for m in value]
+
+    def validate_min_confidence(self, value):
+        if value is not None and value > 100:
+            raise serializers.ValidationError("A confiança mínima vai de 0 a 100.")
+        return value
+
+def _validate_conditions(value):
+    try:
+        compile_conditions(value)
+    except ConditionError as e:
+        raise serializers.ValidationError(str(e))
+    return value or {}
+
+
 class AutomationRuleSerializer(serializers.ModelSerializer):
     """
     Serializer para o CRUD de AutomationRule (Regras de automação).
@@ -61,10 +84,41 @@ class AutomationRuleSerializer(serializers.ModelSerializer):
     class Meta:
         model = AutomationRule
         fields = ['id', 'name', 'mailbox', 'mailbox_name', 'priority', 'is_active', 
-                  'subject_contains', 'sender_contains', 'extraction_profile', 'extraction_profile_name', 
+                  'subject_contains', 'sender_contains', 'conditions', 'extraction_profile', 'extraction_profile_name', 
                   'action_config', 'user']
         read_only_fields = ['user', 'mailbox_name', 'extraction_profile_name']
 
+    def validate_conditions(self, value):
+        return _validate_conditions(value)
+
+class DraftRuleSerializer(serializers.Serializer):
+    """Regra ainda não salva (ou a edição de uma existente, pelo `id`) para a simulação."""
+    id = serializers.IntegerField(required=False)
+    priority = serializers.IntegerField(default=10)
+    subject_contains = serializers.CharField(max_length=255, required=False, allow_blank=True, allow_null=True)
+    sender_contains = serializers.CharField(max_length=255, required=False, allow_blank=True, allow_null=True)
+    conditions = serializers.JSONField(required=False, default=dict)
+
+    def validate_conditions(self, value):
+        return _validate_conditions(value)
+
+
+class RuleSimulationSerializer(serializers.Serializer):
+    """
+    Entrada de POST /api/v1/emails/simulate/ (emails.simulation).
+    Com `subject`/`sender`/`body` avalia só esse email; senão varre o histórico da caixa.
+    """
+    mailbox_id = serializers.IntegerField()
+    rule = DraftRuleSerializer(required=False)
+    subject = serializers.CharField(required=False, allow_blank=True)
+    sender = serializers.CharField(required=False, allow_blank=True)
+    body = serializers.CharField(required=False, allow_blank=True)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    limit = serializers.IntegerField(required=False, min_value=1)
+    samples = serializers.IntegerField(default=10, min_value=0, max_value=100)
+    stream = serializers.BooleanField(default=False)
+
 class IntegrationLogSerializer(serializers.ModelSerializer):
     """
     Retorna os logs de integração (Trello/Telegram).
@@ -99,7 +153,7 @@ class EmailMessageSerializer(serializers.ModelSerializer):
             # Note que 'body_text' pode ser grande, restrinja em list views se necessário.
             fields = [
                 'id', 'mailbox_name', 'subject', 'sender', 'received_at', 
-                'status', 'status_display', 'processing_attempts', 'last_processed_at',
+                'status', 'status_display', 'matched_rule', 'stages', 'processing_attempts', 'last_processed_at',
                 'body_text', 'extracted_data', 'integration_logs_ext' # <--- CAMPO ATUALIZADO
             ]
             read_only_fields = fields
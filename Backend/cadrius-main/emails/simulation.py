@@ -0,0 +1,219 @@
+"""
+Simulação de AutomationRule sobre o histórico de EmailMessage de uma MailBox.
+
+Dois modos:
+- rascunho (`draft`): o que uma regra nova (ou a edição de uma existente)
+  pegaria, quantas vezes ela venceria as regras atuais e quais regras a
+  encobririam (prioridade menor) ou perderiam emails para ela;
+- regras atuais (sem `draft`): quantos emails cada regra ativa venceria e
+  quantos ficariam sem regra.
+
+O histórico é lido em janelas de id (decrescentes, SIMULATION_CHUNK_SIZE ids
+cada): toda consulta é limitada por uma faixa da chave primária, e nunca um
+LIMIT sobre um LIKE que pode varrer a caixa inteira atrás de poucos acertos.
+Os campos simples (`subject_contains`/`sender_contains`) de poucas regras (o
+rascunho, em geral) viram um pré-filtro `icontains` no SQL, e só os candidatos
+passam pelo RuleMatcher completo
+(emails.matching). No SQLite o LIKE só ignora a caixa de letras ASCII. O
+corpo e os cabeçalhos só são lidos se alguma regra tiver `conditions`.
+
+A simulação para ao atingir `limit` emails avaliados ou SIMULATION_MAX_SECONDS
+e devolve o parcial com `truncated` (e `total` None: contar a caixa inteira
+custaria o que a parada evitou). `iter_simulation` também emite o progresso a
+cada janela, para a resposta em streaming.
+"""
+import sys
+import time
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Max, Min, Q
+
+from emails.conditions import EmailView
+from emails.matching import RuleMatcher, RuleSpec, contains_pattern, get_rule_matcher
+from emails.models import AutomationRule, EmailMessage
+
+DRAFT = 'draft'
+# a regra nova ainda não tem id: perde os empates de prioridade, como perderia depois de criada
+_DRAFT_ID = sys.maxsize
+PREFILTER_MAX_RULES = 8
+
+
+def draft_spec(rule: dict) -> RuleSpec:
+    return RuleSpec(
+        rule.get('id') or _DRAFT_ID,
+        rule.get('priority', 10),
+        contains_pattern(rule.get('subject_contains')),
+        contains_pattern(rule.get('sender_contains')),
+        rule.get('conditions') or None,
+    )
+
+
+def _simple_q(spec: RuleSpec):
+    """Parte da regra que o banco sabe avaliar; None quando ela não restringe nada."""
+    q = Q()
+    if spec.subject is not None:
+        q &= Q(subject__icontains=spec.subject)
+    if spec.sender is not None:
+        q &= Q(sender__icontains=spec.sender)
+    return q or None
+
+
+def _prefilter(specs: list):
+    """
+    OR dos campos simples das regras, ou None (sem pré-filtro). Com muitas regras o OR de
+    LIKEs custa no banco tanto quanto ler tudo e passar pelo Aho-Corasick, então só até
+    PREFILTER_MAX_RULES regras.
+    """
+    if not specs or len(specs) > PREFILTER_MAX_RULES:
+        return None
+    parts = [_simple_q(spec) for spec in specs]
+    if any(part is None for part in parts):
+        return None
+    return reduce(or_, parts)
+
+
+def _sample(row, winner) -> dict:
+    return {
+        'id': row['id'], 'subject': row['subject'], 'sender': row['sender'],
+        'received_at': row['received_at'].isoformat() if row['received_at'] else None,
+        'rule_id': winner,
+    }
+
+
+def _rule_names(ids) -> dict:
+    return dict(AutomationRule.objects.filter(pk__in=[i for i in ids if isinstance(i, int)])
+                .values_list('pk', 'name'))
+
+
+def _ranked(counter: Counter, names: dict) -> list:
+    return [
+        {'rule_id': rule_id, 'rule_name': DRAFT if rule_id == DRAFT else names.get(rule_id), 'count': count}
+        for rule_id, count in counter.most_common()
+    ]
+
+
+def iter_simulation(mailbox, draft: dict = None, since=None, until=None, limit: int = None,
+                    samples: int = 10, max_seconds: float = None):
+    """
+    Gera ('progress', dict) a cada janela e, por último, ('result', dict).
+    `draft` segue os campos do AutomationRuleSerializer (id opcional: simula a edição daquela regra).
+    """
+    started = time.monotonic()
+    max_seconds = settings.SIMULATION_MAX_SECONDS if max_seconds is None else max_seconds
+    window = max(1, settings.SIMULATION_CHUNK_SIZE)
+
+    current = get_rule_matcher(mailbox.id)
+    if draft is not None:
+        spec = draft_spec(draft)
+        combined = RuleMatcher([s for s in current.specs if s.id != spec.id] + [spec])
+        evaluated = RuleMatcher([spec])
+        prefilter = _prefilter([spec])
+    else:
+        spec = combined = None
+        evaluated = current
+        prefilter = _prefilter(current.specs)
+
+    history = EmailMessage.objects.filter(mailbox=mailbox)
+    if since is not None:
+        history = history.filter(received_at__gte=since)
+    if until is not None:
+        history = history.filter(received_at__lt=until)
+    candidates = history.filter(prefilter) if prefilter is not None else history
+
+    fields = ['id', 'subject', 'sender', 'received_at']
+    if any(s.conditions for s in (combined or current).specs):
+        fields += ['body_text', 'headers']
+
+    scanned = 0
+    matches, wins = 0, Counter()
+    shadowed_by, taken_from = Counter(), Counter()
+    hits = []
+    truncated = False
+
+    bounds = history.aggregate(low=Min('id'), high=Max('id'))
+    high = bounds['high'] + 1 if bounds['high'] is not None else None
+    while high is not None and high > bounds['low']:
+        low = high - window
+        rows = list(candidates.filter(id__gte=low, id__lt=high).order_by('-id').values(*fields))
+        high = low
+        left_in_window = False
+        if limit is not None and len(rows) > limit - scanned:
+            rows, left_in_window = rows[:limit - scanned], True
+
+        for row in rows:
+            view = EmailView(row['subject'], row['sender'], row.get('body_text'), row.get('headers'),
+                             row['received_at'])
+            matched = evaluated.match(row['subject'], row['sender'], view)
+            if matched is None:
+                continue
+            if spec is None:
+                wins[matched] += 1
+                winner = matched
+            else:
+                matches += 1
+                winner = combined.match(row['subject'], row['sender'], view)
+                if winner == spec.id:
+                    wins[DRAFT] += 1
+                    taken_from[current.match(row['subject'], row['sender'], view)] += 1
+                else:
+                    shadowed_by[winner] += 1
+            if len(hits) < samples:
+                hits.append(_sample(row, DRAFT if spec is not None and winner == spec.id else winner))
+
+        scanned += len(rows)
+        elapsed = time.monotonic() - started
+        yield 'progress', {'scanned': scanned, 'matches': matches if spec else sum(wins.values()),
+                           'elapsed_ms': round(elapsed * 1000)}
+        if (limit is not None and scanned >= limit) or elapsed >= max_seconds:
+            # parcial só se ainda sobrou email para avaliar (a consulta abaixo não passa pelo LIKE)
+            truncated = left_in_window or (high > bounds['low'] and history.filter(id__lt=high).exists())
+            break
+
+    names = _rule_names(list(wins) + list(shadowed_by) + list(taken_from) + [h['rule_id'] for h in hits])
+    for hit in hits:
+        hit['rule_name'] = DRAFT if hit['rule_id'] == DRAFT else names.get(hit['rule_id'])
+    result = {
+        'mailbox_id': mailbox.id,
+        'mode': 'draft' if spec is not None else 'rules',
+        'total': None if truncated else history.count(),
+        'prefiltered': prefilter is not None,
+        'scanned': scanned,
+        'truncated': truncated,
+        'samples': hits,
+    }
+    if spec is not None:
+        result.update({
+            'matches': matches,
+            'wins': wins[DRAFT],
+            'shadowed_by': _ranked(shadowed_by, names),
+            'taken_from': _ranked(taken_from, names),
+        })
+    else:
+        matched = sum(wins.values())
+        result.update({
+            'matches': matched,
+            'rules': _ranked(wins, names),
+            'unmatched': None if truncated else result['total'] - matched,
+        })
+    result['elapsed_ms'] = round((time.monotonic() - started) * 1000)
+    yield 'result', result
+
+
+def simulate_email(mailbox, view: EmailView, draft: dict = None):
+    """Regra que venceria para um único email (id, DRAFT ou None), com o rascunho entre as regras atuais."""
+    current = get_rule_matcher(mailbox.id)
+    if draft is None:
+        return current.match(view.raw_subject, view.raw_sender, view)
+    spec = draft_spec(draft)
+    winner = RuleMatcher([s for s in current.specs if s.id != spec.id] + [spec]).match(
+        view.raw_subject, view.raw_sender, view)
+    return DRAFT if winner == spec.id else winner
+
+
+def run_simulation(mailbox, **options) -> dict:
+    for kind, payload in iter_simulation(mailbox, **options):
+        if kind == 'result':
+            return payload
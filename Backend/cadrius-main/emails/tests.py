@@ -1,3 +1,272 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import json
+import os
+import random
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from emails.archive import FilesystemRawStore, iter_raw_messages
+from emails.conditions import (
+    REGEX_MAX_PATTERN_LENGTH, REGEX_MAX_TEXT_CHARS, ConditionError, EmailView, compile_conditions,
+)
+from emails.matching import AhoCorasick, RuleMatcher, match_rule
+from emails.models import MailBox, EmailMessage, AutomationRule
+
+User = get_user_model()
+
+RAW = (
+    b"Message-ID: <arquivo-1@tjsp.jus.br>\r\n"
+    b"Subject: Intimacao\r\n"
+    b"From: intimacao@tjsp.jus.br\r\n"
+    b"\r\n"
+    b"Prazo de 15 dias.\r\n"
+)
+
+
+class RawArchiveTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = FilesystemRawStore(self.tmp.name, compression='gzip')
+
+    def test_content_addressed_and_compressed(self):
+        sha = self.store.put(RAW)
+        self.assertEqual(sha, hashlib.sha256(RAW).hexdigest())
+        # mesmo conteúdo não é regravado
+        self.assertEqual(self.store.put(RAW), sha)
+
+        path = os.path.join(self.tmp.name, sha[:2], sha[2:4], f"{sha}.eml.gz")
+        with open(path, 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), RAW)
+        self.assertEqual(self.store.read(sha), RAW)
+
+    def test_missing_hash_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            self.store.read('0' * 64)
+
+    def test_streaming_reader_skips_unarchived_emails(self):
+        user = User.objects.create_user(username='arquivo', password='x')
+        mailbox = MailBox.objects.create(user=user, name="Arquivo", imap_host="imap.local",
+                                         username="caixa@example.com", password="secret")
+        fields = dict(mailbox=mailbox, subject="Intimação", sender="intimacao@tjsp.jus.br",
+                      received_at=timezone.now(), body_text="")
+        archived = EmailMessage.objects.create(message_id="<a@x>", raw_sha256=self.store.put(RAW), **fields)
+        EmailMessage.objects.create(message_id="<b@x>", **fields)
+        EmailMessage.objects.create(message_id="<c@x>", raw_sha256="f" * 64, **fields)
+
+        replayed = list(iter_raw_messages(EmailMessage.objects.order_by('id'), store=self.store))
+
+        self.assertEqual([(email.pk, raw) for email, raw in replayed], [(archived.pk, RAW)])
+
+
+def _rule(pk, priority=10, subject="", sender=""):
+    return SimpleNamespace(pk=pk, priority=priority, subject_contains=subject, sender_contains=sender)
+
+
+class RuleMatcherTests(SimpleTestCase):
+
+    def test_automaton_finds_overlapping_patterns(self):
+        automaton = AhoCorasick(["he", "she", "his", "hers"])
+        self.assertEqual(automaton.search("ushers"), {0, 1, 3})
+        self.assertEqual(automaton.search("xyz"), set())
+
+    def test_priority_then_id_and_both_conditions(self):
+        matcher = RuleMatcher.from_rules([
+            _rule(1, priority=20, subject="intimação"),
+            _rule(2, priority=5, subject="Intimação", sender="tjrj"),
+            _rule(3, priority=5, subject="intima"),
+            _rule(4, priority=30, subject="   "),  # só espaços = sem condição, casa com tudo
+        ])
+        self.assertEqual(matcher.match("INTIMAÇÃO eletrônica", "intimacao@tjrj.jus.br"), 2)
+        self.assertEqual(matcher.match("Intimação eletrônica", "intimacao@tjsp.jus.br"), 3)
+        self.assertEqual(matcher.match("Boletim", None), 4)
+        self.assertIsNone(RuleMatcher.from_rules([_rule(1, subject="x")]).match("abc", "d"))
+
+    def test_same_result_as_linear_scan(self):
+        from tasks.management.commands.bench_rule_matching import legacy_match
+
+        rng = random.Random(7)
+        words = ["prazo", "intimação", "tjsp", "despacho", "pauta", "a", "ta"]
+        rules = sorted(
+            (_rule(pk, rng.randint(1, 5), rng.choice(words + [""]), rng.choice(words + ["", ""]))
+             for pk in range(1, 60)),
+            key=lambda r: (r.priority, r.pk),
+        )
+        matcher = RuleMatcher.from_json(RuleMatcher.from_rules(rules).to_json())
+        for _ in range(300):
+            subject = " ".join(rng.choice(words) for _ in range(3))
+            sender = rng.choice(words) + "@example.com"
+            self.assertEqual(matcher.match(subject, sender), legacy_match(rules, subject, sender))
+
+
+@mock.patch('emails.matching.get_redis_client', return_value=None)
+class RuleMatchingCacheTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='regras', password='x')
+        self.mailbox = MailBox.objects.create(user=user, name="Regras", imap_host="imap.local",
+                                              username="regras@example.com", password="secret")
+        self.rule = AutomationRule.objects.create(user=user, mailbox=self.mailbox, name="Intimações",
+                                                  subject_contains="intimação")
+        self.email = EmailMessage(mailbox=self.mailbox, subject="Intimação eletrônica", sender="tjsp")
+
+    def test_cached_matcher_skips_rule_query_and_signals_invalidate(self, _):
+        self.assertEqual(match_rule(self.email), self.rule)
+        with self.assertNumQueries(1):  # só a regra escolhida
+            self.assertEqual(match_rule(self.email), self.rule)
+
+        self.rule.subject_contains = "citação"
+        self.rule.save()
+        self.assertIsNone(match_rule(self.email))
+
+        self.rule.delete()
+        self.email.subject = "Citação"
+        self.assertIsNone(match_rule(self.email))
+
+
+class RuleConditionTests(SimpleTestCase):
+
+    def setUp(self):
+        self.view = EmailView(
+            subject="[URGENTE] Intimação eletrônica", sender="Sistema <intimacao@tjsp.jus.br>",
+            body="Fica intimado para manifestação no prazo de 15 dias.",
+            headers={"List-Id": " Avisos <avisos.tjsp.jus.br> "},
+            received_at=timezone.make_aware(timezone.datetime(2025, 11, 17, 10, 30)),
+        )
+
+    def assertMatches(self, conditions, expected=True):
+        self.assertIs(compile_conditions(conditions)(self.view), expected, conditions)
+
+    def test_leaves(self):
+        self.assertMatches({"body_contains": ["citação", "PRAZO DE"]})
+        self.assertMatches({"subject_regex": r"^\[urgente\]"})
+        self.assertMatches({"body_regex": r"prazo de \d+ dias"})
+        self.assertMatches({"sender_regex": r"@tj(rj|mg)\."}, False)
+        self.assertMatches({"header": "list-id", "equals": "avisos <AVISOS.tjsp.jus.br>"})
+        self.assertMatches({"header": "X-Mailer", "equals": "Outlook"}, False)
+        self.assertMatches({"received_after": "2025-11-17", "received_before": "2025-11-17T10:30"}, False)
+        self.assertMatches({"received_after": "2025-11-01", "received_before": "2025-12-01"})
+        self.assertMatches({"received_hours": [8, 18]})
+        self.assertMatches({"received_hours": [22, 6]}, False)
+        self.assertIsNone(compile_conditions({}))
+
+    def test_groups_and_implicit_all(self):
+        self.assertMatches({"any": [{"subject_contains": "citação"}, {"not": {"body_contains": "sentença"}}]})
+        self.assertMatches({"subject_contains": "intimação", "body_contains": "sentença"}, False)
+        self.assertMatches({"all": [{"sender_contains": "tjsp"}, {"not": {"subject_regex": "urgente"}}]}, False)
+
+    def test_cheap_conditions_short_circuit_body_regex(self):
+        predicate = compile_conditions({"all": [{"body_regex": "prazo"}, {"subject_contains": "sentença"}]})
+        view = EmailView(subject="Intimação", body="prazo")
+        with mock.patch.object(EmailView, 'raw_body', create=True, new_callable=mock.PropertyMock) as body:
+            self.assertFalse(predicate(view))
+        body.assert_not_called()
+
+    def test_invalid_conditions_are_rejected(self):
+        for conditions in ({"body_regex": "("}, {"subject_startswith": "x"}, {"any": []},
+                           {"header": "List-Id"}, {"received_after": "2025-13-01"}, {"received_hours": [8]}):
+            with self.assertRaises(ConditionError, msg=conditions):
+                compile_conditions(conditions)
+
+    def test_regex_with_backtracking_risk_is_rejected_and_body_search_is_capped(self):
+        for pattern in (r"(a+)+$", r"(\w+\s?)*fim", r"(?:x|y+)*", "a" * (REGEX_MAX_PATTERN_LENGTH + 1)):
+            with self.assertRaises(ConditionError, msg=pattern):
+                compile_conditions({"body_regex": pattern})
+        self.assertMatches({"body_regex": r"(\d{3}-?)+"}, False)
+
+        late = EmailView(body="x" * REGEX_MAX_TEXT_CHARS + " prazo")
+        self.assertFalse(compile_conditions({"body_regex": "prazo"})(late))
+
+    def test_matcher_applies_conditions_after_simple_fields(self):
+        rules = [
+            SimpleNamespace(pk=1, priority=1, subject_contains="intimação", sender_contains="",
+                            conditions={"body_regex": "sentença"}),
+            SimpleNamespace(pk=2, priority=2, subject_contains="", sender_contains="tjsp",
+                            conditions={"header": "List-Id", "equals": "avisos <avisos.tjsp.jus.br>"}),
+        ]
+        matcher = RuleMatcher.from_json(RuleMatcher.from_rules(rules).to_json())
+        self.assertEqual(matcher.match(self.view.raw_subject, self.view.raw_sender, self.view), 2)
+        self.assertIsNone(matcher.match(self.view.raw_subject, self.view.raw_sender))
+
+
+@mock.patch('emails.matching.get_redis_client', return_value=None)
+class RuleSimulationApiTests(APITestCase):
+
+    url = '/api/v1/emails/simulate/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='simula', password='x')
+        self.client.force_authenticate(self.user)
+        self.mailbox = MailBox.objects.create(user=self.user, name="Simulação", imap_host="imap.local",
+                                              username="simula@example.com", password="secret")
+        self.urgent = AutomationRule.objects.create(user=self.user, mailbox=self.mailbox, name="Urgentes",
+                                                    priority=1, subject_contains="urgente")
+        self.notices = AutomationRule.objects.create(user=self.user, mailbox=self.mailbox, name="Intimações",
+                                                     priority=20, subject_contains="intimação")
+        for n, subject in enumerate(["URGENTE - Intimação", "Intimação eletrônica", "Intimação eletrônica",
+                                     "Newsletter", "Urgente: boleto"]):
+            EmailMessage.objects.create(mailbox=self.mailbox, message_id=f"<sim-{n}@x>", subject=subject,
+                                        sender="intimacao@tjsp.jus.br", received_at=timezone.now(),
+                                        body_text="Prazo de 15 dias." if n == 2 else "")
+
+    def test_draft_rule_reports_wins_shadowing_and_takeovers(self, _):
+        draft = {"priority": 10, "subject_contains": "intimação", "conditions": {"body_contains": "prazo"}}
+        response = self.client.post(self.url, {"mailbox_id": self.mailbox.id, "rule": draft}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['total'], response.data['matches'], response.data['wins']), (5, 1, 1))
+        self.assertEqual(response.data['taken_from'], [
+            {'rule_id': self.notices.id, 'rule_name': "Intimações", 'count': 1}])
+        self.assertEqual(response.data['samples'][0]['rule_name'], 'draft')
+
+        response = self.client.post(self.url, {"mailbox_id": self.mailbox.id,
+                                               "rule": {"priority": 10, "subject_contains": "intimação"}}, format='json')
+        self.assertEqual(response.data['shadowed_by'], [
+            {'rule_id': self.urgent.id, 'rule_name': "Urgentes", 'count': 1}])
+        self.assertEqual(response.data['wins'], 2)
+
+    @override_settings(SIMULATION_CHUNK_SIZE=2)
+    def test_current_rules_stream_progress_per_chunk(self, _):
+        response = self.client.post(self.url, {"mailbox_id": self.mailbox.id, "stream": True}, format='json')
+
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        # janelas de 2 ids sobre os 5 emails: 3 consultas limitadas pela chave
+        self.assertEqual([next(iter(line)) for line in lines], ['progress', 'progress', 'progress', 'result'])
+        result = lines[-1]['result']
+        self.assertEqual(result['scanned'], 4)  # "Newsletter" fica de fora já no SQL
+        self.assertEqual({r['rule_name']: r['count'] for r in result['rules']}, {"Urgentes": 2, "Intimações": 2})
+        self.assertEqual(result['unmatched'], 1)
+
+    def test_time_budget_returns_partial_result(self, _):
+        with override_settings(SIMULATION_CHUNK_SIZE=2, SIMULATION_MAX_SECONDS=0):
+            response = self.client.post(self.url, {"mailbox_id": self.mailbox.id}, format='json')
+        self.assertTrue(response.data['truncated'])
+        self.assertEqual(response.data['scanned'], 1)  # 1ª janela: os 2 últimos ids, sem a "Newsletter"
+        self.assertIsNone(response.data['unmatched'])
+        self.assertIsNone(response.data['total'])
+
+    def test_limit_reaching_the_last_email_is_not_truncated(self, _):
+        response = self.client.post(self.url, {"mailbox_id": self.mailbox.id, "limit": 4}, format='json')
+        self.assertEqual((response.data['scanned'], response.data['truncated']), (4, False))
+        self.assertEqual(response.data['unmatched'], 1)
+
+        response = self.client.post(self.url, {"mailbox_id": self.mailbox.id, "limit": 3}, format='json')
+        self.assertEqual((response.data['scanned'], response.data['truncated']), (3, True))
+
+    def test_single_email_and_foreign_mailbox(self, _):
+        response = self.client.post(self.url, {"mailbox_id": self.mailbox.id, "subject": "Intimação nova",
+                                               "body": "..."}, format='json')
+        self.assertEqual(response.data['matched_rule']['name'], "Intimações")
+
+        other = User.objects.create_user(username='outro', password='x')
+        self.client.force_authenticate(other)
+        response = self.client.post(self.url, {"mailbox_id": self.mailbox.id}, format='json')
+        self.assertEqual(response.status_code, 404)
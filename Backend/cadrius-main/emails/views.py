@@ -1,17 +1,27 @@
+import json
+
 from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
 from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_q.models import Schedule
 from django_q.tasks import async_task
 
+from .conditions import EmailView
 from .models import MailBox, EmailMessage, AutomationRule
+from .simulation import DRAFT, iter_simulation, run_simulation, simulate_email
 from integrations.models import IntegrationConfig
 from extraction.models import ExtractionProfile
 from .serializers import (
     MailBoxSerializer, EmailMessageSerializer,
-    IntegrationConfigSerializer, ExtractionProfileSerializer, AutomationRuleSerializer
+    IntegrationConfigSerializer, ExtractionProfileSerializer, AutomationRuleSerializer,
+    RuleSimulationSerializer
 )
 
 class MailBoxViewSet(viewsets.ModelViewSet):
@@ -31,6 +41,14 @@ class MailBoxViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         mailbox = serializer.save(user=self.request.user)
+        if settings.IMAP_IDLE_ENABLED:
+            # O daemon imap_idle descobre a nova caixa sozinho; sem polling.
+            return
+        if settings.IMAP_FETCH_ORCHESTRATOR:
+            # A caixa entra no próximo tick do orquestrador (last_fetch_at vazio = vencida).
+            from tasks.orchestrator import ensure_orchestrator_schedule
+            ensure_orchestrator_schedule()
+            return
         Schedule.objects.create(
             func='tasks.tasks.fetch_emails',
             args=f'{mailbox.id}',
@@ -74,15 +92,62 @@ class EmailMessageViewSet(mixins.RetrieveModelMixin, mixins.ListModelMixin, view
     def reprocess(self, request, pk=None):
         """
         Marca um email para ser re-processado (enfileira novamente a tarefa).
+        O worker retoma da primeira etapa incompleta (tasks.stages); com
+        {"restart": true} descarta os checkpoints e refaz regra e extração.
         """
         email = self.get_object()
+        if request.data.get('restart'):
+            email.stages = {}
+            email.matched_rule = None
         email.re_enqueue_for_processing()
-        async_task('tasks.process_email', email.id)
+        async_task('tasks.tasks.process_email', email.id)
         return Response({
             "detail": "Email enfileirado para reprocessamento.",
-            "new_status": email.status_display
+            "new_status": email.get_status_display(),
+            "stages": email.stages,
         }, status=status.HTTP_202_ACCEPTED)
 
+    @action(detail=False, methods=['post'], url_path='simulate')
+    def simulate(self, request):
+        """
+        Simula as regras de automação de uma caixa sem processar nada (emails.simulation).
+        - com `subject`/`sender`/`body`: qual regra pegaria esse email;
+        - senão: varredura do histórico com a regra rascunho (`rule`) ou as regras atuais.
+        `stream=true` devolve NDJSON: uma linha de progresso por bloco e o resultado no fim.
+        """
+        serializer = RuleSimulationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        mailboxes = MailBox.objects.all() if request.user.is_superuser else MailBox.objects.filter(user=request.user)
+        mailbox = get_object_or_404(mailboxes, pk=data['mailbox_id'])
+        draft = data.get('rule')
+        if draft and draft.get('id') and not mailbox.rules.filter(pk=draft['id']).exists():
+            raise ValidationError({'rule': {'id': "Regra não pertence a esta caixa."}})
+
+        if any(key in data for key in ('subject', 'sender', 'body')):
+            view = EmailView(data.get('subject'), data.get('sender'), data.get('body'), received_at=timezone.now())
+            winner = simulate_email(mailbox, view, draft)
+            rule = None
+            if winner is not None and winner != DRAFT:
+                rule = AutomationRule.objects.select_related('extraction_profile').filter(pk=winner).first()
+            return Response({
+                'mailbox_id': mailbox.id,
+                'draft_wins': winner == DRAFT,
+                'matched_rule': rule and {
+                    'id': rule.id, 'name': rule.name,
+                    'extraction_profile': rule.extraction_profile and rule.extraction_profile.name,
+                },
+            })
+
+        options = {key: data[key] for key in ('since', 'until', 'limit') if key in data}
+        options.update(draft=draft, samples=data['samples'])
+        if data['stream']:
+            lines = (json.dumps({kind: payload}, ensure_ascii=False) + "\n"
+                     for kind, payload in iter_simulation(mailbox, **options))
+            return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        return Response(run_simulation(mailbox, **options))
+
 class IntegrationConfigViewSet(viewsets.ModelViewSet):
     """
     Endpoints: /api/v1/integration-configs/ - CRUD de credenciais de integração.
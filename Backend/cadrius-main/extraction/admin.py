@@ -1,8 +1,22 @@
 from django.contrib import admin
-from .models import ExtractionProfile
+from .models import ExtractionProfile, ExtractionBatchJob, ExtractionBatchItem
 
 @admin.register(ExtractionProfile)
 class ExtractionProfileAdmin(admin.ModelAdmin):
-    list_display = ('name', 'user', 'pydantic_schema_name')
+    list_display = ('name', 'user', 'pydantic_schema_name', 'cache_scope', 'delivery_mode')
     list_filter = ('user', 'pydantic_schema_name')
-    search_fields = ('name', 'system_prompt_template')
\ No newline at end of file
+    search_fields = ('name', 'system_prompt_template')
+
+
+@admin.register(ExtractionBatchJob)
+class ExtractionBatchJobAdmin(admin.ModelAdmin):
+    list_display = ('openai_batch_id', 'status', 'model', 'request_count', 'created_at', 'completed_at')
+    list_filter = ('status',)
+    search_fields = ('openai_batch_id',)
+
+
+@admin.register(ExtractionBatchItem)
+class ExtractionBatchItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'email', 'profile', 'job', 'attempt', 'created_at')
+    list_filter = ('profile',)
+    raw_id_fields = ('email', 'job', 'rule')
@@ -1,11 +1,19 @@
 import os
 import json
 import logging
+import random
+import time
+from django.conf import settings
 from openai import OpenAI
 from pydantic import BaseModel, ValidationError
 
 # Importa os schemas definidos por Juliano
 from .schemas import ExtractedData, ServiceOrderSchema, SupportRequestSchema 
+from . import cascade, metrics, strict_schema
+from .ratelimit import get_rate_limiter
+from .registry import compile_schema
+from .repair import validate_with_repair
+from .tokens import count_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -17,11 +25,66 @@ AI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo")
 MAX_RETRY_ATTEMPTS = 2
 
 
+def build_user_prompt(prompt_template: str, text: str) -> str:
+    return f"{prompt_template}\n\nTEXTO DE ENTRADA:\n---\n{text}"
+
+
+def validation_feedback(error: ValidationError) -> str:
+    """Trecho anexado ao prompt do usuário para a IA corrigir um JSON inválido."""
+    error_message = f"O JSON retornado falhou na validação. Erros:\n{error}"
+    return f"\nCorrija os erros de schema no seu JSON:\n{error_message}"
+
+
+def _throttle(model: str, compiled, user_prompt: str) -> int:
+    """Reserva no balde compartilhado do modelo (o mesmo do motor assíncrono); retorna a estimativa."""
+    limiter = get_rate_limiter(model)
+    estimated = (count_tokens(compiled.system_prompt, model) + count_tokens(user_prompt, model)
+                 + settings.EXTRACTION_OUTPUT_TOKENS_ESTIMATE)
+    while True:
+        wait_ms = limiter.acquire(1, estimated)
+        if not wait_ms:
+            return estimated
+        metrics.incr('ratelimit_wait')
+        time.sleep(wait_ms / 1000 * (1 + random.random() * 0.2))
+
+
+def _reconcile(model: str, response, estimated: int):
+    total = getattr(getattr(response, 'usage', None), 'total_tokens', None)
+    if total and total > estimated:
+        get_rate_limiter(model).debit(total - estimated)
+
+
+def _create_completion(model: str, compiled, user_prompt: str):
+    """
+    Chamada à API: json_schema estrito quando o modelo suporta (extraction.strict_schema),
+    senão json_object com o schema no prompt. Se a API recusar o json_schema, refaz com json_object.
+    """
+    system_prompt, response_format = strict_schema.request_options(compiled, model)
+    try:
+        return client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                # Adicionar exemplos few-shot aqui, se houver
+                {"role": "user", "content": user_prompt}
+            ],
+            # Força a saída como JSON (necessita do modelo gpt-3.5-turbo ou superior)
+            response_format=response_format
+        )
+    except Exception as e:
+        if response_format is strict_schema.JSON_OBJECT or not strict_schema.is_unsupported_format_error(e):
+            raise
+        strict_schema.mark_unsupported(model)
+        return _create_completion(model, compiled, user_prompt)
+
+
 def extract_fields_from_text(
     text: str, 
     schema: type[BaseModel], 
     prompt_template: str, 
-    examples: list = None
+    examples: list = None,
+    models: tuple = None,
+    min_confidence: int = None,
 ) -> dict | None:
     """
     Extrai dados estruturados de um texto usando a API do OpenAI e valida com Pydantic.
@@ -31,61 +94,73 @@ def extract_fields_from_text(
         schema: O modelo Pydantic (ex: ServiceOrderSchema) para validação.
         prompt_template: O template de instrução para a IA.
         examples: Exemplos few-shot para guiar a extração (opcional).
+        models: Cascata de modelos, do mais barato ao mais capaz (padrão: AI_MODEL).
+        min_confidence: confidence_score abaixo disso sobe para o próximo modelo.
 
     Returns:
         Um dicionário Python (JSON validado) ou None em caso de falha.
     """
-    schema_json = schema.model_json_schema()
-    
-    # 1. Montagem do Prompt de Sistema (Instruções e Estrutura JSON)
-    system_prompt = (
-        "Você é um extrator de dados altamente eficiente. Sua única tarefa é analisar o texto "
-        "fornecido e retornar os dados estritamente no formato JSON, conforme o schema abaixo. "
-        f"Se não for possível preencher um campo, use `null` ou um valor padrão razoável.\n\n"
-        f"SCHEMA JSON: {json.dumps(schema_json)}"
-    )
+    # 1. Prompt de Sistema (Instruções e Estrutura JSON), compilado uma vez por schema
+    compiled = compile_schema(schema)
 
     # 2. Montagem da Mensagem do Usuário
-    user_prompt = f"{prompt_template}\n\nTEXTO DE ENTRADA:\n---\n{text}"
-    
-    # Estratégia de Fallback com Retries
-    for attempt in range(MAX_RETRY_ATTEMPTS):
-        try:
-            logger.info(f"Tentativa {attempt + 1}: Chamando API OpenAI...")
-            
-            response = client.chat.completions.create(
-                model=AI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    # Adicionar exemplos few-shot aqui, se houver
-                    {"role": "user", "content": user_prompt}
-                ],
-                # Força a saída como JSON (necessita do modelo gpt-3.5-turbo ou superior)
-                response_format={"type": "json_object"} 
-            )
-
-            raw_json_output = response.choices[0].message.content
-            
-            # 3. VALIDAÇÃO PYDANTIC (CRÍTICO)
-            # Converte a string JSON para o modelo Pydantic, que valida tipos e restrições.
-            validated_model = schema.model_validate_json(raw_json_output)
-            
-            # Retorna o modelo validado como um dicionário Python
-            return validated_model.model_dump(mode='json')
-
-        except json.JSONDecodeError:
-            logger.error(f"Tentativa {attempt + 1}: Resposta da IA não é um JSON válido.")
-            user_prompt += "\nA saída anterior não foi um JSON válido. Por favor, corrija e retorne APENAS o JSON."
-            
-        except ValidationError as e:
-            logger.error(f"Tentativa {attempt + 1}: Falha na validação Pydantic. Erro: {e}")
-            # Se a validação falha, Juliano instrui a IA a tentar corrigir o JSON.
-            error_message = f"O JSON retornado falhou na validação. Erros:\n{e}"
-            user_prompt += f"\nCorrija os erros de schema no seu JSON:\n{error_message}"
-
-        except Exception as e:
-            logger.critical(f"Erro na comunicação com a API OpenAI: {e}")
-            break # Falha crítica, não tentar novamente.
+    base_prompt = build_user_prompt(prompt_template, text)
+
+    models = tuple(models or (AI_MODEL,))
+    low_confidence_result = None
+    for index, model in enumerate(models):
+        is_last = index == len(models) - 1
+        user_prompt = base_prompt
+        result, outcome = None, 'invalid'
+
+        # Estratégia de Fallback com Retries (só o último nível re-prompta o mesmo modelo)
+        for attempt in range(cascade.tier_attempts(index, len(models), MAX_RETRY_ATTEMPTS)):
+            try:
+                logger.info(f"Tentativa {attempt + 1}: Chamando API OpenAI ({model})...")
+
+                estimated = _throttle(model, compiled, user_prompt)
+                start = time.monotonic()
+                response = _create_completion(model, compiled, user_prompt)
+                cascade.record_call(model, (time.monotonic() - start) * 1000, getattr(response, 'usage', None))
+                _reconcile(model, response, estimated)
+
+                raw_json_output = response.choices[0].message.content
+
+                # 3. VALIDAÇÃO PYDANTIC (CRÍTICO)
+                # Valida a string JSON com o TypeAdapter do schema (tipos e restrições)
+                # e retorna o resultado como um dicionário Python
+                # (antes, o reparo local de extraction.repair tenta corrigir sem outra chamada)
+                result = validate_with_repair(compiled, raw_json_output)
+                break
+
+            except json.JSONDecodeError:
+                logger.error(f"Tentativa {attempt + 1}: Resposta da IA não é um JSON válido.")
+                user_prompt += "\nA saída anterior não foi um JSON válido. Por favor, corrija e retorne APENAS o JSON."
+
+            except ValidationError as e:
+                logger.error(f"Tentativa {attempt + 1}: Falha na validação Pydantic. Erro: {e}")
+                # Se a validação falha, Juliano instrui a IA a tentar corrigir o JSON.
+                user_prompt += validation_feedback(e)
+
+            except Exception as e:
+                logger.critical(f"Erro na comunicação com a API OpenAI: {e}")
+                outcome = 'error'
+                break # Falha crítica, não tentar novamente com este modelo.
+
+        if result is not None and not is_last and cascade.is_low_confidence(result, min_confidence):
+            outcome = 'low_confidence'
+            low_confidence_result = low_confidence_result or result
+        elif result is not None:
+            cascade.record_outcome(model, 'accepted')
+            return result
+
+        cascade.record_outcome(model, outcome)
+        if not is_last:
+            logger.warning(f"Cascata: {model} não resolveu ({outcome}); subindo para {models[index + 1]}.")
+
+    if low_confidence_result is not None:
+        logger.warning("Cascata: nenhum nível superior resolveu; usando o resultado de baixa confiança.")
+        return low_confidence_result
 
     # 4. FALLBACK FINAL: Marcação para Revisão Humana
     logger.error("Extração falhou após todas as tentativas. Retornando None.")
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ExtractionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'extraction'
+
+    def ready(self):
+        # Conecta os sinais que invalidam os perfis compilados
+        from extraction import registry  # noqa: F401
+        from extraction.tokens import check_tokenizer
+        check_tokenizer()
@@ -0,0 +1,250 @@
+"""
+Motor de extração assíncrono (AsyncOpenAI).
+
+O `extract_fields_from_text` síncrono prende o worker do Django-Q durante toda
+a chamada à IA. Aqui um lote de extrações roda em um event loop dentro do
+worker, com até EXTRACTION_CONCURRENCY chamadas simultâneas, e cada chamada
+passa antes pelo token bucket compartilhado do modelo chamado
+(extraction.ratelimit), para o cluster inteiro ficar abaixo dos limites da
+conta em vez de gerar rajadas de 429.
+A cascata de modelos do perfil (extraction.cascade) vale aqui também.
+
+O motor não toca no ORM: quem chama prepara as requisições (texto, perfil
+compilado, instruções) e persiste os resultados fora do event loop.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from pydantic import ValidationError
+
+from extraction import cascade, metrics, packing, strict_schema
+from extraction.ai_wrapper import AI_MODEL, MAX_RETRY_ATTEMPTS, build_user_prompt, validation_feedback
+from extraction.ratelimit import get_rate_limiter
+from extraction.registry import CompiledProfile
+from extraction.repair import validate_with_repair
+from extraction.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ExtractionRequest:
+    text: str
+    compiled: CompiledProfile
+    instructions: str
+
+
+class AsyncExtractionEngine:
+
+    def __init__(self, client, limiter, concurrency: int, model: str = AI_MODEL):
+        """`limiter` None: um balde compartilhado por modelo (get_rate_limiter); senão um só para tudo."""
+        self.client = client
+        self.limiter = limiter
+        self.model = model
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    def limiter_for(self, model: str):
+        return self.limiter if self.limiter is not None else get_rate_limiter(model)
+
+    def _estimate(self, model: str, compiled: CompiledProfile, user_prompt: str, outputs: int = 1) -> int:
+        return (compiled.system_prompt_tokens + count_tokens(user_prompt, model)
+                + settings.EXTRACTION_OUTPUT_TOKENS_ESTIMATE * outputs)
+
+    async def _throttle(self, limiter, tokens: int):
+        while True:
+            wait_ms = await asyncio.to_thread(limiter.acquire, 1, tokens)
+            if not wait_ms:
+                return
+            metrics.incr('ratelimit_wait')
+            # jitter para os workers não acordarem todos no mesmo milissegundo
+            await asyncio.sleep(wait_ms / 1000 * (1 + random.random() * 0.2))
+
+    async def _reconcile(self, limiter, response, estimated: int):
+        usage = getattr(response, 'usage', None)
+        total = getattr(usage, 'total_tokens', None)
+        if total and total > estimated:
+            await asyncio.to_thread(limiter.debit, total - estimated)
+
+    async def _create(self, model: str, compiled_schema, user_prompt: str, packed: bool = False):
+        """json_schema estrito quando o modelo suporta; se a API recusar, refaz com json_object."""
+        options = packing.request_options if packed else strict_schema.request_options
+        system_prompt, response_format = options(compiled_schema, model)
+        try:
+            return await self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                response_format=response_format,
+            )
+        except Exception as e:
+            if response_format is strict_schema.JSON_OBJECT or not strict_schema.is_unsupported_format_error(e):
+                raise
+            strict_schema.mark_unsupported(model)
+            return await self._create(model, compiled_schema, user_prompt, packed)
+
+    async def _call(self, model: str, compiled: CompiledProfile, user_prompt: str):
+        limiter = self.limiter_for(model)
+        estimated = self._estimate(model, compiled, user_prompt)
+        await self._throttle(limiter, estimated)
+        start = time.monotonic()
+        response = await self._create(model, compiled.compiled_schema, user_prompt)
+        metrics.incr('api_call')
+        cascade.record_call(model, (time.monotonic() - start) * 1000, getattr(response, 'usage', None))
+        await self._reconcile(limiter, response, estimated)
+        return response
+
+    async def _extract_tier(self, model: str, attempts: int, compiled: CompiledProfile, user_prompt: str):
+        """(resultado ou None, desfecho) de um nível da cascata."""
+        for attempt in range(attempts):
+            try:
+                response = await self._call(model, compiled, user_prompt)
+            except Exception as e:
+                logger.critical(f"Erro na comunicação com a API OpenAI: {e}")
+                return None, 'error'
+            try:
+                return validate_with_repair(compiled.compiled_schema, response.choices[0].message.content), 'accepted'
+            except ValidationError as e:
+                logger.error(f"Tentativa {attempt + 1}: Falha na validação Pydantic. Erro: {e}")
+                user_prompt += validation_feedback(e)
+        return None, 'invalid'
+
+    async def extract(self, request: ExtractionRequest) -> dict | None:
+        """Mesma estratégia de retries e cascata do extract_fields_from_text; None se a extração falhar."""
+        compiled = request.compiled
+        user_prompt = build_user_prompt(request.instructions, request.text)
+        models = compiled.models or (self.model,)
+        low_confidence_result = None
+
+        async with self.semaphore:
+            for index, model in enumerate(models):
+                is_last = index == len(models) - 1
+                attempts = cascade.tier_attempts(index, len(models), MAX_RETRY_ATTEMPTS)
+                result, outcome = await self._extract_tier(model, attempts, compiled, user_prompt)
+                if result is not None and not is_last and cascade.is_low_confidence(result, compiled.min_confidence):
+                    outcome = 'low_confidence'
+                    low_confidence_result = low_confidence_result or result
+                cascade.record_outcome(model, outcome)
+                if outcome == 'accepted':
+                    return result
+                if not is_last:
+                    logger.warning(f"Cascata: {model} não resolveu ({outcome}); subindo para {models[index + 1]}.")
+
+        if low_confidence_result is not None:
+            logger.warning("Cascata: nenhum nível superior resolveu; usando o resultado de baixa confiança.")
+            return low_confidence_result
+        logger.error("Extração falhou após todas as tentativas. Retornando None.")
+        return None
+
+    async def extract_packed(self, requests: list[ExtractionRequest]) -> list:
+        """
+        Uma chamada para vários emails curtos do mesmo perfil (extraction.packing),
+        no primeiro modelo da cascata. None nos itens que precisam de extração individual.
+        """
+        compiled = requests[0].compiled
+        models = compiled.models or (self.model,)
+        model = models[0]
+        ids = [f"e{i}" for i in range(1, len(requests) + 1)]
+        user_prompt = packing.build_packed_prompt(requests[0].instructions, [r.text for r in requests], ids)
+        limiter = self.limiter_for(model)
+        estimated = self._estimate(model, compiled, user_prompt, outputs=len(requests))
+
+        async with self.semaphore:
+            await self._throttle(limiter, estimated)
+            start = time.monotonic()
+            try:
+                response = await self._create(model, compiled.compiled_schema, user_prompt, packed=True)
+            except Exception as e:
+                logger.warning(f"Pacote de {len(requests)} emails falhou na API ({e}); extraindo um a um.")
+                return [None] * len(requests)
+            metrics.incr('api_call')
+            cascade.record_call(model, (time.monotonic() - start) * 1000, getattr(response, 'usage', None))
+            await self._reconcile(limiter, response, estimated)
+
+        metrics.incr('pack_requests')
+        metrics.incr('pack_emails', len(requests))
+        elements = packing.parse_packed(response.choices[0].message.content, ids)
+        results = []
+        for email_id in ids:
+            result = None
+            if email_id in elements:
+                try:
+                    result = validate_with_repair(compiled.compiled_schema, packing.element_json(elements[email_id]))
+                except ValidationError as e:
+                    logger.info(f"Item {email_id} do pacote inválido; extraindo sozinho. Erro: {e}")
+            if result is not None and len(models) > 1 and cascade.is_low_confidence(result, compiled.min_confidence):
+                result = None
+            if result is not None:
+                cascade.record_outcome(model, 'accepted')
+            results.append(result)
+        return results
+
+    async def _extract_pack(self, indexes: list, requests: list) -> dict:
+        try:
+            packed = await self.extract_packed([requests[i] for i in indexes])
+        except Exception as e:
+            logger.warning(f"Pacote de {len(indexes)} emails falhou ({e}); extraindo um a um.")
+            packed = [None] * len(indexes)
+        results = {i: r for i, r in zip(indexes, packed) if r is not None}
+        failed = [i for i in indexes if i not in results]
+        if failed:
+            metrics.incr('pack_fallback', len(failed))
+            fallback = await asyncio.gather(*(self.extract(requests[i]) for i in failed), return_exceptions=True)
+            results.update(zip(failed, fallback))
+        return results
+
+    async def extract_many(self, requests: list[ExtractionRequest], pack: bool = False) -> list:
+        """Resultados na ordem das requisições; exceções inesperadas voltam no lugar do resultado."""
+        if not pack:
+            return await asyncio.gather(*(self.extract(r) for r in requests), return_exceptions=True)
+
+        packs, singles = packing.plan_packs(requests, self.model)
+        outcomes = await asyncio.gather(
+            *(self._extract_pack(indexes, requests) for indexes in packs),
+            *(self.extract(requests[i]) for i in singles),
+            return_exceptions=True,
+        )
+        results = [None] * len(requests)
+        for indexes, outcome in zip(packs, outcomes):
+            for i in indexes:
+                results[i] = outcome if isinstance(outcome, Exception) else outcome.get(i)
+        for i, outcome in zip(singles, outcomes[len(packs):]):
+            results[i] = outcome
+        return results
+
+
+def _default_client():
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+
+
+async def _run(requests, client, limiter, concurrency, pack):
+    own_client = client is None
+    client = client or _default_client()
+    try:
+        engine = AsyncExtractionEngine(client, limiter, concurrency)
+        return await engine.extract_many(requests, pack=pack)
+    finally:
+        if own_client:
+            await client.close()
+
+
+def run_extractions(requests: list[ExtractionRequest], client=None, limiter=None, concurrency: int = None,
+                    pack: bool = None) -> list:
+    """
+    Ponto de entrada síncrono (tasks do Django-Q): roda o lote em um event loop
+    próprio. O cliente AsyncOpenAI é criado por lote, preso ao loop que o usa.
+    `pack` (padrão: EXTRACTION_PACK_ENABLED) junta emails curtos por requisição.
+    Sem `limiter`, cada chamada debita o balde do modelo que ela usa.
+    """
+    if not requests:
+        return []
+    concurrency = concurrency or settings.EXTRACTION_CONCURRENCY
+    pack = settings.EXTRACTION_PACK_ENABLED if pack is None else pack
+    return asyncio.run(_run(requests, client, limiter, concurrency, pack))
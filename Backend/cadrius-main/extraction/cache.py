@@ -0,0 +1,158 @@
+"""
+Cache de resultados da extração, endereçado por conteúdo.
+
+A chave é o SHA-256 de (texto normalizado, schema, prompt renderizado, modelo),
+prefixado pelo escopo: por padrão o tenant (dono da MailBox), ou 'shared'
+quando o ExtractionProfile opta por compartilhar resultados entre tenants.
+
+Dois níveis:
+- LRU local do processo (EXTRACTION_CACHE_LOCAL_MAX_ENTRIES, TTL curto);
+- Redis (EXTRACTION_CACHE_TTL_SECONDS), compartilhado por todos os workers;
+  depois de uma falha, pulado por REDIS_RETRY_SECONDS (extraction.redis_conn).
+
+Acertos/erros vão para extraction.metrics (cache_local_hit, cache_redis_hit,
+cache_miss, cache_store).
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+
+from extraction import metrics
+from extraction.redis_conn import RedisBreaker, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'cadrius:extraction:v1'
+SHARED_SCOPE = 'shared'
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """Normalização que não muda o significado: Unicode NFC e espaços colapsados."""
+    text = unicodedata.normalize('NFC', text or '')
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def tenant_scope(user_id) -> str:
+    return f'tenant:{user_id}'
+
+
+def cache_key(text: str, schema_name: str, prompt: str, model: str, scope: str) -> str:
+    payload = json.dumps(
+        [normalize_text(text), schema_name, prompt, model],
+        ensure_ascii=False, separators=(',', ':'),
+    )
+    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return f'{KEY_PREFIX}:{scope}:{digest}'
+
+
+class LocalLRU:
+    """LRU com TTL, thread-safe, limitado em número de entradas."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ExtractionCache:
+
+    def __init__(self, local: LocalLRU, redis_client=None, ttl_seconds: int = 0, max_value_bytes: int = 0):
+        self.local = local
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.max_value_bytes = max_value_bytes
+        self._breaker = RedisBreaker()
+
+    def get(self, key: str):
+        value = self.local.get(key)
+        if value is not None:
+            metrics.incr('cache_local_hit')
+            return value
+
+        if self.redis is not None and self._breaker.available():
+            try:
+                raw = self.redis.get(key)
+            except Exception as e:
+                logger.warning("Cache de extração: Redis indisponível (%s); seguindo sem ele.", e)
+                self._breaker.trip()
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value)
+                metrics.incr('cache_redis_hit')
+                return value
+
+        metrics.incr('cache_miss')
+        return None
+
+    def set(self, key: str, value: dict):
+        serialized = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        if self.max_value_bytes and len(serialized.encode('utf-8')) > self.max_value_bytes:
+            return
+        self.local.set(key, value)
+        if self.redis is not None and self._breaker.available():
+            try:
+                self.redis.setex(key, self.ttl_seconds, serialized)
+            except Exception as e:
+                logger.warning("Cache de extração: falha ao gravar no Redis (%s).", e)
+                self._breaker.trip()
+        metrics.incr('cache_store')
+
+
+@lru_cache(maxsize=None)
+def get_extraction_cache():
+    """Cache do processo, ou None se EXTRACTION_CACHE_ENABLED estiver desligado."""
+    if not settings.EXTRACTION_CACHE_ENABLED:
+        return None
+    return ExtractionCache(
+        LocalLRU(settings.EXTRACTION_CACHE_LOCAL_MAX_ENTRIES, settings.EXTRACTION_CACHE_LOCAL_TTL_SECONDS),
+        redis_client=get_redis_client(),
+        ttl_seconds=settings.EXTRACTION_CACHE_TTL_SECONDS,
+        max_value_bytes=settings.EXTRACTION_CACHE_MAX_VALUE_BYTES,
+    )
+
+
+def profile_scope(profile, user_id) -> str:
+    """Escopo do cache para o perfil: 'shared' só quando o perfil optou por isso."""
+    if profile.cache_scope == profile.CacheScope.SHARED:
+        return SHARED_SCOPE
+    return tenant_scope(user_id)
@@ -0,0 +1,83 @@
+"""
+Cascata de modelos por perfil (ExtractionProfile.model_cascade).
+
+Cada perfil pode listar modelos do mais barato ao mais capaz, ex:
+["gpt-4o-mini", "gpt-4o"]. A extração começa no primeiro e só sobe de nível
+quando:
+- a resposta não passa na validação Pydantic (os níveis intermediários têm
+  uma tentativa só; o re-prompt com os erros acumulados fica para o último);
+- o `confidence_score` fica abaixo de ExtractionProfile.min_confidence;
+- a chamada à API falha.
+
+Se o último nível também falhar, vale o melhor resultado válido de baixa
+confiança de um nível anterior, se houver.
+
+Por nível ficam nas métricas (extraction.metrics) as chamadas, a latência e os
+tokens de entrada/saída, além do desfecho (aceito, inválido, baixa confiança,
+erro). `tier_summary` transforma os contadores em taxa de sucesso, latência
+média e custo estimado (EXTRACTION_MODEL_PRICES).
+"""
+from django.conf import settings
+
+from extraction import metrics
+
+PREFIX = 'cascade'
+OUTCOMES = ('accepted', 'invalid', 'low_confidence', 'error')
+
+
+def tier_attempts(index: int, tiers: int, max_attempts: int) -> int:
+    """Tentativas de um nível: só o último re-prompta o mesmo modelo."""
+    return max_attempts if index == tiers - 1 else 1
+
+
+def is_low_confidence(data: dict, min_confidence: int | None) -> bool:
+    if min_confidence is None or not isinstance(data, dict):
+        return False
+    score = data.get('confidence_score')
+    return isinstance(score, (int, float)) and score < min_confidence
+
+
+def record_call(model: str, latency_ms: float, usage=None):
+    """Uma chamada à API em um nível da cascata."""
+    metrics.incr(f'{PREFIX}:{model}:calls')
+    metrics.incr(f'{PREFIX}:{model}:latency_ms', int(latency_ms))
+    for name in ('prompt_tokens', 'completion_tokens'):
+        value = getattr(usage, name, None)
+        if value:
+            metrics.incr(f'{PREFIX}:{model}:{name}', value)
+
+
+def record_outcome(model: str, outcome: str):
+    """Desfecho de um nível (uma vez por email que passou por ele)."""
+    metrics.incr(f'{PREFIX}:{model}:{outcome}')
+
+
+def tier_summary(counters: dict | None) -> dict:
+    """{modelo: taxa de sucesso, latência média, tokens e custo estimado} a partir dos contadores."""
+    tiers = {}
+    for key, value in (counters or {}).items():
+        parts = key.split(':')
+        if len(parts) != 3 or parts[0] != PREFIX:
+            continue
+        tiers.setdefault(parts[1], {})[parts[2]] = value
+
+    prices = settings.EXTRACTION_MODEL_PRICES
+    summary = {}
+    for model, values in sorted(tiers.items()):
+        runs = sum(values.get(outcome, 0) for outcome in OUTCOMES)
+        calls = values.get('calls', 0)
+        prompt_tokens, completion_tokens = values.get('prompt_tokens', 0), values.get('completion_tokens', 0)
+        entry = {
+            'runs': runs,
+            'calls': calls,
+            **{outcome: values.get(outcome, 0) for outcome in OUTCOMES},
+            'success_rate': round(values.get('accepted', 0) / runs, 4) if runs else None,
+            'avg_latency_ms': round(values.get('latency_ms', 0) / calls, 1) if calls else None,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+        }
+        if model in prices:
+            input_price, output_price = prices[model]
+            entry['cost_usd'] = round((prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000, 6)
+        summary[model] = entry
+    return summary
@@ -0,0 +1,159 @@
+"""
+Pré-extrator determinístico (regex) que roda antes da IA.
+
+Preenche só o que dá para afirmar com certeza a partir do texto, nos schemas
+com extrator em FAST_EXTRACTORS:
+- campos `Literal` de valor único (ex: document_type='MOVIMENTACAO_PROCESSUAL');
+- ProcessoJuridicoSchema:
+  - numero_processo: número CNJ (NNNNNNN-DD.AAAA.J.TR.OOOO) com dígito
+    verificador válido (ISO 7064 mod 97); só se houver um único número válido;
+  - prazo_fatal: data explícita (dd/mm/aaaa ou "dd de mês de aaaa") colada a
+    "prazo [de N dias] até", "vencimento em", "data limite:"...; só se todas as
+    menções (inclusive "até <data>" soltas) apontarem a mesma data;
+  - tipo_movimentacao: só quando vem rotulado ("Tipo de documento: Intimação").
+
+O resto vai para a IA com um schema parcial (só os campos que faltam) e o
+resultado é mesclado e validado com o schema completo. Se nada faltar, a IA
+nem é chamada.
+"""
+import re
+import typing
+from datetime import date
+from functools import lru_cache
+
+from pydantic import BaseModel, create_model
+
+CNJ_RE = re.compile(r"(?<!\d)(\d{7})-?(\d{2})\.?(\d{4})\.?(\d)\.?(\d{2})\.?(\d{4})(?!\d)")
+
+MONTHS = {
+    'janeiro': 1, 'fevereiro': 2, 'março': 3, 'marco': 3, 'abril': 4, 'maio': 5, 'junho': 6,
+    'julho': 7, 'agosto': 8, 'setembro': 9, 'outubro': 10, 'novembro': 11, 'dezembro': 12,
+}
+_NUMERIC_DATE = r"(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})"
+_WRITTEN_DATE = r"(\d{1,2})º?\s+de\s+(" + "|".join(MONTHS) + r")\s+de\s+(\d{4})"
+DATE_RE = re.compile(f"{_NUMERIC_DATE}|{_WRITTEN_DATE}", re.IGNORECASE)
+
+# a data precisa vir colada a uma expressão de prazo ("prazo até 03/11/2025", "prazo de 15 (quinze)
+# dias, até 03/11/2025", "vencimento em 3 de novembro de 2025"), separada só por conectivos
+_PRAZO_DAYS = r"(?:\s+de\s+\d{1,3}\s*(?:\([^)\n]{1,30}\)\s*)?dias(?:\s+(?:úteis|uteis|corridos))?\s*,?)?"
+_CONNECTIVES = r"\s*[:–-]?\s*(?:(?:é|em|até|para|o|dia|de)\s+){0,3}"
+DEADLINE_RE = re.compile(
+    rf"\b(?:prazo(?:\s+fatal|\s+final)?{_PRAZO_DAYS}|vencimento|vence|termo\s+final|data\s+limite){_CONNECTIVES}"
+    rf"(?:{_NUMERIC_DATE}|{_WRITTEN_DATE})",
+    re.IGNORECASE,
+)
+# "até <data>" sem expressão de prazo não define o prazo, mas conta como data concorrente
+UNTIL_RE = re.compile(rf"\baté\s+(?:o\s+dia\s+)?(?:{_NUMERIC_DATE}|{_WRITTEN_DATE})", re.IGNORECASE)
+
+MOVEMENT_LABEL_RE = re.compile(
+    r"^\s*(?:tipo\s+(?:de|do)\s+(?:documento|ato|movimenta[çc][ãa]o|comunica[çc][ãa]o)|movimenta[çc][ãa]o)\s*:\s*(.{3,80}?)\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def cnj_check_digits(sequential: str, year: str, segment: str, court: str, origin: str) -> str:
+    """Dígitos verificadores CNJ (Resolução 65/2008): 98 - (NNNNNNN AAAA J TR OOOO 00 mod 97)."""
+    return f"{98 - int(f'{sequential}{year}{segment}{court}{origin}00') % 97:02d}"
+
+
+def is_valid_cnj(number: str) -> bool:
+    match = CNJ_RE.fullmatch(number.strip())
+    if not match:
+        return False
+    sequential, digits, year, segment, court, origin = match.groups()
+    return cnj_check_digits(sequential, year, segment, court, origin) == digits
+
+
+def find_cnj_numbers(text: str) -> list:
+    """Números CNJ válidos no texto, formatados e sem repetição (na ordem em que aparecem)."""
+    found = []
+    for match in CNJ_RE.finditer(text):
+        sequential, digits, year, segment, court, origin = match.groups()
+        if cnj_check_digits(sequential, year, segment, court, origin) != digits:
+            continue
+        number = f"{sequential}-{digits}.{year}.{segment}.{court}.{origin}"
+        if number not in found:
+            found.append(number)
+    return found
+
+
+def _to_date(groups) -> date | None:
+    day, month, year, w_day, w_month, w_year = groups
+    try:
+        if day:
+            return date(int(year), int(month), int(day))
+        return date(int(w_year), MONTHS[w_month.lower()], int(w_day))
+    except (ValueError, KeyError):
+        return None
+
+
+def parse_br_date(value: str) -> date | None:
+    match = DATE_RE.search(value)
+    return _to_date(match.groups()) if match else None
+
+
+def _dates(pattern, text: str) -> set:
+    return {d for d in (_to_date(m.groups()) for m in pattern.finditer(text)) if d}
+
+
+def find_deadlines(text: str) -> set:
+    """Datas de prazo ancoradas no texto, mais as de "até <data>" soltas (vazio se não há âncora)."""
+    anchored = _dates(DEADLINE_RE, text)
+    if not anchored:
+        return set()
+    return anchored | _dates(UNTIL_RE, text)
+
+
+def _processo_juridico(text: str) -> dict:
+    fields = {}
+    numbers = find_cnj_numbers(text)
+    if len(numbers) == 1:
+        fields['numero_processo'] = numbers[0]
+
+    deadlines = find_deadlines(text)
+    if len(deadlines) == 1:
+        fields['prazo_fatal'] = deadlines.pop().isoformat()
+
+    labels = {m.group(1).strip().rstrip('.').capitalize() for m in MOVEMENT_LABEL_RE.finditer(text)}
+    if len(labels) == 1:
+        fields['tipo_movimentacao'] = labels.pop()
+    return fields
+
+
+FAST_EXTRACTORS = {
+    'ProcessoJuridicoSchema': _processo_juridico,
+}
+
+
+@lru_cache(maxsize=None)
+def _constant_fields(schema: type[BaseModel]) -> dict:
+    """Campos Literal com um único valor possível: não há o que a IA decidir."""
+    constants = {}
+    for name, field in schema.model_fields.items():
+        if typing.get_origin(field.annotation) is typing.Literal:
+            values = typing.get_args(field.annotation)
+            if len(values) == 1:
+                constants[name] = values[0]
+    return constants
+
+
+def pre_extract(schema: type[BaseModel], text: str) -> dict:
+    """Campos que podem ser preenchidos com certeza, sem IA (só schemas em FAST_EXTRACTORS)."""
+    extractor = FAST_EXTRACTORS.get(schema.__name__)
+    if extractor is None:
+        return {}
+    fields = {**_constant_fields(schema), **extractor(text or "")}
+    return {name: value for name, value in fields.items() if name in schema.model_fields}
+
+
+@lru_cache(maxsize=None)
+def partial_schema(schema: type[BaseModel], known: frozenset) -> type[BaseModel] | None:
+    """Schema só com os campos que faltam (None se não falta nenhum). Uma classe por combinação."""
+    missing = {
+        name: (field.annotation, field)
+        for name, field in schema.model_fields.items()
+        if name not in known
+    }
+    if not missing:
+        return None
+    return create_model(f"{schema.__name__}Parcial", __doc__=schema.__doc__, **missing)
@@ -0,0 +1,90 @@
+"""
+Contadores da camada de extração (ex: acertos/erros do cache de resultados).
+
+Cada processo mantém os próprios contadores e também soma em um hash no Redis,
+para que a API mostre o total de todos os workers. O `incr` só mexe na memória:
+as somas vão ao Redis em lote (um pipeline a cada FLUSH_INTERVAL_SECONDS) e,
+depois de uma falha, ficam acumuladas no processo por REDIS_RETRY_SECONDS.
+Assim o Redis fora do ar não custa um timeout por contador na extração.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from extraction.redis_conn import REDIS_RETRY_SECONDS, RedisBreaker, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY = 'cadrius:metrics:extraction'
+FLUSH_INTERVAL_SECONDS = 5
+
+_local = Counter()
+# somado desde o último envio ao Redis
+_pending = Counter()
+_lock = threading.Lock()
+_next_flush_at = 0.0
+# depois de uma falha do Redis, os contadores ficam só no processo por REDIS_RETRY_SECONDS
+_breaker = RedisBreaker()
+
+
+def incr(name: str, amount: int = 1):
+    with _lock:
+        _local[name] += amount
+        _pending[name] += amount
+        due = time.monotonic() >= _next_flush_at and _breaker.available()
+    if due:
+        flush()
+
+
+def flush():
+    """Envia ao Redis, num único pipeline, o que foi somado desde o último envio."""
+    global _next_flush_at
+    now = time.monotonic()
+    with _lock:
+        if not _pending or not _breaker.available():
+            return
+        batch = dict(_pending)
+        _pending.clear()
+        _next_flush_at = now + FLUSH_INTERVAL_SECONDS
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for name, amount in batch.items():
+            pipe.hincrby(REDIS_KEY, name, amount)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Métricas: Redis indisponível (%s); acumulando no processo.", e)
+        with _lock:
+            _pending.update(batch)
+        _breaker.trip()
+
+
+atexit.register(flush)
+
+
+def snapshot() -> dict:
+    """{'process': contadores deste processo, 'cluster': soma de todos os workers (Redis)}"""
+    with _lock:
+        process = dict(_local)
+    flush()
+    cluster = None
+    client = get_redis_client()
+    if client is not None and _breaker.available():
+        try:
+            cluster = {k.decode(): int(v) for k, v in client.hgetall(REDIS_KEY).items()}
+        except Exception as e:
+            logger.debug("Falha ao ler métricas do Redis: %s", e)
+    return {'process': process, 'cluster': cluster}
+
+
+def reset():
+    global _next_flush_at
+    with _lock:
+        _local.clear()
+        _pending.clear()
+        _next_flush_at = 0.0
+    _breaker.reset()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extraction', '0002_extractionprofile_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionprofile',
+            name='cache_scope',
+            field=models.CharField(choices=[('TENANT', 'Por usuário (padrão)'), ('SHARED', 'Compartilhado entre usuários')], default='TENANT', help_text='SHARED reaproveita extrações idênticas de outros usuários (use só para perfis sem dados sensíveis).', max_length=10, verbose_name='Escopo do Cache'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0009_emailmessage_raw_sha256'),
+        ('extraction', '0003_extractionprofile_cache_scope'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionBatchJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('openai_batch_id', models.CharField(max_length=100, unique=True)),
+                ('input_file_id', models.CharField(max_length=100)),
+                ('output_file_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('error_file_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('status', models.CharField(choices=[('validating', 'Validando'), ('in_progress', 'Em andamento'), ('finalizing', 'Finalizando'), ('completed', 'Concluído'), ('failed', 'Falhou'), ('expired', 'Expirado'), ('cancelling', 'Cancelando'), ('cancelled', 'Cancelado')], db_index=True, default='validating', max_length=20)),
+                ('model', models.CharField(max_length=100)),
+                ('request_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Lote da Batch API',
+                'verbose_name_plural': 'Lotes da Batch API',
+            },
+        ),
+        migrations.AddField(
+            model_name='extractionprofile',
+            name='delivery_mode',
+            field=models.CharField(choices=[('REALTIME', 'Tempo real'), ('BATCH', 'Batch API (até 24h, custo menor)')], default='REALTIME', help_text='BATCH agrupa as extrações em lotes da Batch API (resultado em até 24h).', max_length=10, verbose_name='Modo de Entrega'),
+        ),
+        migrations.CreateModel(
+            name='ExtractionBatchItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_prompt', models.TextField()),
+                ('attempt', models.PositiveSmallIntegerField(default=0)),
+                ('cache_key', models.CharField(blank=True, max_length=200, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('email', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batch_items', to='emails.emailmessage')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batch_items', to='extraction.extractionprofile')),
+                ('rule', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='emails.automationrule')),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='items', to='extraction.extractionbatchjob')),
+            ],
+            options={
+                'verbose_name': 'Item da Batch API',
+                'verbose_name_plural': 'Itens da Batch API',
+            },
+        ),
+    ]
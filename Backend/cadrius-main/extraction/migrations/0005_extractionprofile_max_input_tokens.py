@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extraction', '0004_batch_delivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionprofile',
+            name='max_input_tokens',
+            field=models.PositiveIntegerField(default=3000, help_text='Tamanho máximo do corpo enviado à IA, em tokens. Textos maiores mantêm o início e o fim.', verbose_name='Máximo de Tokens de Entrada'),
+        ),
+    ]
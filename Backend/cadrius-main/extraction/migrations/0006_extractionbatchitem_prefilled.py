@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extraction', '0005_extractionprofile_max_input_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionbatchitem',
+            name='prefilled',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extraction', '0006_extractionbatchitem_prefilled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionprofile',
+            name='min_confidence',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Resultados com confidence_score abaixo disso (0-100) sobem para o próximo modelo da cascata.', null=True, verbose_name='Confiança Mínima'),
+        ),
+        migrations.AddField(
+            model_name='extractionprofile',
+            name='model_cascade',
+            field=models.JSONField(blank=True, default=list, help_text='Modelos do mais barato ao mais capaz, ex: ["gpt-4o-mini", "gpt-4o"].', verbose_name='Cascata de Modelos'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:07
+
+from django.db import migrations, models
+
+
+FINAL_STATUSES = ['completed', 'failed', 'expired', 'cancelled']
+
+
+def mark_finished_jobs_applied(apps, schema_editor):
+    # lotes finalizados antes deste campo já tiveram os resultados aplicados
+    ExtractionBatchJob = apps.get_model('extraction', 'ExtractionBatchJob')
+    ExtractionBatchItem = apps.get_model('extraction', 'ExtractionBatchItem')
+    finished = ExtractionBatchJob.objects.filter(status__in=FINAL_STATUSES)
+    for job in finished.exclude(completed_at__isnull=True):
+        ExtractionBatchItem.objects.filter(job=job).update(applied_at=job.completed_at)
+        ExtractionBatchJob.objects.filter(pk=job.pk).update(applied_at=job.completed_at)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extraction', '0007_extractionprofile_model_cascade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionbatchitem',
+            name='applied_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='extractionbatchjob',
+            name='applied_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(mark_finished_jobs_applied, migrations.RunPython.noop),
+    ]
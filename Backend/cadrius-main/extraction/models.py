@@ -36,6 +36,55 @@ class ExtractionProfile(models.Model):
         help_text="Nome da classe do schema em extraction.schemas (Ex: ProcessoJuridicoSchema)."
     )
 
+    class CacheScope(models.TextChoices):
+        TENANT = 'TENANT', 'Por usuário (padrão)'
+        SHARED = 'SHARED', 'Compartilhado entre usuários'
+
+    # Resultados em cache são isolados por usuário, a menos que o perfil opte por compartilhar
+    cache_scope = models.CharField(
+        max_length=10,
+        choices=CacheScope.choices,
+        default=CacheScope.TENANT,
+        verbose_name="Escopo do Cache",
+        help_text="SHARED reaproveita extrações idênticas de outros usuários (use só para perfis sem dados sensíveis)."
+    )
+
+    # Orçamento de tokens do corpo do email (após o pré-processamento); o excesso é cortado no meio
+    max_input_tokens = models.PositiveIntegerField(
+        default=3000,
+        verbose_name="Máximo de Tokens de Entrada",
+        help_text="Tamanho máximo do corpo enviado à IA, em tokens. Textos maiores mantêm o início e o fim."
+    )
+
+    class DeliveryMode(models.TextChoices):
+        REALTIME = 'REALTIME', 'Tempo real'
+        BATCH = 'BATCH', 'Batch API (até 24h, custo menor)'
+
+    # Perfis sem urgência (backfills, suporte em massa) acumulam emails e vão pela Batch API da OpenAI
+    delivery_mode = models.CharField(
+        max_length=10,
+        choices=DeliveryMode.choices,
+        default=DeliveryMode.REALTIME,
+        verbose_name="Modo de Entrega",
+        help_text="BATCH agrupa as extrações em lotes da Batch API (resultado em até 24h)."
+    )
+
+    # Cascata de modelos (extraction.cascade): começa no primeiro e sobe de nível em falha de
+    # validação ou confiança baixa. Vazio = modelo padrão (OPENAI_MODEL).
+    model_cascade = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name="Cascata de Modelos",
+        help_text='Modelos do mais barato ao mais capaz, ex: ["gpt-4o-mini", "gpt-4o"].'
+    )
+
+    min_confidence = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Confiança Mínima",
+        help_text="Resultados com confidence_score abaixo disso (0-100) sobem para o próximo modelo da cascata."
+    )
+
     class Meta:
         verbose_name = "Perfil de Extração (Prompt)"
         verbose_name_plural = "Perfis de Extração (Prompts)"
@@ -43,4 +92,67 @@ class ExtractionProfile(models.Model):
     def __str__(self):
         return self.name
 
-# Create your models here.
\ No newline at end of file
+
+
+class ExtractionBatchJob(models.Model):
+    """
+    Um lote enviado à Batch API da OpenAI (arquivo JSONL de requisições).
+    O status espelha o do lote na OpenAI.
+    """
+    class Status(models.TextChoices):
+        VALIDATING = 'validating', 'Validando'
+        IN_PROGRESS = 'in_progress', 'Em andamento'
+        FINALIZING = 'finalizing', 'Finalizando'
+        COMPLETED = 'completed', 'Concluído'
+        FAILED = 'failed', 'Falhou'
+        EXPIRED = 'expired', 'Expirado'
+        CANCELLING = 'cancelling', 'Cancelando'
+        CANCELLED = 'cancelled', 'Cancelado'
+
+    FINAL_STATUSES = {Status.COMPLETED, Status.FAILED, Status.EXPIRED, Status.CANCELLED}
+
+    openai_batch_id = models.CharField(max_length=100, unique=True)
+    input_file_id = models.CharField(max_length=100)
+    output_file_id = models.CharField(max_length=100, null=True, blank=True)
+    error_file_id = models.CharField(max_length=100, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.VALIDATING, db_index=True)
+    model = models.CharField(max_length=100)
+    request_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    # resultados aplicados a todos os itens; até lá o lote continua sendo consultado
+    applied_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Lote da Batch API"
+        verbose_name_plural = "Lotes da Batch API"
+
+    def __str__(self):
+        return f"{self.openai_batch_id} ({self.status})"
+
+
+class ExtractionBatchItem(models.Model):
+    """
+    Um email aguardando (job nulo) ou em um lote da Batch API. Guarda o prompt
+    do usuário já montado: reenvios após falha de validação anexam a correção.
+    """
+    job = models.ForeignKey(ExtractionBatchJob, on_delete=models.SET_NULL, null=True, blank=True, related_name='items')
+    email = models.ForeignKey('emails.EmailMessage', on_delete=models.CASCADE, related_name='batch_items')
+    rule = models.ForeignKey('emails.AutomationRule', on_delete=models.SET_NULL, null=True, blank=True)
+    profile = models.ForeignKey(ExtractionProfile, on_delete=models.CASCADE, related_name='batch_items')
+    user_prompt = models.TextField()
+    attempt = models.PositiveSmallIntegerField(default=0)
+    cache_key = models.CharField(max_length=200, null=True, blank=True)
+    # campos já preenchidos pelo fast path; o lote pede à IA só o restante
+    prefilled = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Item da Batch API"
+        verbose_name_plural = "Itens da Batch API"
+
+    @property
+    def custom_id(self):
+        return f"item-{self.pk}"
+
@@ -0,0 +1,118 @@
+"""
+Empacotamento de emails curtos em uma única chamada à IA.
+
+Avisos curtos (ex: alertas de movimentação de um parágrafo) pagam mais pelo
+overhead fixo de cada requisição (prompt de sistema, schema, latência HTTPS)
+do que pelo próprio texto. Com EXTRACTION_PACK_ENABLED, o motor assíncrono
+junta até EXTRACTION_PACK_SIZE emails do mesmo perfil (mesmas instruções e
+schema), com até EXTRACTION_PACK_MAX_EMAIL_TOKENS cada, e pede à IA um objeto
+{"items": [{"id": ..., "data": {...}}]} com um item por email.
+
+Cada item é validado sozinho contra o schema (com o reparo local); os que
+faltarem ou falharem — e os de confiança baixa, se o perfil tiver cascata —
+voltam para a extração individual.
+"""
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from pydantic import BaseModel
+
+from extraction import strict_schema
+from extraction.repair import loads_lenient
+from extraction.tokens import count_tokens
+
+PACK_KEY = 'items'
+
+
+def _pack_key(request):
+    compiled = request.compiled
+    return (compiled.profile_id, compiled.compiled_schema.fingerprint, compiled.models, request.instructions)
+
+
+def plan_packs(requests: list, model: str, size: int = None, max_email_tokens: int = None) -> tuple:
+    """
+    (pacotes, avulsos): listas de índices de `requests`. Pacotes têm ao menos
+    dois emails curtos com o mesmo perfil; o resto vai um por requisição.
+    """
+    size = size or settings.EXTRACTION_PACK_SIZE
+    max_email_tokens = max_email_tokens or settings.EXTRACTION_PACK_MAX_EMAIL_TOKENS
+    groups, singles = {}, []
+    for index, request in enumerate(requests):
+        if size < 2 or count_tokens(request.text, model) > max_email_tokens:
+            singles.append(index)
+            continue
+        groups.setdefault(_pack_key(request), []).append(index)
+
+    packs = []
+    for indexes in groups.values():
+        for start in range(0, len(indexes), size):
+            chunk = indexes[start:start + size]
+            if len(chunk) > 1:
+                packs.append(chunk)
+            else:
+                singles.extend(chunk)
+    return packs, sorted(singles)
+
+
+def build_packed_prompt(instructions: str, texts: list, ids: list) -> str:
+    emails = "\n\n".join(f"EMAIL ID: {email_id}\n---\n{text}\n---" for email_id, text in zip(ids, texts))
+    return (
+        f"{instructions}\n\n"
+        f"Há {len(texts)} emails abaixo, cada um com um ID. Extraia cada email de forma independente "
+        f'e responda com um objeto JSON {{"{PACK_KEY}": [{{"id": "<ID>", "data": <objeto no formato do schema>}}]}}, '
+        f"com um item por email, na mesma ordem.\n\n"
+        f"TEXTOS DE ENTRADA:\n{emails}"
+    )
+
+
+@lru_cache(maxsize=None)
+def packed_response_format(schema: type[BaseModel]) -> dict:
+    """json_schema estrito do pacote: array de {id, data} com `data` no schema do perfil."""
+    data = strict_schema.strict_json_schema(schema)
+    defs = data.pop('$defs', None)
+    item = {
+        "type": "object",
+        "properties": {"id": {"type": "string"}, "data": data},
+        "required": ["id", "data"],
+        "additionalProperties": False,
+    }
+    packed = {
+        "type": "object",
+        "properties": {PACK_KEY: {"type": "array", "items": item}},
+        "required": [PACK_KEY],
+        "additionalProperties": False,
+    }
+    if defs:
+        packed['$defs'] = defs
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": f"{schema.__name__}Pacote"[:64], "strict": True, "schema": packed},
+    }
+
+
+def request_options(compiled_schema, model: str) -> tuple:
+    """(prompt de sistema, response_format) da chamada empacotada."""
+    if strict_schema.supports_strict(model):
+        return compiled_schema.strict_system_prompt, packed_response_format(compiled_schema.schema)
+    return compiled_schema.system_prompt, strict_schema.JSON_OBJECT
+
+
+def parse_packed(content: str, ids: list) -> dict:
+    """{id: dados brutos} dos itens da resposta; ids desconhecidos ou repetidos são ignorados."""
+    payload = loads_lenient(content or "")
+    items = payload.get(PACK_KEY) if isinstance(payload, dict) else None
+    if not isinstance(items, list):
+        return {}
+    expected, parsed = set(ids), {}
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('data'), dict):
+            continue
+        email_id = str(item.get('id'))
+        if email_id in expected and email_id not in parsed:
+            parsed[email_id] = item['data']
+    return parsed
+
+
+def element_json(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False)
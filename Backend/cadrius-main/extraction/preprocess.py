@@ -0,0 +1,153 @@
+"""
+Pré-processamento do corpo do email antes da extração.
+
+Cadeias de resposta, históricos encaminhados, assinaturas e avisos legais
+aumentam os tokens (latência e custo) sem ajudar a extração. Aqui o texto:
+
+1. perde as linhas citadas ('> ...') e tudo a partir do primeiro cabeçalho de
+   resposta ("Em ..., Fulano escreveu:", "-----Mensagem original-----",
+   "De: ... Enviado: ..."), só quando o trecho de cima tem os dados
+   extraíveis (número CNJ, datas) e o de baixo não traz nenhum novo. Um
+   encaminhamento ("---------- Forwarded message") nunca é cortado: a nota de
+   quem repassa raramente tem os dados da intimação encaminhada;
+2. perde a assinatura (delimitador '-- ', "Enviado do meu iPhone") e, entre os
+   últimos parágrafos (rodapé), os avisos de confidencialidade conhecidos
+   (EXTRACTION_DISCLAIMER_PATTERNS acrescenta padrões). Parágrafo com número
+   CNJ, data ou vocabulário processual (prazo, intimação...) nunca sai;
+3. tem espaços colapsados (no máximo uma linha em branco seguida);
+4. é cortado para o orçamento de tokens do perfil, mantendo início e fim.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.conf import settings
+
+from extraction.fastpath import CNJ_RE, DATE_RE, parse_br_date
+from extraction.tokens import count_tokens, head_tail_window
+
+TRUNCATION_MARKER = "\n[... trecho omitido ...]\n"
+
+# Avisos legais só são procurados nestes últimos parágrafos (rodapé)
+FOOTER_PARAGRAPHS = 3
+
+_FORWARD_HEADER = r"^\s*-{2,}\s*(Mensagem encaminhada|Forwarded message)\s*-{2,}\s*$"
+
+_REPLY_HEADERS = [
+    r"^\s*Em .{0,200}\bescreveu:\s*$",
+    r"^\s*On .{0,200}\bwrote:\s*$",
+    r"^\s*-{2,}\s*(Mensagem original|Original Message)\s*-{2,}\s*$",
+    r"^\s*(De|From):\s.+\n\s*(Enviad[ao](?: em)?|Sent|Data|Date):\s.+$",
+    r"^_{10,}\s*$",  # separador do Outlook antes do histórico
+]
+
+_SIGNATURES = [
+    r"^-- ?$",
+    r"^\s*(Enviado do meu|Enviado de meu|Sent from my) .{0,60}$",
+]
+
+_DISCLAIMERS = [
+    r"\bAVISO DE CONFIDENCIALIDADE\b",
+    r"\besta (mensagem|comunica[çc][ãa]o)\b.{0,120}\b(confidencia|sigilos|privilegiad)",
+    r"\bse voc[êe] n[ãa]o [ée] o destinat[áa]rio\b",
+    r"\bthis (e-?mail|message)\b.{0,120}\b(confidential|privileged)",
+    r"\bif you are not the intended recipient\b",
+    r"\bantes de imprimir,? pense\b",
+    r"\bpense no meio ambiente antes de imprimir\b",
+]
+
+# conteúdo processual: o parágrafo fica mesmo que pareça um aviso legal
+_LEGAL_CONTENT = re.compile(
+    r"\b(prazo|intim|cita[çc][ãa]o|segredo de justi[çc]a|autos|processo|audi[êe]ncia|senten[çc]a|despacho)",
+    re.IGNORECASE,
+)
+
+_QUOTED_LINE = re.compile(r"^[ \t]*>.*$\n?", re.MULTILINE)
+_SPACES = re.compile(r"[ \t\u00a0]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+@lru_cache(maxsize=None)
+def _compiled_patterns():
+    reply = re.compile("|".join(f"(?:{p})" for p in _REPLY_HEADERS), re.MULTILINE | re.IGNORECASE)
+    forward = re.compile(_FORWARD_HEADER, re.MULTILINE | re.IGNORECASE)
+    signature = re.compile("|".join(f"(?:{p})" for p in _SIGNATURES), re.MULTILINE | re.IGNORECASE)
+    disclaimers = [*_DISCLAIMERS, *settings.EXTRACTION_DISCLAIMER_PATTERNS]
+    disclaimer = re.compile("|".join(f"(?:{p})" for p in disclaimers), re.IGNORECASE | re.DOTALL)
+    return reply, forward, signature, disclaimer
+
+
+def _facts(text: str) -> set:
+    """Dados que a extração procura no texto: números CNJ e datas (normalizados)."""
+    facts = {"".join(m.groups()) for m in CNJ_RE.finditer(text)}
+    facts.update(d for d in (parse_br_date(m.group(0)) for m in DATE_RE.finditer(text)) if d)
+    return facts
+
+
+def _safe_to_drop(kept: str, dropped: str) -> bool:
+    """O trecho descartado não leva nenhum dado extraível que o mantido não tenha."""
+    kept_facts = _facts(kept)
+    return bool(kept_facts) and _facts(dropped) <= kept_facts
+
+
+def _cut_reply(pattern, forward, text: str) -> str:
+    for match in pattern.finditer(text):
+        head = text[:match.start()]
+        if forward.search(head):
+            # o histórico começa dentro de um encaminhamento: não corta
+            return text
+        if head.strip() and _safe_to_drop(head, text[match.start():]):
+            return head
+    return text
+
+
+def _cut_signature(pattern, text: str) -> str:
+    for match in pattern.finditer(text):
+        head = text[:match.start()]
+        if head.strip() and not (_facts(text[match.start():]) - _facts(head)):
+            return head
+    return text
+
+
+def _is_disclaimer(pattern, paragraph: str) -> bool:
+    return bool(pattern.search(paragraph)) and not _facts(paragraph) and not _LEGAL_CONTENT.search(paragraph)
+
+
+def clean_body(text: str) -> str:
+    """Passos 1-3: remove citações, assinaturas e avisos legais; colapsa espaços."""
+    reply, forward, signature, disclaimer = _compiled_patterns()
+    text = (text or "").replace("\r\n", "\n").replace("\r", "\n")
+
+    text = _cut_reply(reply, forward, text)
+    without_quotes = _QUOTED_LINE.sub("", text)
+    if without_quotes.strip() and (not _facts(text) - _facts(without_quotes)):
+        text = without_quotes
+    text = _cut_signature(signature, text)
+
+    paragraphs = re.split(r"\n\s*\n", text)
+    footer_start = max(0, len(paragraphs) - FOOTER_PARAGRAPHS)
+    kept = [p for i, p in enumerate(paragraphs) if i < footer_start or not _is_disclaimer(disclaimer, p)]
+    text = "\n\n".join(kept) if kept else text
+
+    text = "\n".join(_SPACES.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+@dataclass(frozen=True)
+class PreprocessedBody:
+    text: str
+    tokens: int
+    original_tokens: int
+    truncated: bool
+
+
+def preprocess_body(text: str, max_tokens: int, model: str) -> PreprocessedBody:
+    original_tokens = count_tokens(text or "", model)
+    cleaned = clean_body(text)
+    windowed = head_tail_window(cleaned, max_tokens, model, settings.EXTRACTION_HEAD_RATIO, TRUNCATION_MARKER)
+    return PreprocessedBody(
+        text=windowed,
+        tokens=count_tokens(windowed, model),
+        original_tokens=original_tokens,
+        truncated=windowed != cleaned,
+    )
@@ -0,0 +1,138 @@
+"""
+Token bucket da API OpenAI, compartilhado por todos os workers e nós via Redis.
+
+Dois baldes por modelo: requisições/minuto (EXTRACTION_RATE_LIMIT_RPM) e
+tokens/minuto (EXTRACTION_RATE_LIMIT_TPM). Cada chamada reserva 1 requisição
+e a estimativa de tokens de forma atômica (script Lua); se algum balde não
+tiver saldo, nada é debitado e o chamador recebe quanto esperar. Depois da
+resposta, a diferença entre o uso real e a estimativa é debitada (`debit`).
+O relógio da recarga é o do Redis (TIME), não o de cada worker: relógios
+dessincronizados entre nós não esvaziam nem enchem demais o balde.
+
+Sem Redis (ou com o Redis fora do ar) cai num balde local ao processo, com os
+mesmos limites: protege o processo, mas não o cluster. Depois de uma falha, o
+balde local segue sozinho por REDIS_RETRY_SECONDS (extraction.redis_conn).
+"""
+import logging
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+
+from extraction.redis_conn import RedisBreaker, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'cadrius:ratelimit:openai'
+WINDOW_MS = 60_000
+
+# KEYS: balde de requisições, balde de tokens
+# ARGV: capacidade rpm, capacidade tpm, requisições, tokens, forçar (1 = debita mesmo sem saldo)
+# Retorna 0 se debitou, senão quantos ms esperar.
+_ACQUIRE_SCRIPT = """
+-- Redis < 5: escrever depois de TIME (não determinístico) exige replicação por efeitos
+if redis.replicate_commands then redis.replicate_commands() end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local caps = {tonumber(ARGV[1]), tonumber(ARGV[2])}
+local costs = {tonumber(ARGV[3]), tonumber(ARGV[4])}
+local force = tonumber(ARGV[5])
+local levels = {}
+local wait = 0
+for i = 1, 2 do
+  local cap = caps[i]
+  if cap > 0 then
+    local data = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(data[1]) or cap
+    local ts = tonumber(data[2]) or now
+    local rate = cap / %(window)d
+    tokens = math.min(cap, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    local cost = math.min(costs[i], cap)
+    if tokens < cost then
+      wait = math.max(wait, (cost - tokens) / rate)
+    end
+  end
+end
+if wait > 0 and force == 0 then
+  return math.ceil(wait)
+end
+for i = 1, 2 do
+  if caps[i] > 0 then
+    redis.call('HMSET', KEYS[i], 'tokens', tostring(levels[i] - costs[i]), 'ts', tostring(now))
+    redis.call('PEXPIRE', KEYS[i], %(window)d * 2)
+  end
+end
+return 0
+""" % {'window': WINDOW_MS}
+
+
+class LocalTokenBucket:
+    """Mesmo algoritmo do script Lua, em memória (fallback sem Redis)."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.caps = (rpm, tpm)
+        self._levels = [float(rpm), float(tpm)]
+        self._ts = None
+        self._lock = threading.Lock()
+
+    def acquire(self, requests: int, tokens: int, force: bool = False, now_ms: int = None) -> int:
+        now = now_ms if now_ms is not None else int(time.time() * 1000)
+        with self._lock:
+            elapsed = 0 if self._ts is None else max(0, now - self._ts)
+            levels, wait = [], 0.0
+            for cap, level, cost in zip(self.caps, self._levels, (requests, tokens)):
+                if cap <= 0:
+                    levels.append(level)
+                    continue
+                rate = cap / WINDOW_MS
+                level = min(cap, level + elapsed * rate)
+                levels.append(level)
+                if level < min(cost, cap):
+                    wait = max(wait, (min(cost, cap) - level) / rate)
+            if wait > 0 and not force:
+                return int(-(-wait // 1))
+            self._levels = [
+                level - cost if cap > 0 else level
+                for cap, level, cost in zip(self.caps, levels, (requests, tokens))
+            ]
+            self._ts = now
+            return 0
+
+    def debit(self, tokens: int, now_ms: int = None):
+        self.acquire(0, tokens, force=True, now_ms=now_ms)
+
+
+class RedisTokenBucket:
+
+    def __init__(self, client, name: str, rpm: int, tpm: int):
+        self.client = client
+        self.keys = [f'{KEY_PREFIX}:{name}:rpm', f'{KEY_PREFIX}:{name}:tpm']
+        self.caps = (rpm, tpm)
+        self._script = client.register_script(_ACQUIRE_SCRIPT)
+        self._fallback = LocalTokenBucket(rpm, tpm)
+        self._breaker = RedisBreaker()
+
+    def acquire(self, requests: int, tokens: int, force: bool = False, now_ms: int = None) -> int:
+        """`now_ms` só vale para o balde local do fallback; no Redis o relógio é o do servidor."""
+        if self._breaker.available():
+            try:
+                return int(self._script(keys=self.keys, args=[*self.caps, requests, tokens, int(force)]))
+            except Exception as e:
+                logger.warning("Rate limit: Redis indisponível (%s); usando limite local do processo.", e)
+                self._breaker.trip()
+        return self._fallback.acquire(requests, tokens, force=force, now_ms=now_ms)
+
+    def debit(self, tokens: int, now_ms: int = None):
+        self.acquire(0, tokens, force=True, now_ms=now_ms)
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter(model: str):
+    """Balde compartilhado do modelo (Redis), ou local se EXTRACTION_REDIS_URL estiver vazio."""
+    rpm, tpm = settings.EXTRACTION_RATE_LIMIT_RPM, settings.EXTRACTION_RATE_LIMIT_TPM
+    client = get_redis_client()
+    if client is None:
+        return LocalTokenBucket(rpm, tpm)
+    return RedisTokenBucket(client, model, rpm, tpm)
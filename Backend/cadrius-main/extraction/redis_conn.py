@@ -0,0 +1,50 @@
+"""
+Cliente Redis compartilhado pela camada de extração (cache de resultados,
+contadores, rate limiting e regras compiladas). Usa o mesmo Redis do Django-Q
+por padrão.
+
+Quem usa o Redis num caminho quente guarda um RedisBreaker: depois de uma
+falha, o Redis é pulado por REDIS_RETRY_SECONDS, e o Redis fora do ar custa um
+timeout por janela em vez de um por chamada.
+"""
+import logging
+import threading
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# depois de uma falha, o Redis é pulado por este tempo
+REDIS_RETRY_SECONDS = 30
+
+
+@lru_cache(maxsize=None)
+def get_redis_client():
+    """Cliente do processo, ou None se EXTRACTION_REDIS_URL estiver vazio."""
+    url = settings.EXTRACTION_REDIS_URL
+    if not url:
+        return None
+    return redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+
+
+class RedisBreaker:
+    """Circuito aberto por REDIS_RETRY_SECONDS depois de uma falha (o chamador usa o próprio fallback)."""
+
+    def __init__(self, retry_seconds: int = REDIS_RETRY_SECONDS):
+        self.retry_seconds = retry_seconds
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        return time.monotonic() >= self._retry_at
+
+    def trip(self):
+        with self._lock:
+            self._retry_at = time.monotonic() + self.retry_seconds
+
+    def reset(self):
+        with self._lock:
+            self._retry_at = 0.0
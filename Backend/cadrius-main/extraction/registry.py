@@ -0,0 +1,208 @@
+"""
+Registro de perfis de extração compilados.
+
+Montar o prompt de sistema exige `model_json_schema()` + `json.dumps` do schema
+Pydantic, e validar exige um validador; nada disso muda entre emails. Aqui cada
+schema é compilado uma vez por processo (prompt de sistema congelado, JSON do
+schema, `TypeAdapter`) e cada ExtractionProfile ganha uma entrada com a
+estimativa de tokens do prefixo fixo.
+
+Como o prompt de sistema é byte a byte o mesmo para todas as chamadas do
+schema, o prefixo também aproveita o cache de prompt do provedor.
+
+A entrada é indexada por (perfil, schema, versão), onde a versão é o hash do
+template, do schema e da cascata de modelos: workers que ainda não receberam o sinal de alteração
+nunca usam uma entrada velha. `post_save`/`post_delete` do perfil liberam as
+entradas do processo local.
+"""
+import hashlib
+import json
+import threading
+from dataclasses import dataclass, replace
+from datetime import date
+from functools import lru_cache
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from pydantic import BaseModel, TypeAdapter
+
+from extraction.fastpath import partial_schema
+from extraction.models import ExtractionProfile
+from extraction.schemas import ProcessoJuridicoSchema, ServiceOrderSchema, SupportRequestSchema
+from extraction.tokens import count_tokens
+
+# Mapeamento para buscar a classe do schema pelo nome (ExtractionProfile.pydantic_schema_name)
+SCHEMA_MAP = {
+    'ProcessoJuridicoSchema': ProcessoJuridicoSchema,
+    'ServiceOrderSchema': ServiceOrderSchema,
+    'SupportRequestSchema': SupportRequestSchema,
+    # Adicionar novos schemas aqui
+}
+
+
+def build_system_prompt(schema_json: str) -> str:
+    return (
+        "Você é um extrator de dados altamente eficiente. Sua única tarefa é analisar o texto "
+        "fornecido e retornar os dados estritamente no formato JSON, conforme o schema abaixo. "
+        f"Se não for possível preencher um campo, use `null` ou um valor padrão razoável.\n\n"
+        f"SCHEMA JSON: {schema_json}"
+    )
+
+
+def build_strict_system_prompt() -> str:
+    """Prompt de sistema do modo estrito (extraction.strict_schema): o schema vai no response_format."""
+    return (
+        "Você é um extrator de dados altamente eficiente. Sua única tarefa é analisar o texto "
+        "fornecido e retornar os dados no formato JSON definido para a resposta. "
+        "Se não for possível preencher um campo, use `null` ou um valor padrão razoável."
+    )
+
+
+@dataclass(frozen=True)
+class CompiledSchema:
+    schema: type[BaseModel]
+    schema_json: str
+    system_prompt: str
+    adapter: TypeAdapter
+    fingerprint: str
+    strict_system_prompt: str = ""
+
+    def validate_json(self, raw_json: str) -> dict:
+        """Valida a saída da IA e devolve o dicionário serializável (levanta ValidationError)."""
+        return self.adapter.validate_json(raw_json).model_dump(mode='json')
+
+    def validate_python(self, data: dict) -> dict:
+        return self.adapter.validate_python(data).model_dump(mode='json')
+
+
+@lru_cache(maxsize=None)
+def compile_schema(schema: type[BaseModel]) -> CompiledSchema:
+    schema_json = json.dumps(schema.model_json_schema())
+    system_prompt = build_system_prompt(schema_json)
+    return CompiledSchema(
+        schema=schema,
+        schema_json=schema_json,
+        system_prompt=system_prompt,
+        adapter=TypeAdapter(schema),
+        fingerprint=hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()[:16],
+        strict_system_prompt=build_strict_system_prompt(),
+    )
+
+
+@dataclass(frozen=True)
+class CompiledProfile:
+    profile_id: int
+    profile_name: str
+    schema_name: str
+    template: str
+    compiled_schema: CompiledSchema
+    system_prompt_tokens: int
+    # cascata de modelos (extraction.cascade): sempre ao menos um
+    models: tuple = ()
+    min_confidence: int | None = None
+
+    @property
+    def schema(self):
+        return self.compiled_schema.schema
+
+    @property
+    def system_prompt(self):
+        return self.compiled_schema.system_prompt
+
+    @property
+    def cache_schema_id(self) -> str:
+        """Identifica schema + prompt de sistema na chave do cache de resultados."""
+        return f"{self.schema_name}:{self.compiled_schema.fingerprint}"
+
+    @property
+    def cascade_id(self) -> str:
+        """Modelos e limiar na chave do cache; com um modelo só e sem limiar, é o nome do modelo."""
+        cascade = "|".join(self.models)
+        return cascade if self.min_confidence is None else f"{cascade}@{self.min_confidence}"
+
+    def render_instructions(self, today: date) -> str:
+        """Template do perfil com {data_atual}; muda só uma vez por dia."""
+        return _render_template(self.template, today)
+
+
+@lru_cache(maxsize=1024)
+def _render_template(template: str, today: date) -> str:
+    return template.format(data_atual=today.strftime('%d/%m/%Y'))
+
+
+_registry = {}
+_lock = threading.Lock()
+
+
+def _version(profile) -> str:
+    payload = (f"{profile.pydantic_schema_name}\x00{profile.system_prompt_template}"
+               f"\x00{_models(profile, '')}\x00{profile.min_confidence}")
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def _models(profile, model: str) -> tuple:
+    return tuple(profile.model_cascade or ()) or (model,)
+
+
+def get_compiled_profile(profile, model: str) -> CompiledProfile | None:
+    """Perfil compilado, ou None se o schema não estiver em SCHEMA_MAP."""
+    schema = SCHEMA_MAP.get(profile.pydantic_schema_name)
+    if schema is None:
+        return None
+
+    key = (profile.pk, profile.pydantic_schema_name, _version(profile), model)
+    compiled = _registry.get(key)
+    if compiled is not None:
+        return compiled
+
+    compiled_schema = compile_schema(schema)
+    compiled = CompiledProfile(
+        profile_id=profile.pk,
+        profile_name=profile.name,
+        schema_name=profile.pydantic_schema_name,
+        template=profile.system_prompt_template,
+        compiled_schema=compiled_schema,
+        system_prompt_tokens=count_tokens(compiled_schema.system_prompt, model),
+        models=_models(profile, model),
+        min_confidence=profile.min_confidence,
+    )
+    with _lock:
+        # versões antigas do mesmo perfil saem junto
+        for stale in [k for k in _registry if k[0] == profile.pk]:
+            del _registry[stale]
+        _registry[key] = compiled
+    return compiled
+
+
+@lru_cache(maxsize=256)
+def get_partial_profile(compiled: CompiledProfile, known: frozenset, model: str) -> CompiledProfile | None:
+    """
+    Variante do perfil que pede à IA só os campos fora de `known` (já preenchidos
+    pelo extraction.fastpath). None se não sobrar campo para a IA.
+    """
+    if not known:
+        return compiled
+    schema = partial_schema(compiled.schema, known)
+    if schema is None:
+        return None
+    compiled_schema = compile_schema(schema)
+    return replace(
+        compiled,
+        compiled_schema=compiled_schema,
+        system_prompt_tokens=count_tokens(compiled_schema.system_prompt, model),
+    )
+
+
+def invalidate(profile_id=None):
+    with _lock:
+        if profile_id is None:
+            _registry.clear()
+            return
+        for key in [k for k in _registry if k[0] == profile_id]:
+            del _registry[key]
+
+
+@receiver(post_save, sender=ExtractionProfile, dispatch_uid='extraction_registry_profile_saved')
+@receiver(post_delete, sender=ExtractionProfile, dispatch_uid='extraction_registry_profile_deleted')
+def _invalidate_profile(sender, instance, **kwargs):
+    invalidate(instance.pk)
@@ -0,0 +1,130 @@
+"""
+Reparo local da saída da IA antes de gastar um re-prompt.
+
+Boa parte das falhas de validação é trivial de corrigir sem outra chamada:
+- JSON dentro de bloco de código (```json ... ```) ou com texto em volta;
+- vírgula sobrando antes de '}' ou ']';
+- inteiros como texto ("95%", "95,0") — ex: confidence_score;
+- datas em dd/mm/aaaa ou "3 de novembro de 2025" — ex: prazo_fatal;
+- Literal com caixa ou separador diferente ("high", "Movimentação processual");
+- booleanos como texto ("sim", "não").
+
+As correções seguem os tipos do schema alvo e só valem se o resultado passar
+na validação completa; senão o erro original segue para o re-prompt.
+"""
+import json
+import logging
+import re
+import types
+import typing
+from datetime import date
+from functools import lru_cache
+
+from django.conf import settings
+from pydantic import BaseModel, ValidationError
+
+from extraction import metrics
+from extraction.fastpath import DATE_RE, _to_date
+
+logger = logging.getLogger(__name__)
+
+_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*\n?(.*?)\n?\s*```\s*$", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_NUMBER = re.compile(r"^\s*(-?\d+(?:[.,]\d+)?)\s*%?\s*$")
+_TRUE = {'true', 'sim', 's', 'yes', 'y', 'verdadeiro'}
+_FALSE = {'false', 'não', 'nao', 'n', 'no', 'falso'}
+
+
+def _literal_key(value: str) -> str:
+    return re.sub(r"[\s\-]+", "_", value.strip()).upper()
+
+
+def _unwrap_optional(annotation):
+    if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+        args = [a for a in typing.get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+@lru_cache(maxsize=None)
+def _field_types(schema: type[BaseModel]) -> dict:
+    return {name: _unwrap_optional(field.annotation) for name, field in schema.model_fields.items()}
+
+
+def _coerce(annotation, value):
+    if not isinstance(value, (str, float)):
+        return value
+    if typing.get_origin(annotation) is typing.Literal:
+        if isinstance(value, str):
+            options = {_literal_key(str(o)): o for o in typing.get_args(annotation)}
+            return options.get(_literal_key(value), value)
+        return value
+    if annotation is int:
+        if isinstance(value, float):
+            return round(value)
+        match = _NUMBER.match(value)
+        return round(float(match.group(1).replace(',', '.'))) if match else value
+    if annotation is bool and isinstance(value, str):
+        lowered = value.strip().lower()
+        return True if lowered in _TRUE else False if lowered in _FALSE else value
+    if annotation is date and isinstance(value, str):
+        match = DATE_RE.fullmatch(value.strip())
+        parsed = _to_date(match.groups()) if match else None
+        return parsed.isoformat() if parsed else value
+    return value
+
+
+def loads_lenient(raw: str):
+    """JSON tolerante: bloco de código, texto em volta e vírgulas sobrando."""
+    text = raw.strip()
+    fence = _FENCE.match(text)
+    if fence:
+        text = fence.group(1)
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end < start:
+        return None
+    text = text[start:end + 1]
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text))
+    except json.JSONDecodeError:
+        return None
+
+
+def repair(raw: str, schema: type[BaseModel]) -> dict | None:
+    """Dicionário corrigido segundo os tipos do schema (ainda não validado), ou None."""
+    data = loads_lenient(raw or "")
+    if not isinstance(data, dict):
+        return None
+    types_by_field = _field_types(schema)
+    return {
+        name: _coerce(types_by_field[name], value) if name in types_by_field else value
+        for name, value in data.items()
+    }
+
+
+def validate_with_repair(compiled_schema, raw: str) -> dict:
+    """
+    Valida a saída da IA; se falhar, tenta o reparo local antes de devolver o
+    erro original (que vira re-prompt). Cada sucesso é um round trip evitado.
+    """
+    try:
+        return compiled_schema.validate_json(raw)
+    except ValidationError as original:
+        if not settings.EXTRACTION_REPAIR_ENABLED:
+            raise
+        metrics.incr('repair_attempt')
+        repaired = repair(raw, compiled_schema.schema)
+        if repaired is None:
+            raise
+        try:
+            result = compiled_schema.validate_python(repaired)
+        except ValidationError:
+            raise original from None
+        metrics.incr('repair_roundtrip_avoided')
+        logger.info("Saída da IA corrigida localmente (sem re-prompt).")
+        return result
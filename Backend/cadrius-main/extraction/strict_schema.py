@@ -0,0 +1,118 @@
+"""
+Structured outputs estritos (`response_format={"type": "json_schema", "strict": true}`).
+
+No modo `json_object` o schema vai colado no prompt de sistema e o modelo pode
+errar `Literal`s (ex: document_type='MOVIMENTACAO_PROCESSUAL'), o que custa
+re-prompts. No modo estrito o schema vai no próprio `response_format` e a API
+garante a forma da saída; o prompt de sistema fica sem o JSON do schema.
+
+O subconjunto aceito pela API exige, por objeto, todos os campos em
+`required` e `additionalProperties: false`; palavras-chave como `format`,
+`minimum`/`maximum` e `default` saem e viram texto na descrição (ex: conint de
+0 a 100, date em AAAA-MM-DD). Campos opcionais (`date | None`) continuam
+aceitando `null`. A validação Pydantic segue valendo para as restrições.
+
+Modelos sem suporte (EXTRACTION_STRICT_MODELS lista os prefixos com suporte,
+ou a API recusa o `response_format`) caem para `json_object`; a recusa fica
+memorizada no processo.
+"""
+import copy
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+JSON_OBJECT = {"type": "json_object"}
+
+_DROPPED = ('title', 'default', 'examples')
+_HINTS = {
+    'format': lambda v: {'date': "Formato AAAA-MM-DD.", 'date-time': "Formato ISO 8601."}.get(v, f"Formato {v}."),
+    'minimum': lambda v: f"Mínimo {v}.",
+    'maximum': lambda v: f"Máximo {v}.",
+    'exclusiveMinimum': lambda v: f"Maior que {v}.",
+    'exclusiveMaximum': lambda v: f"Menor que {v}.",
+    'minLength': lambda v: f"Ao menos {v} caracteres.",
+    'maxLength': lambda v: f"No máximo {v} caracteres.",
+    'pattern': lambda v: f"Padrão {v}.",
+}
+
+_unsupported_models = set()
+
+
+def _strict_node(node: dict) -> dict:
+    node = {k: v for k, v in node.items() if k not in _DROPPED}
+
+    hints = []
+    if 'minimum' in node and 'maximum' in node:
+        hints.append(f"Entre {node.pop('minimum')} e {node.pop('maximum')}.")
+    hints += [_HINTS[k](node.pop(k)) for k in list(node) if k in _HINTS]
+    if hints:
+        description = node.get('description', '')
+        missing = [h for h in hints if h not in description]
+        if missing:
+            node['description'] = " ".join(filter(None, [description, *missing]))
+
+    if 'const' in node:
+        node['enum'] = [node.pop('const')]
+    if 'anyOf' in node:
+        node['anyOf'] = [_strict_node(option) for option in node['anyOf']]
+    if 'items' in node:
+        node['items'] = _strict_node(node['items'])
+    if node.get('type') == 'object' or 'properties' in node:
+        properties = node.get('properties', {})
+        node['properties'] = {name: _strict_node(prop) for name, prop in properties.items()}
+        node['required'] = list(properties)
+        node['additionalProperties'] = False
+    return node
+
+
+@lru_cache(maxsize=None)
+def _strict_schema(schema: type[BaseModel]) -> dict:
+    json_schema = copy.deepcopy(schema.model_json_schema())
+    defs = json_schema.pop('$defs', None)
+    strict = _strict_node(json_schema)
+    if defs:
+        strict['$defs'] = {name: _strict_node(definition) for name, definition in defs.items()}
+    return strict
+
+
+def strict_json_schema(schema: type[BaseModel]) -> dict:
+    """JSON Schema do subconjunto estrito da API (cópia; o original fica em cache)."""
+    return copy.deepcopy(_strict_schema(schema))
+
+
+@lru_cache(maxsize=None)
+def response_format(schema: type[BaseModel]) -> dict:
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": schema.__name__[:64], "strict": True, "schema": _strict_schema(schema)},
+    }
+
+
+def supports_strict(model: str) -> bool:
+    if not settings.EXTRACTION_STRICT_OUTPUT_ENABLED or model in _unsupported_models:
+        return False
+    return any(model.startswith(prefix) for prefix in settings.EXTRACTION_STRICT_MODELS)
+
+
+def is_unsupported_format_error(error: Exception) -> bool:
+    """400 da API recusando o response_format/json_schema para o modelo."""
+    if getattr(error, 'status_code', None) != 400:
+        return False
+    message = str(error).lower()
+    return 'response_format' in message or 'json_schema' in message
+
+
+def mark_unsupported(model: str):
+    logger.warning(f"Modelo {model} não aceita json_schema estrito; usando json_object.")
+    _unsupported_models.add(model)
+
+
+def request_options(compiled_schema, model: str) -> tuple:
+    """(prompt de sistema, response_format) da chamada, estrito se o modelo suportar."""
+    if supports_strict(model):
+        return compiled_schema.strict_system_prompt, response_format(compiled_schema.schema)
+    return compiled_schema.system_prompt, JSON_OBJECT
@@ -1,3 +1,671 @@
-from django.test import TestCase
+import asyncio
+import dataclasses
+import json
+from datetime import date
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from pydantic import ValidationError
+
+from extraction import cascade, metrics
+from extraction.ai_wrapper import extract_fields_from_text
+from extraction.async_engine import AsyncExtractionEngine, ExtractionRequest, run_extractions
+from extraction.models import ExtractionProfile
+from extraction.preprocess import TRUNCATION_MARKER, clean_body, preprocess_body
+from extraction.ratelimit import LocalTokenBucket, RedisTokenBucket
+from extraction.registry import compile_schema, get_compiled_profile, invalidate, _registry
+from extraction.schemas import ProcessoJuridicoSchema, ServiceOrderSchema, SupportRequestSchema
+from extraction.fastpath import cnj_check_digits, find_cnj_numbers, find_deadlines, is_valid_cnj, partial_schema, pre_extract
+from extraction import strict_schema
+from extraction.strict_schema import strict_json_schema
+from extraction.tokens import _encoding, count_tokens
+from extraction.packing import plan_packs
+from extraction.repair import repair, validate_with_repair
+from extraction.cache import ExtractionCache, LocalLRU, cache_key, normalize_text, tenant_scope, SHARED_SCOPE
+
+
+class FakeRedis:
+    """Só o necessário para o cache e as métricas: get/setex/hincrby/hgetall."""
+
+    def __init__(self):
+        self.data = {}
+        self.hashes = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value.encode() if isinstance(value, str) else value
+
+    def hincrby(self, name, field, amount):
+        bucket = self.hashes.setdefault(name, {})
+        bucket[field.encode()] = bucket.get(field.encode(), 0) + amount
+
+    def hgetall(self, name):
+        return dict(self.hashes.get(name, {}))
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+
+class BrokenRedis:
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise ConnectionError("redis fora do ar")
+        return fail
+
+
+class MetricsTests(SimpleTestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_counters_reach_redis_in_batches(self):
+        redis = FakeRedis()
+        with mock.patch('extraction.metrics.get_redis_client', return_value=redis):
+            metrics.incr('cache_miss')  # primeiro envio
+            metrics.incr('cache_miss')
+            metrics.incr('cache_store', 3)
+            self.assertEqual(redis.hgetall(metrics.REDIS_KEY), {b'cache_miss': 1})
+
+            self.assertEqual(metrics.snapshot()['cluster'], {'cache_miss': 2, 'cache_store': 3})
+
+    def test_redis_outage_is_not_paid_per_counter(self):
+        broken = mock.Mock(pipeline=mock.Mock(side_effect=ConnectionError("redis fora do ar")))
+        with mock.patch('extraction.metrics.get_redis_client', return_value=broken), \
+                self.assertLogs('extraction.metrics', 'WARNING'):
+            for _ in range(50):
+                metrics.incr('api_call')
+        self.assertEqual(broken.pipeline.call_count, 1)
+        self.assertEqual(metrics.snapshot()['process'], {'api_call': 50})
+
+        redis = FakeRedis()
+        later = metrics.time.monotonic() + metrics.REDIS_RETRY_SECONDS + 1
+        with mock.patch('extraction.metrics.get_redis_client', return_value=redis), \
+                mock.patch('extraction.metrics.time.monotonic', return_value=later):
+            metrics.incr('api_call')
+        self.assertEqual(redis.hgetall(metrics.REDIS_KEY), {b'api_call': 51})
+
+
+@mock.patch('extraction.metrics.get_redis_client', return_value=None)
+class ExtractionCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_key_ignores_whitespace_but_not_content_or_scope(self, _):
+        args = ('ProcessoJuridicoSchema', 'Extraia o prazo.', 'gpt-4o-mini')
+        key = cache_key("Prazo de\r\n 15  dias.", *args, scope=tenant_scope(1))
+
+        self.assertEqual(normalize_text("  Prazo de\r\n 15  dias. "), "Prazo de 15 dias.")
+        self.assertEqual(key, cache_key("Prazo de 15 dias.", *args, scope=tenant_scope(1)))
+        self.assertNotEqual(key, cache_key("Prazo de 5 dias.", *args, scope=tenant_scope(1)))
+        self.assertNotEqual(key, cache_key("Prazo de 15 dias.", *args, scope=tenant_scope(2)))
+        self.assertNotEqual(key, cache_key("Prazo de 15 dias.", *args, scope=SHARED_SCOPE))
+        self.assertNotEqual(key, cache_key("Prazo de 15 dias.", 'ProcessoJuridicoSchema', 'Extraia o prazo.',
+                                           'gpt-4o', scope=tenant_scope(1)))
+
+    def test_redis_tier_fills_local_tier_and_counts_hits(self, _):
+        redis = FakeRedis()
+        writer = ExtractionCache(LocalLRU(10, 60), redis_client=redis, ttl_seconds=60)
+        reader = ExtractionCache(LocalLRU(10, 60), redis_client=redis, ttl_seconds=60)
+
+        self.assertIsNone(reader.get('k'))
+        writer.set('k', {'numero_processo': '0001'})
+        self.assertEqual(reader.get('k'), {'numero_processo': '0001'})  # Redis
+        self.assertEqual(reader.get('k'), {'numero_processo': '0001'})  # LRU local
+
+        self.assertEqual(metrics.snapshot()['process'],
+                         {'cache_miss': 1, 'cache_store': 1, 'cache_redis_hit': 1, 'cache_local_hit': 1})
+
+    def test_local_lru_evicts_oldest_and_expired(self, _):
+        lru = LocalLRU(max_entries=2, ttl_seconds=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+        with mock.patch('extraction.cache.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(lru.get('a'))
+
+    def test_redis_failure_degrades_to_local_tier(self, _):
+        cache = ExtractionCache(LocalLRU(10, 60), redis_client=BrokenRedis(), ttl_seconds=60)
+        self.assertIsNone(cache.get('k'))
+        cache.set('k', {'ok': True})
+        self.assertEqual(cache.get('k'), {'ok': True})
+
+    def test_redis_outage_is_not_paid_per_lookup(self, _):
+        broken = mock.Mock(get=mock.Mock(side_effect=ConnectionError("redis fora do ar")))
+        cache = ExtractionCache(LocalLRU(10, 60), redis_client=broken, ttl_seconds=60)
+        with self.assertLogs('extraction.cache', 'WARNING'):
+            for i in range(5):
+                cache.get(f'k{i}')
+            cache.set('k', {'ok': True})
+        self.assertEqual(broken.get.call_count, 1)
+        broken.setex.assert_not_called()
+
+
+class CompiledProfileRegistryTests(TestCase):
+
+    def setUp(self):
+        invalidate()
+        user = get_user_model().objects.create_user(username='registro', password='x')
+        self.profile = ExtractionProfile.objects.create(
+            user=user, name="Suporte", system_prompt_template="Hoje é {data_atual}. Extraia o chamado.",
+            pydantic_schema_name="SupportRequestSchema",
+        )
+
+    def test_compiles_once_and_keeps_prompt_stable(self):
+        with mock.patch.object(SupportRequestSchema, 'model_json_schema',
+                               wraps=SupportRequestSchema.model_json_schema) as json_schema:
+            compile_schema.cache_clear()
+            first = get_compiled_profile(self.profile, 'gpt-4o-mini')
+            # outra instância da mesma linha, como em cada process_email
+            again = get_compiled_profile(ExtractionProfile.objects.get(pk=self.profile.pk), 'gpt-4o-mini')
+
+        self.assertIs(first, again)
+        self.assertEqual(json_schema.call_count, 1)
+        self.assertTrue(first.system_prompt.endswith(first.compiled_schema.schema_json))
+        self.assertGreater(first.system_prompt_tokens, 0)
+        self.assertEqual(first.render_instructions(date(2025, 11, 17)), "Hoje é 17/11/2025. Extraia o chamado.")
+        self.assertEqual(
+            first.compiled_schema.validate_json('{"document_type": "SUPPORT_REQUEST", "confidence_score": 90, '
+                                                '"system_affected": "CRM", "issue_summary": "Erro", "is_critical": false, '
+                                                '"requester_email": "a@b.com"}')["system_affected"],
+            "CRM",
+        )
+        with self.assertRaises(ValidationError):
+            first.compiled_schema.validate_json('{"document_type": "OTHER"}')
+
+    def test_profile_change_invalidates_entry(self):
+        stale_copy = ExtractionProfile.objects.get(pk=self.profile.pk)
+        before = get_compiled_profile(self.profile, 'gpt-4o-mini')
+
+        self.profile.system_prompt_template = "Extraia apenas o sistema afetado."
+        self.profile.save()
+        self.assertEqual(len(_registry), 0)
+
+        after = get_compiled_profile(self.profile, 'gpt-4o-mini')
+        self.assertIsNot(before, after)
+        self.assertEqual(after.template, "Extraia apenas o sistema afetado.")
+        # worker que ainda tem a linha antiga em mãos não reaproveita a entrada nova
+        self.assertEqual(get_compiled_profile(stale_copy, 'gpt-4o-mini').template, stale_copy.system_prompt_template)
+
+    def test_unknown_schema(self):
+        self.profile.pydantic_schema_name = "InexistenteSchema"
+        self.assertIsNone(get_compiled_profile(self.profile, 'gpt-4o-mini'))
+
+
+SUPPORT_JSON = json.dumps({
+    "document_type": "SUPPORT_REQUEST", "confidence_score": 90, "system_affected": "CRM",
+    "issue_summary": "Erro", "is_critical": False, "requester_email": "a@b.com",
+})
+
+
+class FakeAsyncOpenAI:
+    """chat.completions.create assíncrono que registra o pico de chamadas simultâneas."""
+
+    def __init__(self, outputs=None, delay=0.02):
+        self.outputs = list(outputs or [])
+        self.delay = delay
+        self.calls = self.active = self.peak = 0
+        self.models = []
+        self.closed = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        self.models.append(kwargs['model'])
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        content = self.outputs.pop(0) if self.outputs else SUPPORT_JSON
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                               usage=SimpleNamespace(total_tokens=100))
+
+    async def close(self):
+        self.closed = True
+
+
+@mock.patch('extraction.metrics.get_redis_client', return_value=None)
+class AsyncExtractionEngineTests(TestCase):
+
+    def setUp(self):
+        invalidate()
+        user = get_user_model().objects.create_user(username='motor', password='x')
+        profile = ExtractionProfile.objects.create(
+            user=user, name="Suporte", system_prompt_template="Extraia o chamado.",
+            pydantic_schema_name="SupportRequestSchema",
+        )
+        self.compiled = get_compiled_profile(profile, 'gpt-4o-mini')
+
+    def _requests(self, n):
+        return [ExtractionRequest(text=f"Chamado {i}", compiled=self.compiled, instructions="Extraia o chamado.")
+                for i in range(n)]
+
+    def test_runs_concurrently_up_to_the_limit(self, _):
+        client = FakeAsyncOpenAI()
+        results = run_extractions(self._requests(12), client=client, limiter=LocalTokenBucket(0, 0), concurrency=4)
+
+        self.assertEqual(client.calls, 12)
+        self.assertEqual(client.peak, 4)
+        self.assertTrue(all(r["system_affected"] == "CRM" for r in results))
+        self.assertFalse(client.closed)  # cliente injetado é de quem chamou
+
+    def test_reprompts_on_invalid_json_then_gives_up(self, _):
+        client = FakeAsyncOpenAI(outputs=['{"document_type": "OTHER"}', SUPPORT_JSON, "não é json", "{}"])
+        results = run_extractions(self._requests(2), client=client, limiter=LocalTokenBucket(0, 0), concurrency=1)
+
+        self.assertEqual(results[0]["issue_summary"], "Erro")
+        self.assertIsNone(results[1])
+        self.assertEqual(client.calls, 4)
+
+    def test_waits_for_rate_limiter(self, _):
+        limiter = mock.Mock()
+        limiter.acquire.side_effect = [5, 0]
+        engine = AsyncExtractionEngine(FakeAsyncOpenAI(delay=0), limiter, concurrency=1, model='gpt-4o-mini')
+
+        with mock.patch('extraction.async_engine.asyncio.sleep', wraps=asyncio.sleep) as sleep:
+            result = asyncio.run(engine.extract(self._requests(1)[0]))
+
+        self.assertIsNotNone(result)
+        self.assertEqual(limiter.acquire.call_count, 2)
+        self.assertEqual(limiter.acquire.call_args.args[0], 1)  # 1 requisição + estimativa de tokens
+        self.assertGreater(limiter.acquire.call_args.args[1], self.compiled.system_prompt_tokens)
+        self.assertTrue(any(0.005 <= c.args[0] <= 0.006 for c in sleep.call_args_list))
+
+    def test_each_model_debits_its_own_bucket(self, _):
+        buckets = {'gpt-4o-mini': mock.Mock(), 'gpt-4o': mock.Mock()}
+        for bucket in buckets.values():
+            bucket.acquire.return_value = 0
+        low = SUPPORT_JSON.replace('"confidence_score": 90', '"confidence_score": 40')
+        compiled = dataclasses.replace(self.compiled, models=('gpt-4o-mini', 'gpt-4o'), min_confidence=70)
+        request = ExtractionRequest(text="Chamado", compiled=compiled, instructions="Extraia.")
+
+        with mock.patch('extraction.async_engine.get_rate_limiter', side_effect=buckets.get):
+            [result] = run_extractions([request], client=FakeAsyncOpenAI(outputs=[low, SUPPORT_JSON]), concurrency=1)
+
+        self.assertEqual(result["confidence_score"], 90)
+        self.assertEqual(buckets['gpt-4o-mini'].acquire.call_count, 1)
+        self.assertEqual(buckets['gpt-4o'].acquire.call_count, 1)
+
+
+@mock.patch('extraction.metrics.get_redis_client', return_value=None)
+class ModelCascadeTests(TestCase):
+
+    def setUp(self):
+        invalidate()
+        metrics.reset()
+        user = get_user_model().objects.create_user(username='cascata', password='x')
+        self.profile = ExtractionProfile.objects.create(
+            user=user, name="Suporte", system_prompt_template="Extraia o chamado.",
+            pydantic_schema_name="SupportRequestSchema", model_cascade=["gpt-4o-mini", "gpt-4o"], min_confidence=70,
+        )
+
+    def _response(self, content):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                               usage=SimpleNamespace(prompt_tokens=200, completion_tokens=50, total_tokens=250))
+
+    def test_low_confidence_escalates_to_next_model(self, _):
+        low = SUPPORT_JSON.replace('"confidence_score": 90', '"confidence_score": 40')
+        with mock.patch('extraction.ai_wrapper.client') as client:
+            client.chat.completions.create.side_effect = [self._response(low), self._response(SUPPORT_JSON)]
+            result = extract_fields_from_text("Chamado", SupportRequestSchema, "Extraia.",
+                                              models=("gpt-4o-mini", "gpt-4o"), min_confidence=70)
+
+        self.assertEqual(result["confidence_score"], 90)
+        self.assertEqual([c.kwargs['model'] for c in client.chat.completions.create.call_args_list],
+                         ["gpt-4o-mini", "gpt-4o"])
+
+    def test_sync_path_acquires_the_shared_bucket_of_each_model(self, _):
+        buckets = {'gpt-4o-mini': mock.Mock(), 'gpt-4o': mock.Mock()}
+        for bucket in buckets.values():
+            bucket.acquire.return_value = 0
+        low = SUPPORT_JSON.replace('"confidence_score": 90', '"confidence_score": 40')
+        with mock.patch('extraction.ai_wrapper.client') as client, \
+                mock.patch('extraction.ai_wrapper.get_rate_limiter', side_effect=buckets.get):
+            client.chat.completions.create.side_effect = [self._response(low), self._response(SUPPORT_JSON)]
+            extract_fields_from_text("Chamado", SupportRequestSchema, "Extraia.",
+                                     models=("gpt-4o-mini", "gpt-4o"), min_confidence=70)
+
+        for bucket in buckets.values():
+            bucket.acquire.assert_called_once()
+            self.assertEqual(bucket.acquire.call_args.args[0], 1)
+        summary = cascade.tier_summary(metrics.snapshot()['process'])
+        self.assertEqual(summary["gpt-4o-mini"]["low_confidence"], 1)
+        self.assertEqual(summary["gpt-4o-mini"]["success_rate"], 0.0)
+        self.assertEqual(summary["gpt-4o"]["success_rate"], 1.0)
+        self.assertEqual(summary["gpt-4o"]["cost_usd"], round((200 * 2.5 + 50 * 10.0) / 1_000_000, 6))
+
+    def test_async_engine_escalates_on_invalid_json_without_reprompting_cheap_model(self, _):
+        compiled = get_compiled_profile(self.profile, 'gpt-4o-mini')
+        self.assertEqual((compiled.models, compiled.cascade_id), (("gpt-4o-mini", "gpt-4o"), "gpt-4o-mini|gpt-4o@70"))
+        client = FakeAsyncOpenAI(outputs=["{}"], delay=0)
+        [result] = run_extractions([ExtractionRequest(text="Chamado", compiled=compiled, instructions="Extraia.")],
+                                   client=client, limiter=LocalTokenBucket(0, 0), concurrency=1)
+
+        self.assertEqual(result["system_affected"], "CRM")
+        self.assertEqual(client.models, ["gpt-4o-mini", "gpt-4o"])
+
+    def test_last_tier_failure_falls_back_to_low_confidence_result(self, _):
+        low = SUPPORT_JSON.replace('"confidence_score": 90', '"confidence_score": 40')
+        with mock.patch('extraction.ai_wrapper.client') as client:
+            client.chat.completions.create.side_effect = [self._response(low), RuntimeError("503")]
+            result = extract_fields_from_text("Chamado", SupportRequestSchema, "Extraia.",
+                                              models=("gpt-4o-mini", "gpt-4o"), min_confidence=70)
+
+        self.assertEqual(result["confidence_score"], 40)
+        self.assertEqual(cascade.tier_summary(metrics.snapshot()['process'])["gpt-4o"]["error"], 1)
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_requests_and_tokens_refill_over_the_minute(self):
+        bucket = LocalTokenBucket(rpm=2, tpm=1000)
+        self.assertEqual(bucket.acquire(1, 400, now_ms=0), 0)
+        self.assertEqual(bucket.acquire(1, 400, now_ms=0), 0)
+        self.assertEqual(bucket.acquire(1, 10, now_ms=0), 30_000)  # falta 1 requisição (2/min)
+
+        # 30s depois: 1 requisição recarregada, mas só 200 + 500 tokens para pedir 800
+        self.assertEqual(bucket.acquire(1, 800, now_ms=30_000), 6_000)
+        self.assertEqual(bucket.acquire(1, 800, now_ms=36_000), 0)
+
+    def test_debit_pushes_bucket_negative(self):
+        bucket = LocalTokenBucket(rpm=0, tpm=600)
+        bucket.acquire(1, 100, now_ms=0)
+        bucket.debit(500, now_ms=0)
+        self.assertGreater(bucket.acquire(1, 100, now_ms=0), 0)
+
+    def test_redis_bucket_uses_the_server_clock(self):
+        client = mock.Mock()
+        client.register_script.return_value = script = mock.Mock(return_value=0)
+        bucket = RedisTokenBucket(client, 'gpt-4o-mini', rpm=60, tpm=1000)
+
+        bucket.acquire(1, 200, now_ms=123)
+
+        self.assertIn("redis.call('TIME')", client.register_script.call_args.args[0])
+        self.assertEqual(script.call_args.kwargs['args'], [60, 1000, 1, 200, 0])
+
+    def test_redis_failure_falls_back_to_local_bucket(self):
+        client = mock.Mock()
+        client.register_script.return_value = mock.Mock(side_effect=ConnectionError("redis fora do ar"))
+        bucket = RedisTokenBucket(client, 'gpt-4o-mini', rpm=1, tpm=0)
+
+        with self.assertLogs('extraction.ratelimit', 'WARNING'):
+            self.assertEqual(bucket.acquire(1, 0, now_ms=0), 0)
+            self.assertGreater(bucket.acquire(1, 0, now_ms=0), 0)
+        self.assertEqual(client.register_script.return_value.call_count, 1)  # circuito aberto
+
+
+REPLY_CHAIN = """Prezados,
+
+Segue a intimação do processo 0001234-56.2025.8.26.0100, prazo de 15 dias.
+
+Atenciosamente,
+Dra. Ana
+
+--
+Ana Souza | OAB/SP 123.456
+
+AVISO DE CONFIDENCIALIDADE: esta mensagem e seus anexos são confidenciais.
+
+Em seg., 17 de nov. de 2025 às 10:00, Cliente <cliente@example.com> escreveu:
+> Doutora, recebeu a intimação?
+> Obrigado.
+"""
+
+
+class PreprocessTests(SimpleTestCase):
+
+    def test_strips_quotes_signature_and_disclaimer(self):
+        cleaned = clean_body(REPLY_CHAIN)
+        self.assertEqual(cleaned, "Prezados,\n\nSegue a intimação do processo 0001234-56.2025.8.26.0100, "
+                                  "prazo de 15 dias.\n\nAtenciosamente,\nDra. Ana")
+
+    def test_forward_only_email_keeps_forwarded_content(self):
+        forwarded = ("---------- Forwarded message ---------\nDe: intimacao@tjsp.jus.br\n\n"
+                     "Fica V. Sa. intimada da decisão proferida nos autos.")
+        self.assertIn("Fica V. Sa. intimada", clean_body(forwarded))
+
+    def test_disclaimer_inside_paragraph_removed_and_whitespace_collapsed(self):
+        text = "Prazo:\t 15   dias.\n\n\n\nThis message is confidential and may be privileged.\nLine 2"
+        self.assertEqual(clean_body(text), "Prazo: 15 dias.")
+
+    def test_forwarded_intimacao_below_a_short_note_is_kept(self):
+        text = ("Dr. Fulano, segue a intimação abaixo para ciência e providências.\n\n"
+                "Att.,\nMarina\n\n"
+                "De: TJSP - Intimações <intimacao@tjsp.jus.br>\n"
+                "Enviado: segunda-feira, 3 de novembro de 2025 10:12\n"
+                "Para: escritorio@exemplo.com.br\n"
+                "Assunto: Intimação eletrônica\n\n"
+                "Processo 0001234-56.2025.8.26.0100. Fica V. Sa. intimada para manifestação "
+                "no prazo de 15 dias, até 24/11/2025.")
+        cleaned = clean_body(text)
+
+        self.assertIn("0001234-56.2025.8.26.0100", cleaned)
+        self.assertIn("até 24/11/2025", cleaned)
+        self.assertIn("---------- Forwarded", clean_body(
+            "Segue para ciência.\n\n---------- Forwarded message ---------\n"
+            "Processo 0001234-56.2025.8.26.0100, prazo até 24/11/2025."))
+
+    def test_sealed_proceedings_notice_is_not_taken_for_a_disclaimer(self):
+        text = ("Segue andamento.\n\n"
+                "O processo tramita em segredo de justiça e esta comunicação é sigilosa; "
+                "intime-se a parte para manifestação em 5 dias.")
+        self.assertIn("intime-se a parte", clean_body(text))
+        self.assertIn("24/11/2025", clean_body(
+            "Ok.\n\nEsta mensagem é confidencial. Audiência em 24/11/2025."))
+
+    def test_budget_keeps_head_and_tail(self):
+        text = "INICIO " + "palavra " * 2000 + "FIM"
+        body = preprocess_body(text, max_tokens=100, model='gpt-4o-mini')
+
+        self.assertTrue(body.truncated)
+        self.assertLessEqual(body.tokens, 100)
+        self.assertGreater(body.original_tokens, 1000)
+        self.assertTrue(body.text.startswith("INICIO"))
+        self.assertTrue(body.text.endswith("FIM"))
+        self.assertIn(TRUNCATION_MARKER.strip(), body.text)
+        self.assertFalse(preprocess_body("curto", max_tokens=100, model='gpt-4o-mini').truncated)
+
+    def test_unavailable_encoding_falls_back_to_heuristic_and_warns(self):
+        # tiktoken instalado, mas sem rede para baixar o BPE
+        tiktoken = SimpleNamespace(encoding_for_model=mock.Mock(side_effect=OSError("sem rede")))
+        _encoding.cache_clear()
+        self.addCleanup(_encoding.cache_clear)
+        with mock.patch.dict('sys.modules', {'tiktoken': tiktoken}), self.assertLogs('extraction.tokens', 'WARNING'):
+            self.assertEqual(count_tokens("x" * 40, 'modelo-teste'), 10)
+
+
+INTIMACAO = (
+    "Intimação eletrônica\n"
+    "Processo 0001234-37.2025.8.26.0100 (ref. 0001234-38.2025.8.26.0100)\n"
+    "Tipo de documento: Intimação\n"
+    "Fica V. Sa. intimada; prazo de 15 dias, até 03/11/2025."
+)
+
+
+class FastPathTests(SimpleTestCase):
+
+    def test_cnj_check_digits(self):
+        self.assertEqual(cnj_check_digits('0001234', '2025', '8', '26', '0100'), '37')
+        self.assertTrue(is_valid_cnj('0001234-37.2025.8.26.0100'))
+        self.assertTrue(is_valid_cnj('00012343720258260100'))
+        self.assertFalse(is_valid_cnj('0001234-38.2025.8.26.0100'))
+        # o número com dígito errado não conta como segundo processo
+        self.assertEqual(find_cnj_numbers(INTIMACAO), ['0001234-37.2025.8.26.0100'])
+
+    def test_deadlines_need_a_keyword_and_a_real_date(self):
+        self.assertEqual(find_deadlines("vencimento em 3 de novembro de 2025"), {date(2025, 11, 3)})
+        self.assertEqual(find_deadlines("Recebido em 03/11/2025."), set())
+        self.assertEqual(find_deadlines("prazo até 31/02/2025"), set())
+
+    def test_date_not_attached_to_a_deadline_phrase_is_ignored(self):
+        self.assertEqual(find_deadlines("prazo de 15 (quinze) dias úteis, até 3 de novembro de 2025"),
+                         {date(2025, 11, 3)})
+        for text in ("Fica V. Sa. intimada até a audiência designada para 12/05/2025.",
+                     "Manifeste-se no prazo de 5 dias até a audiência designada para 12/05/2025."):
+            self.assertEqual(find_deadlines(text), set())
+            self.assertNotIn('prazo_fatal', pre_extract(ProcessoJuridicoSchema, text))
+
+    def test_pre_extract_fills_only_unambiguous_fields(self):
+        self.assertEqual(pre_extract(ProcessoJuridicoSchema, INTIMACAO), {
+            'document_type': 'MOVIMENTACAO_PROCESSUAL',
+            'numero_processo': '0001234-37.2025.8.26.0100',
+            'prazo_fatal': '2025-11-03',
+            'tipo_movimentacao': 'Intimação',
+        })
+        ambiguous = "Prazo até 03/11/2025 ou, no máximo, até 10/11/2025."
+        self.assertNotIn('prazo_fatal', pre_extract(ProcessoJuridicoSchema, ambiguous))
+        self.assertEqual(pre_extract(SupportRequestSchema, INTIMACAO), {})
+
+    def test_partial_schema_keeps_only_missing_fields(self):
+        known = frozenset(pre_extract(ProcessoJuridicoSchema, INTIMACAO))
+        partial = partial_schema(ProcessoJuridicoSchema, known)
+        self.assertEqual(set(partial.model_fields),
+                         {'confidence_score', 'resumo_movimentacao', 'sugestao_proximo_passo'})
+        self.assertIs(partial_schema(ProcessoJuridicoSchema, known), partial)
+        with self.assertRaises(ValidationError):
+            partial.model_validate({'confidence_score': 150, 'resumo_movimentacao': 'x',
+                                    'sugestao_proximo_passo': 'y'})
+        self.assertIsNone(partial_schema(ProcessoJuridicoSchema, frozenset(ProcessoJuridicoSchema.model_fields)))
+
+
+@mock.patch('extraction.metrics.get_redis_client', return_value=None)
+class RepairTests(SimpleTestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_fixes_fences_trailing_commas_and_types(self, _):
+        raw = (
+            "Segue o JSON:\n```json\n"
+            '{"document_type": "service order", "confidence_score": "95%", "customer_name": "ACME",'
+            ' "service_description": "Instalação", "priority": "high", "target_sla_days": 7.0,'
+            ' "delivery_date": "03/11/2025", "contact_phone": "1199999-0000",}\n```'
+        )
+        result = validate_with_repair(compile_schema(ServiceOrderSchema), raw)
+
+        self.assertEqual(
+            (result["document_type"], result["confidence_score"], result["priority"],
+             result["target_sla_days"], result["delivery_date"]),
+            ("SERVICE_ORDER", 95, "HIGH", 7, "2025-11-03"),
+        )
+        self.assertEqual(metrics.snapshot()['process']['repair_roundtrip_avoided'], 1)
+
+    def test_unfixable_output_raises_original_error(self, _):
+        with self.assertRaises(ValidationError):
+            validate_with_repair(compile_schema(SupportRequestSchema), '{"document_type": "SUPPORT_REQUEST"}')
+        self.assertNotIn('repair_roundtrip_avoided', metrics.snapshot()['process'])
+        self.assertIsNone(repair("não é json", SupportRequestSchema))
+        self.assertIs(repair('{"is_critical": "sim"}', SupportRequestSchema)["is_critical"], True)
+
+    def test_sync_wrapper_skips_reprompt_when_repair_succeeds(self, _):
+        response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(
+            content="```json\n" + SUPPORT_JSON.replace('"confidence_score": 90', '"confidence_score": "90%"') + "\n```"
+        ))])
+        with mock.patch('extraction.ai_wrapper.client') as client:
+            client.chat.completions.create.return_value = response
+            result = extract_fields_from_text("Chamado", SupportRequestSchema, "Extraia.")
+
+        self.assertEqual(result["confidence_score"], 90)
+        client.chat.completions.create.assert_called_once()
+
+
+class UnsupportedFormatError(Exception):
+    status_code = 400
+
+
+@mock.patch('extraction.metrics.get_redis_client', return_value=None)
+class StrictSchemaTests(SimpleTestCase):
+
+    def setUp(self):
+        strict_schema._unsupported_models.clear()
+        self.addCleanup(strict_schema._unsupported_models.clear)
+
+    def test_converts_pydantic_schema_to_strict_subset(self, _):
+        schema = strict_json_schema(ProcessoJuridicoSchema)
+
+        self.assertFalse(schema["additionalProperties"])
+        self.assertEqual(schema["required"], list(ProcessoJuridicoSchema.model_fields))
+        self.assertEqual(schema["properties"]["document_type"]["enum"], ["MOVIMENTACAO_PROCESSUAL"])
+        score = schema["properties"]["confidence_score"]
+        self.assertNotIn("maximum", score)
+        self.assertIn("Entre 0 e 100.", score["description"])
+        prazo = schema["properties"]["prazo_fatal"]
+        self.assertEqual(prazo["anyOf"][1], {"type": "null"})
+        self.assertNotIn("format", prazo["anyOf"][0])
+        self.assertNotIn("default", prazo)
+
+    def test_strict_mode_only_for_supported_models(self, _):
+        compiled = compile_schema(SupportRequestSchema)
+        prompt, response_format = strict_schema.request_options(compiled, "gpt-4o-mini")
+        self.assertEqual(response_format["type"], "json_schema")
+        self.assertTrue(response_format["json_schema"]["strict"])
+        self.assertNotIn("SCHEMA JSON", prompt)
+        self.assertEqual(strict_schema.request_options(compiled, "gpt-3.5-turbo"),
+                         (compiled.system_prompt, strict_schema.JSON_OBJECT))
+
+    def test_falls_back_to_json_object_when_api_rejects_schema(self, _):
+        response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=SUPPORT_JSON))])
+        with mock.patch('extraction.ai_wrapper.client') as client:
+            client.chat.completions.create.side_effect = [
+                UnsupportedFormatError("Invalid parameter: 'response_format' of type 'json_schema' is not supported"),
+                response,
+            ]
+            result = extract_fields_from_text("Chamado", SupportRequestSchema, "Extraia.", models=("gpt-4o-2024-05-13",))
+
+        self.assertEqual(result["system_affected"], "CRM")
+        formats = [c.kwargs["response_format"]["type"] for c in client.chat.completions.create.call_args_list]
+        self.assertEqual(formats, ["json_schema", "json_object"])
+        self.assertFalse(strict_schema.supports_strict("gpt-4o-2024-05-13"))
+
+
+@mock.patch('extraction.metrics.get_redis_client', return_value=None)
+class PackingTests(TestCase):
+
+    def setUp(self):
+        invalidate()
+        metrics.reset()
+        user = get_user_model().objects.create_user(username='pacote', password='x')
+        profile = ExtractionProfile.objects.create(
+            user=user, name="Suporte", system_prompt_template="Extraia o chamado.",
+            pydantic_schema_name="SupportRequestSchema",
+        )
+        self.compiled = get_compiled_profile(profile, 'gpt-3.5-turbo')
+
+    def _request(self, text, instructions="Extraia o chamado."):
+        return ExtractionRequest(text=text, compiled=self.compiled, instructions=instructions)
+
+    def test_plans_packs_of_short_emails_with_same_profile(self, _):
+        requests = [self._request(f"Chamado {i}") for i in range(5)]
+        requests.append(self._request("Chamado longo. " * 200))
+        requests.append(self._request("Outro dia", instructions="Instruções de outro dia."))
+
+        packs, singles = plan_packs(requests, 'gpt-3.5-turbo', size=3, max_email_tokens=50)
+
+        self.assertEqual(packs, [[0, 1, 2], [3, 4]])
+        self.assertEqual(singles, [5, 6])
+
+    def test_invalid_or_missing_items_fall_back_to_single_extraction(self, _):
+        packed = json.dumps({"items": [
+            {"id": "e1", "data": json.loads(SUPPORT_JSON)},
+            {"id": "e2", "data": {"document_type": "SUPPORT_REQUEST"}},
+        ]})
+        client = FakeAsyncOpenAI(outputs=[packed], delay=0)
+        with self.settings(EXTRACTION_PACK_SIZE=8):
+            results = run_extractions([self._request(f"Chamado {i}") for i in range(3)], client=client,
+                                      limiter=LocalTokenBucket(0, 0), concurrency=1, pack=True)
+
+        self.assertTrue(all(r["system_affected"] == "CRM" for r in results))
+        self.assertEqual(client.calls, 3)  # 1 pacote + 2 avulsos (e2 inválido, e3 ausente)
+        counters = metrics.snapshot()['process']
+        self.assertEqual((counters['pack_emails'], counters['pack_fallback']), (3, 2))
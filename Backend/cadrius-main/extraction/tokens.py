@@ -0,0 +1,74 @@
+"""
+Estimativa de tokens para prompts da extração.
+
+Usa o `tiktoken` (requirements.txt) para a contagem exata dos modelos OpenAI.
+Sem o pacote, ou sem o arquivo BPE do encoding (baixado na primeira vez;
+em ambientes sem rede, pré-carregue TIKTOKEN_CACHE_DIR), cai numa heurística
+de ~4 caracteres por token, e isso é avisado no log.
+"""
+import importlib.util
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+
+
+def check_tokenizer():
+    """Chamado na inicialização do app: avisa uma vez se a contagem vai cair na heurística."""
+    if importlib.util.find_spec('tiktoken') is None:
+        logger.warning(
+            f"Pacote 'tiktoken' não instalado: orçamentos de tokens (max_input_tokens) e relatórios "
+            f"usam a heurística de {CHARS_PER_TOKEN} caracteres por token."
+        )
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        # lru_cache: o aviso sai uma vez por modelo
+        logger.warning(
+            f"tiktoken: encoding de '{model}' indisponível ({e}); usando a heurística de {CHARS_PER_TOKEN} caracteres por token."
+        )
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+def head_tail_window(text: str, max_tokens: int, model: str, head_ratio: float, marker: str) -> str:
+    """
+    Corta o texto para caber em `max_tokens`, mantendo o início (head_ratio do
+    orçamento) e o fim, com `marker` no lugar do trecho removido.
+    """
+    if max_tokens <= 0 or count_tokens(text, model) <= max_tokens:
+        return text
+    budget = max(0, max_tokens - count_tokens(marker, model))
+    head_budget = int(budget * head_ratio)
+    tail_budget = budget - head_budget
+
+    encoding = _encoding(model)
+    if encoding is None:
+        head = text[:head_budget * CHARS_PER_TOKEN]
+        tail = text[len(text) - tail_budget * CHARS_PER_TOKEN:] if tail_budget else ''
+    else:
+        tokens = encoding.encode(text)
+        head = encoding.decode(tokens[:head_budget])
+        tail = encoding.decode(tokens[len(tokens) - tail_budget:]) if tail_budget else ''
+    return f"{head.rstrip()}{marker}{tail.lstrip()}"
@@ -1,3 +1,21 @@
-from django.shortcuts import render
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from extraction import cascade, metrics
+
+
+class ExtractionMetricsView(APIView):
+    """
+    Contadores da camada de extração (acertos/erros do cache de resultados) e,
+    em 'cascade', o resumo por modelo da cascata (taxa de sucesso, latência,
+    tokens e custo estimado). Os números são globais (todos os usuários), por isso só para administradores.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        snapshot = metrics.snapshot()
+        snapshot['cascade'] = cascade.tier_summary(
+            snapshot['cluster'] if snapshot['cluster'] is not None else snapshot['process']
+        )
+        return Response(snapshot)
@@ -0,0 +1,278 @@
+"""
+Entrega em lote (Batch API da OpenAI) para perfis com delivery_mode=BATCH.
+
+O process_email prepara o email normalmente (regra, perfil, cache) e, em vez
+de chamar a IA, grava um ExtractionBatchItem. O Schedule deste módulo:
+
+1. consulta os lotes em andamento; ao concluírem, baixa o JSONL de saída,
+   valida cada resposta com o schema do perfil e grava o `extracted_data`
+   (mesma finalização do process_email: cache, status e integrações);
+   respostas que não passam na validação voltam para o próximo lote com a
+   correção anexada ao prompt, até MAX_RETRY_ATTEMPTS, como no caminho síncrono;
+   itens de lotes expirados, com falha ou cancelados voltam para a fila;
+2. junta os itens pendentes em um arquivo JSONL e cria um novo lote quando há
+   EXTRACTION_BATCH_MIN_ITEMS itens ou o mais antigo passou de
+   EXTRACTION_BATCH_MAX_WAIT_SECONDS.
+
+O cliente é injetável (`client=`), para testes contra um fake local dos
+endpoints de arquivos e lotes.
+"""
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django_q.models import Schedule
+from pydantic import ValidationError
+
+from extraction import strict_schema
+from extraction.ai_wrapper import AI_MODEL, MAX_RETRY_ATTEMPTS, validation_feedback
+from extraction.models import ExtractionBatchItem, ExtractionBatchJob
+from extraction.registry import get_compiled_profile, get_partial_profile
+from extraction.repair import validate_with_repair
+from tasks.tasks import ExtractionJob, finish_extraction, store_extraction
+
+logger = logging.getLogger(__name__)
+
+BATCH_SCHEDULE_NAME = 'Extração - Batch API'
+BATCH_FUNC = 'tasks.batch.run_extraction_batches'
+ENDPOINT = '/v1/chat/completions'
+# lote encerrado pela OpenAI sem processar tudo: os itens sem resposta voltam para a fila
+UNPROCESSED_STATUSES = {
+    ExtractionBatchJob.Status.EXPIRED, ExtractionBatchJob.Status.FAILED, ExtractionBatchJob.Status.CANCELLED,
+}
+
+
+def get_batch_client():
+    from extraction.ai_wrapper import client
+    return client
+
+
+def ensure_batch_schedule():
+    """Cria (uma vez) o Schedule que envia e consulta os lotes."""
+    schedule, _ = Schedule.objects.get_or_create(
+        name=BATCH_SCHEDULE_NAME,
+        defaults={
+            'func': BATCH_FUNC,
+            'schedule_type': Schedule.MINUTES,
+            'minutes': settings.EXTRACTION_BATCH_POLL_MINUTES,
+            'repeats': -1,
+        },
+    )
+    return schedule
+
+
+def _request_line(item, compiled, model):
+    system_prompt, response_format = strict_schema.request_options(compiled.compiled_schema, model)
+    return {
+        "custom_id": item.custom_id,
+        "method": "POST",
+        "url": ENDPOINT,
+        "body": {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": item.user_prompt},
+            ],
+            "response_format": response_format,
+        },
+    }
+
+
+def _llm_profile(item, model):
+    """Perfil (parcial, se o fast path preencheu campos) usado na requisição do item."""
+    compiled = get_compiled_profile(item.profile, model)
+    if compiled is None or not item.prefilled:
+        return compiled, compiled
+    return compiled, get_partial_profile(compiled, frozenset(item.prefilled), model) or compiled
+
+
+def _finish_item(item, extracted_data):
+    compiled = get_compiled_profile(item.profile, AI_MODEL)
+    if item.rule is None and extracted_data is not None:
+        logger.error(f"Item {item.pk} da Batch API: regra apagada durante o lote; email {item.email_id} vai para revisão.")
+        extracted_data = None
+    job = ExtractionJob(email=item.email, rule=item.rule, profile=item.profile, compiled=compiled,
+                        instructions='', text='', cache_key=item.cache_key)
+    store_extraction(job, extracted_data)
+    finish_extraction(job, extracted_data)
+
+
+def _requeue(item, user_prompt, attempt):
+    ExtractionBatchItem.objects.create(
+        email=item.email, rule=item.rule, profile=item.profile,
+        user_prompt=user_prompt, attempt=attempt, cache_key=item.cache_key,
+        prefilled=item.prefilled,
+    )
+
+
+def submit_pending_batches(client=None, now=None) -> list:
+    """Cria lotes com os itens pendentes, se houver volume ou espera suficiente."""
+    now = now or timezone.now()
+    pending = ExtractionBatchItem.objects.filter(job__isnull=True).select_related('profile', 'email')
+    oldest = pending.order_by('created_at').first()
+    if oldest is None:
+        return []
+    max_wait = timedelta(seconds=settings.EXTRACTION_BATCH_MAX_WAIT_SECONDS)
+    if pending.count() < settings.EXTRACTION_BATCH_MIN_ITEMS and oldest.created_at > now - max_wait:
+        return []
+
+    client = client or get_batch_client()
+    jobs = []
+    while True:
+        items = list(pending.order_by('id')[:settings.EXTRACTION_BATCH_MAX_ITEMS])
+        if not items:
+            break
+
+        lines, submitted = [], []
+        for item in items:
+            compiled, llm_compiled = _llm_profile(item, AI_MODEL)
+            if compiled is None:
+                # schema removido do SCHEMA_MAP depois do enfileiramento
+                item.delete()
+                _finish_item(item, None)
+                continue
+            lines.append(_request_line(item, llm_compiled, AI_MODEL))
+            submitted.append(item.pk)
+        if not lines:
+            continue
+
+        payload = "\n".join(json.dumps(line, ensure_ascii=False) for line in lines).encode('utf-8')
+        input_file = client.files.create(
+            file=(f"cadrius-extraction-{now:%Y%m%d%H%M%S}.jsonl", payload), purpose="batch",
+        )
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=ENDPOINT,
+            completion_window=settings.EXTRACTION_BATCH_COMPLETION_WINDOW,
+        )
+        job = ExtractionBatchJob.objects.create(
+            openai_batch_id=batch.id, input_file_id=input_file.id, status=batch.status,
+            model=AI_MODEL, request_count=len(lines),
+        )
+        ExtractionBatchItem.objects.filter(pk__in=submitted).update(job=job)
+        logger.info(f"Lote {batch.id} enviado à Batch API com {len(lines)} extrações.")
+        jobs.append(job)
+    return jobs
+
+
+def _read_jsonl(client, file_id):
+    if not file_id:
+        return []
+    content = client.files.content(file_id)
+    return [json.loads(line) for line in content.text.splitlines() if line.strip()]
+
+
+def _response_content(line):
+    """Conteúdo da resposta do chat, ou None para erro/linha ausente."""
+    if not line or line.get("error"):
+        return None
+    response = line.get("response") or {}
+    if response.get("status_code") != 200:
+        return None
+    try:
+        return response["body"]["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def _apply_item(job, item, line) -> str:
+    """Aplica a resposta de um item; devolve a chave do contador correspondente."""
+    if line is None and job.status in UNPROCESSED_STATUSES:
+        if job.status == ExtractionBatchJob.Status.EXPIRED:
+            # não processado dentro da janela: vai para o próximo lote sem contar tentativa
+            _requeue(item, item.user_prompt, item.attempt)
+            return 'requeued'
+        # lote falhou ou foi cancelado: conta tentativa, para não reenviar para sempre
+        if item.attempt + 1 < MAX_RETRY_ATTEMPTS:
+            _requeue(item, item.user_prompt, item.attempt + 1)
+            return 'requeued'
+        logger.error(f"Item {item.pk} (email {item.email_id}) sem resposta após {MAX_RETRY_ATTEMPTS} lotes ({job.status}).")
+        _finish_item(item, None)
+        return 'failed'
+
+    content = _response_content(line)
+    compiled, llm_compiled = _llm_profile(item, job.model)
+    if content is None or compiled is None:
+        logger.error(f"Item {item.pk} (email {item.email_id}) sem resposta válida no lote {job.openai_batch_id}.")
+        _finish_item(item, None)
+        return 'failed'
+
+    try:
+        extracted_data = validate_with_repair(llm_compiled.compiled_schema, content)
+        if item.prefilled:
+            extracted_data = compiled.compiled_schema.validate_python({**extracted_data, **item.prefilled})
+    except ValidationError as e:
+        logger.error(f"Tentativa {item.attempt + 1} (lote {job.openai_batch_id}): Falha na validação Pydantic. Erro: {e}")
+        if item.attempt + 1 < MAX_RETRY_ATTEMPTS:
+            _requeue(item, item.user_prompt + validation_feedback(e), item.attempt + 1)
+            return 'retried'
+        _finish_item(item, None)
+        return 'failed'
+
+    _finish_item(item, extracted_data)
+    return 'extracted'
+
+
+def _apply_results(job, client):
+    """
+    Aplica os itens ainda não aplicados do lote. Cada item é aplicado e marcado
+    (applied_at) na mesma transação: se algo quebrar no meio, a próxima consulta
+    retoma dos itens que faltam.
+    """
+    outputs = {}
+    for file_id in (job.output_file_id, job.error_file_id):
+        for line in _read_jsonl(client, file_id):
+            outputs[line.get("custom_id")] = line
+
+    counts = {'extracted': 0, 'retried': 0, 'failed': 0, 'requeued': 0}
+    items = job.items.filter(applied_at__isnull=True).select_related('email__mailbox', 'profile', 'rule')
+    for item in items.order_by('id'):
+        with transaction.atomic():
+            counts[_apply_item(job, item, outputs.get(item.custom_id))] += 1
+            item.applied_at = timezone.now()
+            item.save(update_fields=['applied_at'])
+    return counts
+
+
+def poll_extraction_batches(client=None, now=None) -> list:
+    """
+    Atualiza os lotes em andamento e aplica os resultados dos que terminaram.
+    Um lote só sai da consulta quando todos os itens foram aplicados (applied_at).
+    """
+    now = now or timezone.now()
+    results = []
+    open_jobs = ExtractionBatchJob.objects.filter(applied_at__isnull=True).order_by('id')
+    for job in open_jobs:
+        client = client or get_batch_client()
+        if job.status not in ExtractionBatchJob.FINAL_STATUSES:
+            batch = client.batches.retrieve(job.openai_batch_id)
+            job.status = batch.status
+            job.output_file_id = batch.output_file_id
+            job.error_file_id = batch.error_file_id
+            if job.status not in ExtractionBatchJob.FINAL_STATUSES:
+                job.save(update_fields=['status', 'output_file_id', 'error_file_id'])
+                continue
+            job.completed_at = now
+            job.save(update_fields=['status', 'output_file_id', 'error_file_id', 'completed_at'])
+
+        try:
+            counts = _apply_results(job, client)
+        except Exception as e:
+            logger.exception(f"Lote {job.openai_batch_id}: falha ao aplicar os resultados; os itens restantes ficam para a próxima consulta.")
+            results.append({'batch': job.openai_batch_id, 'status': job.status, 'error': str(e)})
+            continue
+        job.applied_at = timezone.now()
+        job.save(update_fields=['applied_at'])
+        logger.info(f"Lote {job.openai_batch_id} finalizado ({job.status}): {counts}")
+        results.append({'batch': job.openai_batch_id, 'status': job.status, **counts})
+    return results
+
+
+def run_extraction_batches():
+    """Tarefa do Schedule: primeiro aplica os lotes concluídos (que podem reenfileirar itens), depois envia."""
+    finished = poll_extraction_batches()
+    submitted = submit_pending_batches()
+    return {'finished': finished, 'submitted': [job.openai_batch_id for job in submitted]}
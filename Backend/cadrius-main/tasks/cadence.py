@@ -0,0 +1,102 @@
+"""
+Cadência adaptativa de polling por MailBox.
+
+Depois de cada fetch a taxa de chegada (emails/hora) é atualizada por uma
+média móvel exponencial ponderada pelo tempo decorrido, e o intervalo da
+próxima busca passa a ser o tempo esperado para chegar ~IMAP_POLL_TARGET_MESSAGES
+emails, limitado a [IMAP_POLL_MIN_SECONDS, IMAP_POLL_MAX_SECONDS].
+
+Ex. (alvo 1 email/poll): 500 emails/h -> 30s (piso); 12 emails/h -> 5 min;
+caixa parada -> 1h (teto). `MailBox.poll_interval_override` fixa o intervalo.
+
+O Schedule do Django-Q da MailBox (quando existe) é reescrito com o novo
+intervalo e o `next_run`; no modo orquestrador vale o `next_fetch_at`. O
+orquestrador roda num Schedule de 1 minuto (a menor resolução do Django-Q),
+então nesse modo o piso real é ORCHESTRATOR_TICK_SECONDS, não
+IMAP_POLL_MIN_SECONDS.
+
+A taxa de chegada conta as mensagens novas da pasta (pelo UIDNEXT), não só
+os candidatos do filtro no servidor (`server_side_filter`).
+"""
+import logging
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django_q.models import Schedule
+
+from emails.models import MailBox
+
+logger = logging.getLogger(__name__)
+
+ORCHESTRATOR_TICK_SECONDS = 60
+
+
+def compute_interval(rate_per_hour: float, override=None) -> int:
+    """
+    Intervalo de polling (segundos) para a taxa de chegada informada. Piso de
+    IMAP_POLL_MIN_SECONDS com Schedule por caixa; no modo orquestrador, o tick
+    (ORCHESTRATOR_TICK_SECONDS), que é o mais rápido que uma caixa é buscada.
+    """
+    tick = ORCHESTRATOR_TICK_SECONDS if settings.IMAP_FETCH_ORCHESTRATOR else 0
+    if override:
+        return max(int(override), tick)
+    floor, ceiling = max(settings.IMAP_POLL_MIN_SECONDS, tick), settings.IMAP_POLL_MAX_SECONDS
+    if rate_per_hour <= 0:
+        return ceiling
+    interval = 3600.0 * settings.IMAP_POLL_TARGET_MESSAGES / rate_per_hour
+    return int(min(max(interval, floor), ceiling))
+
+
+def update_arrival_rate(rate_per_hour: float, arrivals: int, elapsed_seconds: float) -> float:
+    """
+    EWMA com peso proporcional ao tempo decorrido: uma janela de
+    IMAP_ARRIVAL_RATE_WINDOW_SECONDS pesa ~63% na nova estimativa, seja qual
+    for o número de polls nela.
+    """
+    if elapsed_seconds <= 0:
+        return rate_per_hour
+    observed = arrivals * 3600.0 / elapsed_seconds
+    alpha = 1.0 - math.exp(-elapsed_seconds / settings.IMAP_ARRIVAL_RATE_WINDOW_SECONDS)
+    return rate_per_hour + alpha * (observed - rate_per_hour)
+
+
+def _sync_schedule(mailbox: MailBox, interval: int):
+    """Reescreve o Schedule de fetch da MailBox (minutos inteiros, mínimo 1) e o próximo disparo."""
+    minutes = max(1, round(interval / 60))
+    updated = Schedule.objects.filter(
+        func='tasks.tasks.fetch_emails',
+        args=f'{mailbox.id}',
+    ).update(minutes=minutes, next_run=mailbox.next_fetch_at)
+    if updated:
+        logger.debug("Schedule da MailBox %s: a cada %s min, próximo em %s.",
+                     mailbox.id, minutes, mailbox.next_fetch_at)
+
+
+def record_fetch(mailbox: MailBox, arrivals: int, previous_fetch_at=None, now=None) -> int:
+    """
+    Registra o resultado de um fetch (quantas mensagens chegaram à pasta desde
+    `previous_fetch_at`, filtradas ou não) e agenda a próxima busca. Retorna o intervalo em segundos.
+    """
+    now = now or timezone.now()
+    if previous_fetch_at is None:
+        # sem histórico: parte da taxa que dá a cadência padrão e deixa a EWMA ajustar
+        mailbox.arrival_rate_per_hour = (
+            3600.0 * settings.IMAP_POLL_TARGET_MESSAGES / settings.IMAP_FETCH_INTERVAL_SECONDS
+        )
+    else:
+        elapsed = (now - previous_fetch_at).total_seconds()
+        mailbox.arrival_rate_per_hour = update_arrival_rate(mailbox.arrival_rate_per_hour, arrivals, elapsed)
+
+    interval = compute_interval(mailbox.arrival_rate_per_hour, mailbox.poll_interval_override)
+    if interval != mailbox.poll_interval_seconds:
+        logger.info(
+            "MailBox %s: %.1f emails/h -> polling a cada %ss (antes %ss).",
+            mailbox.id, mailbox.arrival_rate_per_hour, interval, mailbox.poll_interval_seconds,
+        )
+    mailbox.poll_interval_seconds = interval
+    mailbox.next_fetch_at = now + timedelta(seconds=interval)
+    mailbox.save(update_fields=['arrival_rate_per_hour', 'poll_interval_seconds', 'next_fetch_at'])
+    _sync_schedule(mailbox, interval)
+    return interval
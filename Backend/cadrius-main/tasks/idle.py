@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django_q.models import Schedule
+
+from emails.models import MailBox
+from tasks.tasks import (
+    mailbox_connection_params, connect_imap, ingest_uids, load_sync_state,
+    server_filter_criteria, search_uids, touch_mailbox_checkpoint,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# RFC 2177: o servidor pode derrubar um IDLE após 30 min; renovamos antes disso.
+DEFAULT_IDLE_REFRESH_SECONDS = 25 * 60
+# Intervalo máximo bloqueado em idle_check (define a latência de parada do worker)
+IDLE_CHECK_SECONDS = 30
+# Backoff de reconexão (segundos)
+RECONNECT_MIN_SECONDS = 5
+RECONNECT_MAX_SECONDS = 300
+FETCH_FUNC = 'tasks.tasks.fetch_emails'
+
+
+def set_polling_schedules(mailbox_ids, enabled: bool) -> int:
+    """
+    Liga/desliga os Schedules de fetch_emails das MailBoxes (repeats=0 pausa no
+    Django-Q). Caixas com worker IDLE não são também buscadas pelo polling; a
+    cadência adaptativa só reescreve minutes/next_run, então não os religa.
+    """
+    return Schedule.objects.filter(
+        func=FETCH_FUNC, args__in=[str(mailbox_id) for mailbox_id in mailbox_ids],
+    ).update(repeats=-1 if enabled else 0)
+
+
+def _is_exists_response(response) -> bool:
+    """idle_check devolve tuplas como (3, b'EXISTS')."""
+    try:
+        return len(response) >= 2 and response[1] in (b'EXISTS', 'EXISTS')
+    except TypeError:
+        return False
+
+
+class MailBoxIdleWorker(threading.Thread):
+    """
+    Mantém uma sessão IMAP IDLE aberta para uma MailBox e ingere as mensagens
+    novas assim que o servidor anuncia EXISTS.
+
+    - Reconecta com backoff exponencial em qualquer erro de rede/IMAP.
+    - Renova o IDLE periodicamente (idle_refresh).
+    - Servidores sem a capability IDLE caem para polling (poll_interval).
+
+    `client_factory(params)` permite injetar um cliente IMAP local/fake
+    (por padrão usa `connect_imap`, que já aplica os overrides de ambiente).
+    """
+
+    def __init__(self, mailbox_id, stop_event=None, client_factory=None,
+                 idle_refresh=None, poll_interval=None):
+        super().__init__(name=f"imap-idle-{mailbox_id}", daemon=True)
+        self.mailbox_id = mailbox_id
+        self.stop_event = stop_event or threading.Event()
+        self.client_factory = client_factory or connect_imap
+        self.idle_refresh = idle_refresh or getattr(settings, "IMAP_IDLE_REFRESH_SECONDS", DEFAULT_IDLE_REFRESH_SECONDS)
+        self.poll_interval = poll_interval or getattr(settings, "IMAP_IDLE_POLL_SECONDS", 60)
+        self.last_uid = None
+        self.sync_state = None
+        self._backoff = RECONNECT_MIN_SECONDS
+
+    def stop(self):
+        self.stop_event.set()
+
+    # ----------------- Loop principal -----------------
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.run_session()
+                self._backoff = RECONNECT_MIN_SECONDS
+            except MailBox.DoesNotExist:
+                logger.warning("[imap_idle] MailBox %s não existe mais; encerrando worker.", self.mailbox_id)
+                return
+            except Exception as e:
+                logger.warning(
+                    "[imap_idle] Sessão da MailBox %s caiu (%s). Reconectando em %ss.",
+                    self.mailbox_id, e, self._backoff,
+                )
+                self.stop_event.wait(self._backoff)
+                self._backoff = min(self._backoff * 2, RECONNECT_MAX_SECONDS)
+            finally:
+                close_old_connections()
+
+    def run_session(self):
+        """Uma sessão completa: conecta, faz catch-up e fica em IDLE até cair ou parar."""
+        close_old_connections()
+        mailbox = MailBox.objects.get(id=self.mailbox_id, is_active=True)
+        params = mailbox_connection_params(mailbox)
+        if not params["host"] or not params["username"] or not params["password"]:
+            raise ValueError(f"MailBox {self.mailbox_id} incompleta: host/username/password ausentes.")
+
+        server = self.client_factory(params)
+        try:
+            select_info = server.select_folder(params["folder"], readonly=True)
+
+            # checkpoint persistido (o mesmo do polling); zerado se o UIDVALIDITY mudou
+            self.sync_state = load_sync_state(mailbox, params["folder"], select_info)
+            if self.sync_state.last_uid is None:
+                # Sem checkpoint: começa do fim da pasta.
+                uidnext = select_info.get(b'UIDNEXT') if select_info else None
+                if uidnext:
+                    baseline = int(uidnext) - 1
+                else:
+                    all_uids = server.search(['ALL'])
+                    baseline = max(int(u) for u in all_uids) if all_uids else 0
+                self.sync_state.last_uid = baseline
+                self.sync_state.save(update_fields=["last_uid", "updated_at"])
+            self.last_uid = self.sync_state.last_uid
+
+            # catch-up do que chegou enquanto estávamos desconectados
+            self._drain(server, mailbox, params["host"])
+
+            if server.has_capability('IDLE'):
+                logger.info("[imap_idle] MailBox %s em IDLE (pasta %s).", self.mailbox_id, params["folder"])
+                self._idle_loop(server, mailbox, params["host"])
+            else:
+                logger.info("[imap_idle] Servidor sem IDLE; MailBox %s em polling a cada %ss.",
+                            self.mailbox_id, self.poll_interval)
+                self._poll_loop(server, mailbox, params["host"])
+        finally:
+            try:
+                server.logout()
+            except Exception:
+                pass
+
+    def _idle_loop(self, server, mailbox, host):
+        while not self.stop_event.is_set():
+            has_new = False
+            started = time.monotonic()
+            server.idle()
+            try:
+                while not self.stop_event.is_set():
+                    remaining = self.idle_refresh - (time.monotonic() - started)
+                    if remaining <= 0:
+                        break
+                    responses = server.idle_check(timeout=min(IDLE_CHECK_SECONDS, remaining))
+                    if any(_is_exists_response(r) for r in responses or []):
+                        has_new = True
+                        break
+            finally:
+                server.idle_done()
+
+            if has_new:
+                self._drain(server, mailbox, host)
+            else:
+                # renovação periódica do IDLE: mantém a conexão viva
+                server.noop()
+
+    def _poll_loop(self, server, mailbox, host):
+        while not self.stop_event.wait(self.poll_interval):
+            server.noop()
+            self._drain(server, mailbox, host)
+
+    # ----------------- Ingestão -----------------
+    def _drain(self, server, mailbox, host) -> int:
+        """Busca UIDs acima do checkpoint e alimenta o caminho de parse/persistência."""
+        last_uid = int(self.sync_state.last_uid)
+        uid_range = ['UID', f'{last_uid + 1}:*']
+        # "n:*" sempre devolve ao menos a última mensagem, mesmo com UID < n
+        new_uids = sorted(u for u in server.search(uid_range) if int(u) > last_uid)
+        if not new_uids:
+            return 0
+
+        uids = new_uids
+        filter_criteria = server_filter_criteria(server, mailbox)
+        if filter_criteria:
+            # só os candidatos das regras, limitados ao que já vimos na busca sem filtro
+            candidates = search_uids(server, uid_range, filter_criteria)
+            uids = sorted(u for u in candidates if last_uid < int(u) <= int(new_uids[-1]))
+
+        close_old_connections()
+        created, processed = ingest_uids(server, mailbox, uids, host, self.sync_state)
+        if len(processed) == len(uids):
+            # não-candidatos nunca são baixados: o checkpoint pula a faixa inteira
+            touch_mailbox_checkpoint(mailbox, [int(new_uids[-1])], self.sync_state)
+        self.last_uid = self.sync_state.last_uid
+        logger.info("[imap_idle] MailBox %s: %s UIDs novos, %s baixados, %s emails criados.",
+                    self.mailbox_id, len(new_uids), len(uids), created)
+        return created
+
+
+class IdleSupervisor:
+    """
+    Mantém um MailBoxIdleWorker por MailBox ativa, iniciando workers para
+    caixas novas e parando os de caixas desativadas/removidas. Enquanto uma
+    caixa tem worker, o Schedule de polling dela fica pausado; ao encerrar o
+    daemon, o polling volta.
+    """
+
+    def __init__(self, mailbox_ids=None, reload_interval=60, worker_kwargs=None):
+        self.mailbox_ids = set(mailbox_ids) if mailbox_ids else None
+        self.reload_interval = reload_interval
+        self.worker_kwargs = worker_kwargs or {}
+        self.stop_event = threading.Event()
+        self.workers = {}
+
+    def _active_mailbox_ids(self):
+        qs = MailBox.objects.filter(is_active=True)
+        if self.mailbox_ids is not None:
+            qs = qs.filter(id__in=self.mailbox_ids)
+        return set(qs.values_list('id', flat=True))
+
+    def reconcile(self):
+        active = self._active_mailbox_ids()
+
+        removed = []
+        for mailbox_id in list(self.workers):
+            worker = self.workers[mailbox_id]
+            if mailbox_id not in active or not worker.is_alive():
+                worker.stop()
+                del self.workers[mailbox_id]
+                if mailbox_id not in active:
+                    removed.append(mailbox_id)
+        if removed:
+            set_polling_schedules(removed, True)
+
+        started = active - set(self.workers)
+        for mailbox_id in started:
+            worker = MailBoxIdleWorker(mailbox_id, **self.worker_kwargs)
+            worker.start()
+            self.workers[mailbox_id] = worker
+        if started:
+            paused = set_polling_schedules(started, False)
+            if paused:
+                logger.info("[imap_idle] %s Schedules de polling pausados (MailBoxes em IDLE).", paused)
+
+    def run_forever(self):
+        logger.info("[imap_idle] Supervisor iniciado.")
+        while not self.stop_event.is_set():
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.exception("[imap_idle] Falha ao recarregar MailBoxes: %s", e)
+            finally:
+                close_old_connections()
+            self.stop_event.wait(self.reload_interval)
+        self.shutdown()
+
+    def shutdown(self, timeout=10):
+        self.stop_event.set()
+        for worker in self.workers.values():
+            worker.stop()
+        for worker in self.workers.values():
+            worker.join(timeout=timeout)
+        if self.workers:
+            set_polling_schedules(self.workers, True)
+        self.workers.clear()
+        logger.info("[imap_idle] Supervisor encerrado.")
@@ -0,0 +1,200 @@
+"""
+Fetch IMAP em duas fases (header-first), sem baixar anexos.
+
+Fase 1: ENVELOPE + BODYSTRUCTURE + cabeçalhos (sem os de rastreio) + RFC822.SIZE
+        de todo o lote.
+Fase 2: apenas BODY.PEEK[<seção>] da parte text/plain (ou text/html) escolhida
+        pela estrutura, limitado a `max_bytes` por mensagem.
+
+O resultado é o mesmo registro produzido por tasks.mime.parse_message, então o
+caminho de persistência não muda.
+"""
+import base64
+import binascii
+import logging
+import quopri
+from collections import defaultdict
+from email import policy
+from email.parser import BytesHeaderParser
+
+from tasks.mime import SKIPPED_HEADERS, compact_headers, decode_str
+
+logger = logging.getLogger(__name__)
+
+HEADER_ITEM = f"BODY.PEEK[HEADER.FIELDS.NOT ({' '.join(h.upper() for h in SKIPPED_HEADERS)})]"
+PHASE_ONE_ITEMS = ['UID', 'ENVELOPE', 'BODYSTRUCTURE', HEADER_ITEM, 'RFC822.SIZE']
+
+
+def _text(value) -> str:
+    if isinstance(value, bytes):
+        value = value.decode("ascii", errors="replace")
+    return value or ""
+
+
+def _lower(value) -> str:
+    return _text(value).lower()
+
+
+def _params_dict(params) -> dict:
+    """(b'CHARSET', b'utf-8', b'NAME', b'x') -> {'charset': 'utf-8', 'name': 'x'}"""
+    if not isinstance(params, (tuple, list)):
+        return {}
+    it = iter(params)
+    return {_lower(k): _lower(v) for k, v in zip(it, it)}
+
+
+def _disposition(leaf) -> str:
+    # A disposição aparece nos dados de extensão, depois do tamanho/linhas/MD5.
+    for item in leaf[7:]:
+        if isinstance(item, tuple) and item and isinstance(item[0], bytes):
+            disp = _lower(item[0])
+            if disp in ("attachment", "inline"):
+                return disp
+    return ""
+
+
+def walk_structure(bodystructure, prefix=""):
+    """Gera (seção, parte) para cada parte folha do BODYSTRUCTURE."""
+    if bodystructure.is_multipart:
+        for i, part in enumerate(bodystructure[0], 1):
+            yield from walk_structure(part, f"{prefix}.{i}" if prefix else str(i))
+    else:
+        yield (prefix or "1", bodystructure)
+
+
+def choose_text_part(bodystructure):
+    """
+    Mesma preferência de tasks.mime.extract_body: text/plain que não seja
+    anexo; senão text/html; senão qualquer text/*.
+    Retorna dict(section, subtype, encoding, charset, size) ou None.
+    """
+    candidates = []
+    for section, leaf in walk_structure(bodystructure):
+        if _lower(leaf[0]) != "text":
+            continue
+        candidates.append({
+            "section": section,
+            "subtype": _lower(leaf[1]),
+            "charset": _params_dict(leaf[2]).get("charset") or "utf-8",
+            "encoding": _lower(leaf[5]) or "7bit",
+            "size": leaf[6] if isinstance(leaf[6], int) else None,
+            "attachment": _disposition(leaf) == "attachment",
+        })
+
+    for subtype in ("plain", "html"):
+        for part in candidates:
+            if part["subtype"] == subtype and not part["attachment"]:
+                return part
+    return candidates[0] if candidates else None
+
+
+def decode_part(payload: bytes, encoding: str, charset: str, truncated: bool = False) -> str:
+    if encoding == "base64":
+        compact = b"".join(payload.split())
+        if truncated:
+            compact = compact[:len(compact) - len(compact) % 4]
+        try:
+            payload = base64.b64decode(compact)
+        except (binascii.Error, ValueError):
+            payload = b""
+    elif encoding == "quoted-printable":
+        payload = quopri.decodestring(payload)
+
+    try:
+        text = payload.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        text = payload.decode("utf-8", errors="replace")
+    return text.replace("\r\n", "\n").strip()
+
+
+def _format_addresses(addresses) -> str:
+    if not addresses:
+        return ""
+    formatted = []
+    for addr in addresses:
+        if addr.mailbox and addr.host:
+            email_addr = f"{_text(addr.mailbox)}@{_text(addr.host)}"
+        else:
+            email_addr = _text(addr.mailbox or addr.host)
+        name = decode_str(addr.name)
+        formatted.append(f"{name} <{email_addr}>" if name else email_addr)
+    return ", ".join(formatted)
+
+
+def _headers(data: dict) -> dict:
+    for key, value in data.items():
+        key_b = key if isinstance(key, bytes) else str(key).encode()
+        if key_b.startswith(b"BODY[HEADER") and value:
+            return compact_headers(BytesHeaderParser(policy=policy.default).parsebytes(value))
+    return {}
+
+
+def _section_payload(data: dict, section: str):
+    prefix = f"BODY[{section}]".encode()
+    for key, value in data.items():
+        key_b = key if isinstance(key, bytes) else str(key).encode()
+        if key_b.startswith(prefix):
+            return value
+    return None
+
+
+def fetch_batch_partial(server, uids, max_bytes: int) -> list:
+    """
+    Busca um lote de UIDs em duas fases e devolve os registros na ordem de `uids`.
+    Mensagens sem parte de texto ficam com body_text vazio (nada é baixado).
+    """
+    phase_one = server.fetch(uids, PHASE_ONE_ITEMS)
+
+    records = {}
+    by_section = defaultdict(list)
+    for uid in uids:
+        data = phase_one.get(uid)
+        if not data:
+            continue
+        envelope = data.get(b'ENVELOPE')
+        if envelope is None:
+            logger.warning("UID %s sem ENVELOPE no fetch parcial.", uid)
+            continue
+
+        size = data.get(b'RFC822.SIZE')
+        message_id = decode_str(envelope.message_id).strip() or None
+        records[uid] = {
+            "uid": uid,
+            "message_id": message_id,
+            "subject": decode_str(envelope.subject),
+            "from_addr": _format_addresses(envelope.from_),
+            "to_addr": _format_addresses(envelope.to),
+            "date": envelope.date,
+            "body_text": "",
+            "headers": _headers(data),
+            "size": size,
+            "sha256": None,  # o RFC822 bruto não é baixado neste modo
+        }
+
+        structure = data.get(b'BODYSTRUCTURE')
+        part = choose_text_part(structure) if structure is not None else None
+        if part:
+            records[uid]["_part"] = part
+            by_section[part["section"]].append(uid)
+
+    # Fase 2: um FETCH por seção distinta (normalmente "1" ou "1.1" para o lote todo)
+    for section, section_uids in by_section.items():
+        item = f"BODY.PEEK[{section}]<0.{int(max_bytes)}>"
+        fetched = server.fetch(section_uids, [item])
+        for uid in section_uids:
+            record = records[uid]
+            part = record.pop("_part")
+            payload = _section_payload(fetched.get(uid) or {}, section)
+            if payload is None:
+                continue
+            truncated = part["size"] is not None and part["size"] > max_bytes
+            if truncated:
+                logger.info(
+                    "UID %s: parte de texto com %s bytes truncada em %s (IMAP_MAX_MESSAGE_BYTES).",
+                    uid, part["size"], max_bytes,
+                )
+            record["body_text"] = decode_part(payload, part["encoding"], part["charset"], truncated)
+
+    for record in records.values():
+        record.pop("_part", None)
+    return [records[uid] for uid in uids if uid in records]
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import re
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from extraction.ai_wrapper import AI_MODEL
+from extraction.async_engine import AsyncExtractionEngine, ExtractionRequest, _default_client
+from extraction.models import ExtractionProfile
+from extraction.packing import PACK_KEY
+from extraction.ratelimit import LocalTokenBucket
+from extraction.registry import get_compiled_profile
+from extraction.tokens import count_tokens
+
+SAMPLE = {
+    "document_type": "SUPPORT_REQUEST", "confidence_score": 90, "system_affected": "Portal",
+    "issue_summary": "Erro ao emitir boleto", "is_critical": False, "error_code": None,
+    "requester_email": "cliente@example.com",
+}
+
+_EMAIL_ID = re.compile(r"^EMAIL ID: (\S+)$", re.MULTILINE)
+
+
+class SimulatedOpenAI:
+    """AsyncOpenAI de mentira: latência fixa por requisição + custo por token de saída."""
+
+    def __init__(self, model, request_ms, ms_per_output_token):
+        self.model = model
+        self.request_ms = request_ms
+        self.ms_per_output_token = ms_per_output_token
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, response_format):
+        ids = _EMAIL_ID.findall(messages[1]["content"])
+        payload = {PACK_KEY: [{"id": i, "data": SAMPLE} for i in ids]} if ids else SAMPLE
+        content = json.dumps(payload, ensure_ascii=False)
+        prompt = sum(count_tokens(m["content"], self.model) for m in messages)
+        completion = count_tokens(content, self.model)
+        await asyncio.sleep((self.request_ms + completion * self.ms_per_output_token) / 1000)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion, total_tokens=prompt + completion),
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark do empacotamento de emails curtos (extraction.packing): emails/s e tokens/email, "
+        "uma requisição por email vs. pacotes. Por padrão contra uma API simulada; --live usa a OpenAI."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=200)
+        parser.add_argument('--pack-size', type=int, default=8)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--request-ms', type=float, default=400.0, help="Latência fixa simulada por requisição.")
+        parser.add_argument('--ms-per-output-token', type=float, default=10.0)
+        parser.add_argument('--rpm', type=int, default=0, help="Limite de requisições/min da conta (0 = sem limite).")
+        parser.add_argument('--tpm', type=int, default=0, help="Limite de tokens/min da conta (0 = sem limite).")
+        parser.add_argument('--model', default=AI_MODEL)
+        parser.add_argument('--live', action='store_true', help="Chamadas reais (consome a API Key).")
+
+    def handle(self, *args, **options):
+        model = options['model']
+        profile = ExtractionProfile(
+            name="bench-packing", system_prompt_template="Extraia os dados do chamado de suporte.",
+            pydantic_schema_name="SupportRequestSchema", model_cascade=[model],
+        )
+        compiled = get_compiled_profile(profile, model)
+        requests = [
+            ExtractionRequest(
+                text=f"Olá, desde hoje cedo o portal dá erro ao emitir o boleto do pedido {i}. "
+                     f"Podem verificar? Att., cliente{i}@example.com",
+                compiled=compiled, instructions=profile.system_prompt_template,
+            )
+            for i in range(options['emails'])
+        ]
+
+        self.stdout.write(f"Emails: {len(requests)} (modelo {model}, concorrência {options['concurrency']}, "
+                          f"{'API real' if options['live'] else 'API simulada'})")
+        baseline = self._measure(requests, options, pack=False)
+        packed = self._measure(requests, options, pack=True)
+        for label, result in (("um por requisição", baseline), (f"pacotes de {options['pack_size']}", packed)):
+            self.stdout.write(
+                f"  {label:<20}: {result['emails_per_sec']:8.1f} emails/s, {result['requests']:>5} requisições, "
+                f"{result['tokens_per_email']:7.1f} tokens/email, {result['failed']} falhas"
+            )
+        if baseline['tokens_per_email']:
+            saved = 100 * (1 - packed['tokens_per_email'] / baseline['tokens_per_email'])
+            speedup = packed['emails_per_sec'] / baseline['emails_per_sec'] if baseline['emails_per_sec'] else 0
+            self.stdout.write(self.style.SUCCESS(f"  tokens/email -{saved:.1f}%, vazão {speedup:.2f}x"))
+
+    def _measure(self, requests, options, pack):
+        from django.test import override_settings
+
+        simulated = None if options['live'] else SimulatedOpenAI(
+            options['model'], options['request_ms'], options['ms_per_output_token'])
+        usage = {'requests': 0, 'tokens': 0}
+
+        async def run():
+            api = simulated or _default_client()
+            create = api.chat.completions.create
+
+            async def counted(**kwargs):
+                response = await create(**kwargs)
+                usage['requests'] += 1
+                usage['tokens'] += getattr(getattr(response, 'usage', None), 'total_tokens', 0) or 0
+                return response
+
+            client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=counted)))
+            limiter = LocalTokenBucket(options['rpm'], options['tpm'])
+            engine = AsyncExtractionEngine(client, limiter, options['concurrency'], model=options['model'])
+            try:
+                return await engine.extract_many(requests, pack=pack)
+            finally:
+                if simulated is None:
+                    await api.close()
+
+        with override_settings(EXTRACTION_PACK_SIZE=options['pack_size']):
+            started = time.perf_counter()
+            results = asyncio.run(run())
+            elapsed = time.perf_counter() - started
+
+        return {
+            'emails_per_sec': len(requests) / elapsed,
+            'requests': usage['requests'],
+            'tokens_per_email': usage['tokens'] / len(requests),
+            'failed': sum(1 for r in results if not isinstance(r, dict)),
+        }
@@ -0,0 +1,78 @@
+import base64
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tasks.parsing import iter_parsed, shutdown_executor
+
+
+def synthetic_message(uid: int, attachment_bytes: int) -> bytes:
+    """Intimação multipart (texto + HTML + PDF anexo), próxima do tráfego real."""
+    text = ("Fica V. Sa. intimada da decisão proferida nos autos do processo "
+            f"{uid:07d}-12.2025.8.26.0100. Prazo de 15 dias úteis.\r\n") * 20
+    html = "<html><body>" + text.replace("\r\n", "<br>") + "</body></html>"
+    attachment = base64.encodebytes(os.urandom(attachment_bytes)).decode("ascii")
+    return (
+        f"Message-ID: <bench-{uid}@tjsp.jus.br>\r\n"
+        f"Subject: =?utf-8?q?Intima=C3=A7=C3=A3o_eletr=C3=B4nica_{uid}?=\r\n"
+        "From: =?utf-8?q?Tribunal_de_Justi=C3=A7a?= <intimacao@tjsp.jus.br>\r\n"
+        "To: escritorio@example.com\r\n"
+        "Date: Mon, 17 Nov 2025 10:00:00 -0300\r\n"
+        "MIME-Version: 1.0\r\n"
+        'Content-Type: multipart/mixed; boundary="mixed"\r\n\r\n'
+        "--mixed\r\n"
+        'Content-Type: multipart/alternative; boundary="alt"\r\n\r\n'
+        "--alt\r\nContent-Type: text/plain; charset=utf-8\r\nContent-Transfer-Encoding: 8bit\r\n\r\n"
+        f"{text}\r\n"
+        "--alt\r\nContent-Type: text/html; charset=utf-8\r\nContent-Transfer-Encoding: 8bit\r\n\r\n"
+        f"{html}\r\n"
+        "--alt--\r\n"
+        "--mixed\r\n"
+        'Content-Type: application/pdf; name="decisao.pdf"\r\n'
+        'Content-Disposition: attachment; filename="decisao.pdf"\r\n'
+        "Content-Transfer-Encoding: base64\r\n\r\n"
+        f"{attachment}\r\n"
+        "--mixed--\r\n"
+    ).encode("utf-8")
+
+
+class Command(BaseCommand):
+    help = "Benchmark do estágio de parse MIME: serial vs. pool de processos (tasks.parsing)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=5_000)
+        parser.add_argument('--attachment-kb', type=int, default=64)
+        parser.add_argument('--workers', type=int, default=settings.IMAP_PARSE_WORKERS)
+        parser.add_argument('--batch', type=int, default=200, help="Tamanho do lote IMAP (como no fetch).")
+
+    def handle(self, *args, **options):
+        total, batch = options['messages'], options['batch']
+        items = [(uid, synthetic_message(uid, options['attachment_kb'] * 1024)) for uid in range(1, total + 1)]
+        megabytes = sum(len(raw) for _, raw in items) / 1024 / 1024
+
+        def measure(workers):
+            started = time.perf_counter()
+            uids = []
+            for i in range(0, total, batch):
+                for uid, record, error in iter_parsed(
+                    items[i:i + batch], workers=workers, start_method=settings.IMAP_PARSE_START_METHOD,
+                ):
+                    if error:
+                        raise RuntimeError(f"UID {uid}: {error}")
+                    uids.append(uid)
+            elapsed = time.perf_counter() - started
+            if uids != [uid for uid, _ in items]:
+                raise RuntimeError("ordem dos registros não preservada")
+            return elapsed
+
+        serial = measure(0)
+        pooled = measure(options['workers'])
+        shutdown_executor()
+
+        self.stdout.write(f"Mensagens: {total} ({megabytes:.1f} MiB, lotes de {batch})")
+        self.stdout.write(f"  serial          : {serial:.2f}s -> {total / serial:,.0f} msg/s, {megabytes / serial:.1f} MiB/s")
+        self.stdout.write(f"  pool ({options['workers']} workers): {pooled:.2f}s -> "
+                          f"{total / pooled:,.0f} msg/s, {megabytes / pooled:.1f} MiB/s")
+        self.stdout.write(self.style.SUCCESS(f"  speedup: {serial / pooled:.1f}x"))
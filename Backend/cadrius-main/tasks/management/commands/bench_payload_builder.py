@@ -0,0 +1,92 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from emails.models import MailBox, EmailMessage, EmailStatus
+from tasks.payload import EmailPayloadBuilder, _to_aware, _safe_int
+
+
+def _model_has_field(model_cls, field_name: str) -> bool:
+    try:
+        return any(getattr(f, "name", None) == field_name for f in model_cls._meta.get_fields())
+    except Exception:
+        return False
+
+
+def legacy_build(record, mailbox, uid):
+    """Cópia congelada do caminho antigo (um _model_has_field por campo), só para comparação."""
+    payload = {}
+    if _model_has_field(EmailMessage, "mailbox"):
+        payload["mailbox"] = mailbox
+    if _model_has_field(EmailMessage, "message_id"):
+        payload["message_id"] = record["message_id"]
+    if _model_has_field(EmailMessage, "subject"):
+        payload["subject"] = record["subject"] or "(sem assunto)"
+    if _model_has_field(EmailMessage, "sender"):
+        payload["sender"] = record["from_addr"]
+    elif _model_has_field(EmailMessage, "from_addr"):
+        payload["from_addr"] = record["from_addr"]
+    if _model_has_field(EmailMessage, "received_at"):
+        payload["received_at"] = _to_aware(record["date"])
+    elif _model_has_field(EmailMessage, "date"):
+        payload["date"] = _to_aware(record["date"])
+    if _model_has_field(EmailMessage, "body_text"):
+        payload["body_text"] = record["body_text"] or ""
+    if _model_has_field(EmailMessage, "uid"):
+        payload["uid"] = _safe_int(uid)
+    if _model_has_field(EmailMessage, "status"):
+        status_value = getattr(EmailStatus, "RECEIVED", None) or getattr(EmailStatus, "received", None)
+        if status_value is not None:
+            payload["status"] = status_value
+    now = timezone.now()
+    if _model_has_field(EmailMessage, "created_at"):
+        payload["created_at"] = now
+    if _model_has_field(EmailMessage, "updated_at"):
+        payload["updated_at"] = now
+    return EmailMessage(**payload)
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark: CPU por mensagem do builder de payload (antigo vs. pré-compilado)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        total = options['messages']
+        mailbox = MailBox(id=1, name="bench", imap_host="imap.local", username="u", password="p")
+        records = [
+            {
+                "uid": uid,
+                "message_id": f"<bench-{uid}@tjsp.jus.br>",
+                "subject": f"Intimação eletrônica - Processo {uid:07d}-12.2025.8.26.0100",
+                "from_addr": "TJSP <intimacao@tjsp.jus.br>",
+                "to_addr": "adv@example.com",
+                "date": datetime(2025, 11, 17, 10, 0, 0),
+                "body_text": "Fica V. Sa. intimada da decisão proferida nos autos. " * 10,
+                "size": 4096,
+            }
+            for uid in range(1, total + 1)
+        ]
+
+        def measure(build):
+            best = None
+            for _ in range(options['repeat']):
+                started = time.process_time()
+                for record in records:
+                    build(record, mailbox, record["uid"])
+                elapsed = time.process_time() - started
+                best = elapsed if best is None else min(best, elapsed)
+            return best
+
+        builder = EmailPayloadBuilder()
+        legacy = measure(legacy_build)
+        compiled = measure(builder.build)
+
+        self.stdout.write(f"Mensagens sintéticas: {total} (melhor de {options['repeat']} execuções, CPU)")
+        self.stdout.write(f"  antes  (_model_has_field): {legacy:.3f}s  -> {legacy / total * 1e6:.1f} µs/mensagem")
+        self.stdout.write(f"  depois (EmailPayloadBuilder): {compiled:.3f}s  -> {compiled / total * 1e6:.1f} µs/mensagem")
+        self.stdout.write(self.style.SUCCESS(f"  speedup: {legacy / compiled:.1f}x"))
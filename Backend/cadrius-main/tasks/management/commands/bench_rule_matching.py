@@ -0,0 +1,86 @@
+import random
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from emails.matching import RuleMatcher
+
+TRIBUNAIS = ['tjsp', 'tjrj', 'tjmg', 'trf3', 'trt2', 'stj', 'tjpr', 'tjrs', 'tjba', 'tjsc']
+ASSUNTOS = ['Intimação', 'Citação', 'Despacho', 'Sentença', 'Decisão', 'Publicação', 'Pauta', 'Alvará']
+
+
+def legacy_match(rules, subject, sender):
+    """Cópia congelada do laço antigo do process_email (sem a consulta ao banco), só para comparação."""
+    for rule in rules:
+        subject_match = True
+        if rule.subject_contains and rule.subject_contains.strip():
+            if rule.subject_contains.lower() not in subject.lower():
+                subject_match = False
+        sender_match = True
+        if rule.sender_contains and rule.sender_contains.strip():
+            if rule.sender_contains.lower() not in sender.lower():
+                sender_match = False
+        if subject_match and sender_match:
+            return rule.pk
+    return None
+
+
+def _rules(count, rng):
+    rules = []
+    for pk in range(1, count + 1):
+        # regra sem condição casa com tudo e encerraria o laço cedo; aqui todas filtram o assunto
+        subject = f"{rng.choice(ASSUNTOS)} processo {rng.randint(0, 99999):05d}"
+        sender = f"{rng.choice(TRIBUNAIS)}.jus.br" if rng.random() < 0.5 else ""
+        rules.append(SimpleNamespace(pk=pk, priority=rng.randint(1, 20), subject_contains=subject, sender_contains=sender))
+    rules.sort(key=lambda r: (r.priority, r.pk))
+    return rules
+
+
+def _emails(count, rules, rng):
+    emails = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            rule = rng.choice(rules)
+            subject = f"Aviso: {rule.subject_contains or 'Comunicação'} - Tribunal de Justiça"
+        else:
+            subject = f"{rng.choice(ASSUNTOS)} eletrônica - Processo {rng.randint(0, 9999999):07d}-12.2025.8.26.0100"
+        sender = f"Sistema <intimacao@{rng.choice(TRIBUNAIS)}.jus.br>"
+        emails.append((subject, sender))
+    return emails
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark: escolha da AutomationRule por email (laço antigo vs. Aho-Corasick compilado)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--emails', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Emails por rodada: {options['emails']} (sem contar a consulta ao banco que o laço antigo fazia)")
+        for count in options['rules']:
+            rng = random.Random(options['seed'])
+            rules = _rules(count, rng)
+            emails = _emails(options['emails'], rules, rng)
+
+            started = time.perf_counter()
+            matcher = RuleMatcher.from_rules(rules)
+            compile_ms = (time.perf_counter() - started) * 1000
+
+            started = time.perf_counter()
+            legacy = [legacy_match(rules, subject, sender) for subject, sender in emails]
+            legacy_us = (time.perf_counter() - started) / len(emails) * 1e6
+
+            started = time.perf_counter()
+            compiled = [matcher.match(subject, sender) for subject, sender in emails]
+            compiled_us = (time.perf_counter() - started) / len(emails) * 1e6
+
+            if legacy != compiled:
+                self.stdout.write(self.style.ERROR(f"  {count} regras: resultados divergentes!"))
+                continue
+            self.stdout.write(
+                f"  {count:>5} regras: antigo {legacy_us:8.1f} µs/email | compilado {compiled_us:6.1f} µs/email "
+                f"({legacy_us / compiled_us:5.1f}x) | compilação {compile_ms:.1f} ms"
+            )
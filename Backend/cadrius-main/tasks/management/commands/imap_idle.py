@@ -0,0 +1,51 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tasks.idle import IdleSupervisor
+
+
+class Command(BaseCommand):
+    help = (
+        "Daemon de ingestão IMAP IDLE: mantém uma sessão IDLE por MailBox ativa "
+        "e processa emails novos assim que o servidor notifica (EXISTS)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mailbox', type=int, action='append', dest='mailbox_ids',
+            help="Restringe o daemon a estas MailBoxes (pode repetir)."
+        )
+        parser.add_argument(
+            '--reload-interval', type=int, default=60,
+            help="Segundos entre recargas da lista de MailBoxes ativas."
+        )
+        parser.add_argument(
+            '--idle-refresh', type=int, default=settings.IMAP_IDLE_REFRESH_SECONDS,
+            help="Segundos até renovar cada sessão IDLE."
+        )
+        parser.add_argument(
+            '--poll-interval', type=int, default=settings.IMAP_IDLE_POLL_SECONDS,
+            help="Intervalo de polling para servidores sem suporte a IDLE."
+        )
+
+    def handle(self, *args, **options):
+        supervisor = IdleSupervisor(
+            mailbox_ids=options['mailbox_ids'],
+            reload_interval=options['reload_interval'],
+            worker_kwargs={
+                'idle_refresh': options['idle_refresh'],
+                'poll_interval': options['poll_interval'],
+            },
+        )
+
+        def _stop(signum, frame):
+            self.stdout.write("Encerrando daemon IMAP IDLE...")
+            supervisor.stop_event.set()
+
+        signal.signal(signal.SIGINT, _stop)
+        signal.signal(signal.SIGTERM, _stop)
+
+        self.stdout.write(self.style.SUCCESS("Daemon IMAP IDLE iniciado."))
+        supervisor.run_forever()
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django_q.models import Schedule
+
+from tasks.orchestrator import ensure_orchestrator_schedule
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria o Schedule de 1 minuto do orquestrador de fetch e remove os Schedules "
+        "individuais de fetch_emails (use junto com IMAP_FETCH_ORCHESTRATOR=1)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-mailbox-schedules', action='store_true',
+            help="Não remove os Schedules de fetch por MailBox.",
+        )
+
+    def handle(self, *args, **options):
+        schedule = ensure_orchestrator_schedule()
+        self.stdout.write(self.style.SUCCESS(f"Schedule do orquestrador: {schedule.name} (id {schedule.id})."))
+
+        if not options['keep_mailbox_schedules']:
+            deleted, _ = Schedule.objects.filter(func='tasks.tasks.fetch_emails').delete()
+            self.stdout.write(f"Schedules individuais de fetch_emails removidos: {deleted}.")
@@ -0,0 +1,77 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emails.archive import get_raw_store, iter_raw_messages
+from emails.models import EmailMessage
+from tasks.mime import parse_message
+from tasks.tasks import enqueue_processing
+
+REPARSED_FIELDS = ['subject', 'sender', 'body_text', 'headers']
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay de emails a partir do RFC822 arquivado (RAW_ARCHIVE_BACKEND), sem acessar o IMAP: "
+        "refaz o parse (--reparse) e/ou reenfileira a extração (--reprocess)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mailbox', type=int, action='append', dest='mailbox_ids')
+        parser.add_argument('--status', help="Filtra por status (ex: REVIEW, FAILED).")
+        parser.add_argument('--id', type=int, action='append', dest='email_ids')
+        parser.add_argument('--limit', type=int)
+        parser.add_argument('--reparse', action='store_true',
+                            help="Atualiza subject/sender/body_text com o parser atual.")
+        parser.add_argument('--reprocess', action='store_true',
+                            help="Reenfileira process_email_batch para os emails lidos.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if get_raw_store() is None:
+            raise CommandError("RAW_ARCHIVE_BACKEND não configurado.")
+
+        queryset = EmailMessage.objects.order_by('id')
+        if options['mailbox_ids']:
+            queryset = queryset.filter(mailbox_id__in=options['mailbox_ids'])
+        if options['status']:
+            queryset = queryset.filter(status=options['status'].upper())
+        if options['email_ids']:
+            queryset = queryset.filter(id__in=options['email_ids'])
+        if options['limit']:
+            queryset = queryset.filter(id__in=list(queryset.values_list('id', flat=True)[:options['limit']]))
+
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        total_bytes = 0
+        replayed = []
+        pending_updates = []
+
+        for email, raw in iter_raw_messages(queryset, chunk_size=batch_size):
+            total_bytes += len(raw)
+            replayed.append(email.id)
+            if options['reparse']:
+                record = parse_message(None, raw)
+                email.subject = record["subject"] or "(sem assunto)"
+                email.sender = record["from_addr"]
+                email.body_text = record["body_text"] or ""
+                email.headers = record["headers"]
+                pending_updates.append(email)
+                if len(pending_updates) >= batch_size:
+                    EmailMessage.objects.bulk_update(pending_updates, REPARSED_FIELDS)
+                    pending_updates = []
+
+        if pending_updates:
+            EmailMessage.objects.bulk_update(pending_updates, REPARSED_FIELDS)
+        if options['reprocess'] and replayed:
+            # as regras podem ter mudado desde a ingestão: o worker as reavalia e refaz todas as etapas
+            EmailMessage.objects.filter(id__in=replayed).update(matched_rule=None, stages={})
+            enqueue_processing(replayed)
+
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(replayed)} emails lidos do arquivo ({total_bytes / 1024 / 1024:.1f} MiB) em {elapsed:.2f}s "
+            f"-> {len(replayed) / elapsed:,.0f} msg/s"
+            + (" | reparse aplicado" if options['reparse'] else "")
+            + (" | reprocessamento enfileirado" if options['reprocess'] else "")
+        ))
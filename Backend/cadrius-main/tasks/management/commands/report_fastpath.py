@@ -0,0 +1,78 @@
+import json
+import os
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emails.models import EmailMessage
+from extraction.ai_wrapper import AI_MODEL
+from extraction.fastpath import pre_extract
+from extraction.preprocess import clean_body
+from extraction.registry import SCHEMA_MAP
+from extraction.tokens import count_tokens
+from tasks.management.commands.report_token_savings import corpus_from_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Relatório do pré-extrator determinístico (extraction.fastpath): acerto por campo, "
+        "emails que dispensam a IA e estimativa da latência economizada, sobre emails do banco ou um "
+        "diretório de .eml/.txt. A latência do fast path é medida; a economizada na IA é estimada "
+        "pelos tokens de saída poupados (--ms-per-output-token), sem chamar a API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help="Diretório com .eml/.txt (em vez do banco).")
+        parser.add_argument('--mailbox', type=int, action='append', dest='mailbox_ids')
+        parser.add_argument('--limit', type=int, default=500, help="Emails mais recentes do banco.")
+        parser.add_argument('--schema', default='ProcessoJuridicoSchema', choices=sorted(SCHEMA_MAP))
+        parser.add_argument('--ms-per-output-token', type=float, default=20.0,
+                            help="Latência média de geração por token de saída do modelo (base da estimativa).")
+        parser.add_argument('--model', default=AI_MODEL)
+
+    def handle(self, *args, **options):
+        if options['path']:
+            if not os.path.isdir(options['path']):
+                raise CommandError(f"Diretório não encontrado: {options['path']}")
+            corpus = corpus_from_path(options['path'])
+        else:
+            queryset = EmailMessage.objects.order_by('-received_at')
+            if options['mailbox_ids']:
+                queryset = queryset.filter(mailbox_id__in=options['mailbox_ids'])
+            corpus = ((f"#{pk}", body) for pk, body in queryset.values_list('pk', 'body_text')[:options['limit']])
+
+        schema, model = SCHEMA_MAP[options['schema']], options['model']
+        hits = dict.fromkeys(schema.model_fields, 0)
+        elapsed_ms, saved_tokens, total, skipped = [], [], 0, 0
+        for _, body in corpus:
+            text = clean_body(body)
+            start = time.perf_counter()
+            prefilled = pre_extract(schema, text)
+            elapsed_ms.append((time.perf_counter() - start) * 1000)
+
+            total += 1
+            skipped += len(prefilled) == len(schema.model_fields)
+            for name in prefilled:
+                hits[name] += 1
+            # tokens que a IA deixa de gerar (chave + valor no JSON de saída)
+            saved_tokens.append(count_tokens(json.dumps(prefilled, ensure_ascii=False), model) if prefilled else 0)
+
+        if not total:
+            self.stdout.write("Amostra vazia.")
+            return
+
+        ms_per_token = options['ms_per_output_token']
+        self.stdout.write(f"Emails: {total} (schema {options['schema']}, modelo {model})")
+        self.stdout.write("  acerto por campo:")
+        for name, count in hits.items():
+            self.stdout.write(f"    {name:<28}: {count:>5} ({100 * count / total:.1f}%)")
+        self.stdout.write(f"  emails sem IA           : {skipped} ({100 * skipped / total:.1f}%)")
+        self.stdout.write(f"  latência do fast path   : mediana {statistics.median(elapsed_ms):.3f} ms, "
+                          f"máx {max(elapsed_ms):.3f} ms")
+        self.stdout.write(f"  tokens de saída poupados: {sum(saved_tokens):,} "
+                          f"(média {statistics.mean(saved_tokens):.1f} por email)")
+        self.stdout.write(self.style.SUCCESS(
+            f"  latência economizada    : ~{statistics.mean(saved_tokens) * ms_per_token:.0f} ms por email "
+            f"(estimada: tokens poupados x {ms_per_token:g} ms/token de saída, não medida)"
+        ))
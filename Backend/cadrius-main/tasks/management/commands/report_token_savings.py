@@ -0,0 +1,76 @@
+import os
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emails.models import EmailMessage
+from extraction.ai_wrapper import AI_MODEL
+from extraction.preprocess import clean_body, preprocess_body
+from extraction.tokens import count_tokens
+from tasks.mime import parse_message
+
+
+def corpus_from_path(path):
+    """Arquivos .eml (parse MIME) ou .txt (texto puro) de um diretório."""
+    for name in sorted(os.listdir(path)):
+        full = os.path.join(path, name)
+        if name.endswith('.eml'):
+            with open(full, 'rb') as f:
+                yield name, parse_message(None, f.read())["body_text"]
+        elif name.endswith('.txt'):
+            with open(full, encoding='utf-8', errors='replace') as f:
+                yield name, f.read()
+
+
+class Command(BaseCommand):
+    help = (
+        "Relatório de economia de tokens do pré-processamento (extraction.preprocess) "
+        "sobre uma amostra: emails do banco ou um diretório de .eml/.txt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help="Diretório com .eml/.txt (em vez do banco).")
+        parser.add_argument('--mailbox', type=int, action='append', dest='mailbox_ids')
+        parser.add_argument('--limit', type=int, default=500, help="Emails mais recentes do banco.")
+        parser.add_argument('--max-tokens', type=int, default=3000, help="Orçamento por email (0 = sem corte).")
+        parser.add_argument('--model', default=AI_MODEL)
+
+    def handle(self, *args, **options):
+        if options['path']:
+            if not os.path.isdir(options['path']):
+                raise CommandError(f"Diretório não encontrado: {options['path']}")
+            corpus = corpus_from_path(options['path'])
+        else:
+            queryset = EmailMessage.objects.order_by('-received_at')
+            if options['mailbox_ids']:
+                queryset = queryset.filter(mailbox_id__in=options['mailbox_ids'])
+            corpus = ((f"#{pk}", body) for pk, body in queryset.values_list('pk', 'body_text')[:options['limit']])
+
+        model, budget = options['model'], options['max_tokens']
+        original, cleaned, sent, truncated = [], [], [], 0
+        for _, body in corpus:
+            result = preprocess_body(body, budget, model)
+            original.append(result.original_tokens)
+            cleaned.append(count_tokens(clean_body(body), model))
+            sent.append(result.tokens)
+            truncated += result.truncated
+
+        if not original:
+            self.stdout.write("Amostra vazia.")
+            return
+
+        total_original, total_cleaned, total_sent = sum(original), sum(cleaned), sum(sent)
+        savings = [1 - s / o for o, s in zip(original, sent) if o]
+
+        def pct(part):
+            return 100 * (1 - part / total_original) if total_original else 0.0
+
+        self.stdout.write(f"Emails: {len(original)} (modelo {model}, orçamento {budget or 'ilimitado'} tokens)")
+        self.stdout.write(f"  tokens originais       : {total_original:,}")
+        self.stdout.write(f"  após limpeza           : {total_cleaned:,} (-{pct(total_cleaned):.1f}%)")
+        self.stdout.write(f"  após orçamento (envio) : {total_sent:,} (-{pct(total_sent):.1f}%)")
+        self.stdout.write(f"  emails cortados        : {truncated}")
+        if savings:
+            self.stdout.write(f"  economia por email     : mediana {100 * statistics.median(savings):.1f}%, "
+                              f"máx {100 * max(savings):.1f}%")
+        self.stdout.write(self.style.SUCCESS(f"  tokens economizados    : {total_original - total_sent:,}"))
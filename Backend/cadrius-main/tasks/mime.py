@@ -0,0 +1,91 @@
+"""
+Helpers de MIME/cabeçalhos sem dependência do Django.
+
+Usados pelo fetch_emails (parse do RFC822 completo) e pelo fetch parcial
+(tasks.imap_fetch), que monta o mesmo registro a partir de ENVELOPE +
+BODYSTRUCTURE.
+"""
+import hashlib
+import re
+from email import policy
+from email.parser import BytesParser
+from email.header import decode_header, make_header
+from email.utils import parsedate_to_datetime
+
+
+def decode_str(value) -> str:
+    if not value:
+        return ""
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="replace")
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+# Cabeçalhos de rastreio/assinatura: volumosos e sem uso nas condições das regras
+SKIPPED_HEADERS = (
+    'received', 'x-received', 'dkim-signature', 'x-google-dkim-signature', 'arc-seal',
+    'arc-message-signature', 'arc-authentication-results', 'authentication-results', 'received-spf',
+)
+MAX_HEADER_VALUE = 998
+_FOLD = re.compile(r"\r?\n[ \t]+")
+
+
+def compact_headers(msg) -> dict:
+    """{nome em minúsculas: valor decodificado} da primeira ocorrência de cada cabeçalho."""
+    headers = {}
+    for name, value in msg.raw_items():
+        key = name.strip().lower()
+        if key in SKIPPED_HEADERS or key in headers:
+            continue
+        headers[key] = decode_str(_FOLD.sub(" ", str(value))).strip()[:MAX_HEADER_VALUE]
+    return headers
+
+
+def extract_body(email_obj):
+    """Prefere text/plain; fallback para qualquer text/*."""
+    try:
+        if email_obj.is_multipart():
+            for part in email_obj.walk():
+                ctype = (part.get_content_type() or "").lower()
+                disp = (part.get_content_disposition() or "").lower()
+                if ctype == "text/plain" and "attachment" not in disp:
+                    return (part.get_content() or "").strip()
+            # fallback text/*
+            for part in email_obj.walk():
+                if (part.get_content_type() or "").lower().startswith("text/"):
+                    return (part.get_content() or "").strip()
+            return ""
+        return (email_obj.get_content() or "").strip()
+    except Exception:
+        return ""
+
+
+def parse_message(uid, raw_bytes: bytes) -> dict:
+    """
+    Faz o parse do RFC822 completo e devolve o registro compacto usado na
+    persistência: uid, message_id, subject, from_addr, to_addr, date, body_text,
+    headers, size e sha256 (do RFC822 bruto).
+    """
+    msg = BytesParser(policy=policy.default).parsebytes(raw_bytes)
+
+    date_hdr = msg.get('Date')
+    try:
+        dt = parsedate_to_datetime(date_hdr) if date_hdr else None
+    except Exception:
+        dt = None
+
+    return {
+        "uid": uid,
+        "message_id": (msg.get('Message-Id') or msg.get('Message-ID') or "").strip() or None,
+        "subject": decode_str(msg.get('Subject')),
+        "from_addr": decode_str(msg.get('From')),
+        "to_addr": decode_str(msg.get('To')),
+        "date": dt,
+        "body_text": extract_body(msg),
+        "headers": compact_headers(msg),
+        "size": len(raw_bytes),
+        "sha256": hashlib.sha256(raw_bytes).hexdigest(),
+    }
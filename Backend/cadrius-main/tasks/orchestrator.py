@@ -0,0 +1,253 @@
+"""
+Orquestrador de fetch multi-MailBox.
+
+Uma única tarefa agendada (`fetch_due_mailboxes`, a cada minuto) busca todas
+as MailBoxes "vencidas" em um pool de threads limitado, no lugar de um
+Schedule do Django-Q por caixa disputando os workers com o process_email.
+
+- Limite de conexões simultâneas por host IMAP (IMAP_MAX_CONNECTIONS_PER_HOST).
+- Conexões autenticadas ficam num pool do processo e são reaproveitadas entre
+  ticks (validadas com NOOP; descartadas após IMAP_POOL_MAX_IDLE_SECONDS).
+- O resultado da tarefa traz o tempo de cada MailBox (espera pelo host + fetch).
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+import imapclient
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from django_q.models import Schedule
+
+from emails.models import MailBox
+from tasks.cadence import ORCHESTRATOR_TICK_SECONDS
+from tasks.tasks import mailbox_connection_params, connect_imap, fetch_mailbox, notify_telegram
+
+logger = logging.getLogger(__name__)
+
+ORCHESTRATOR_FUNC = 'tasks.orchestrator.fetch_due_mailboxes'
+ORCHESTRATOR_SCHEDULE_NAME = 'Fetch - Orquestrador de MailBoxes'
+# Folga para o scheduler (~15s de resolução): evita pular um tick inteiro
+DUE_SLACK_SECONDS = 15
+
+
+class HostLimiter:
+    """Um BoundedSemaphore por host IMAP, criado sob demanda."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, int(limit))
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self._semaphores[host]
+
+    @contextmanager
+    def slot(self, host):
+        semaphore = self._semaphore((host or "").lower())
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+class ImapConnectionPool:
+    """
+    Guarda no máximo uma conexão ociosa por (host, porta, usuário). Quem pega
+    a conexão é dono dela até devolver (`release`) ou descartar (`discard`).
+    """
+
+    def __init__(self, max_idle_seconds: int, client_factory=None):
+        self.max_idle_seconds = max_idle_seconds
+        self.client_factory = client_factory or connect_imap
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    @staticmethod
+    def _key(params: dict):
+        return ((params["host"] or "").lower(), params["port"], params["username"])
+
+    def acquire(self, params: dict):
+        """Retorna (server, reaproveitada)."""
+        with self._lock:
+            entry = self._idle.pop(self._key(params), None)
+
+        if entry is not None:
+            server, released_at = entry
+            if time.monotonic() - released_at <= self.max_idle_seconds:
+                try:
+                    server.noop()
+                    return server, True
+                except Exception as e:
+                    logger.info("[orchestrator] Conexão ociosa com %s caiu (%s); reconectando.", params["host"], e)
+            self.discard(server)
+
+        return self.client_factory(params), False
+
+    def release(self, params: dict, server):
+        with self._lock:
+            previous = self._idle.pop(self._key(params), None)
+            self._idle[self._key(params)] = (server, time.monotonic())
+        if previous is not None:
+            self.discard(previous[0])
+
+    def discard(self, server):
+        try:
+            server.logout()
+        except Exception:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            entries, self._idle = list(self._idle.values()), {}
+        for server, _ in entries:
+            self.discard(server)
+
+    def __len__(self):
+        return len(self._idle)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool() -> ImapConnectionPool:
+    """Pool do processo (vive entre ticks enquanto o worker do Django-Q não recicla)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ImapConnectionPool(settings.IMAP_POOL_MAX_IDLE_SECONDS)
+        return _pool
+
+
+def due_mailboxes(now=None):
+    """
+    MailBoxes ativas cujo `next_fetch_at` (cadência adaptativa, tasks.cadence)
+    já passou. Caixas ainda sem cadência usam IMAP_FETCH_INTERVAL_SECONDS
+    desde o último fetch.
+    """
+    now = now or timezone.now()
+    threshold = now - timedelta(seconds=settings.IMAP_FETCH_INTERVAL_SECONDS - DUE_SLACK_SECONDS)
+    without_cadence = Q(next_fetch_at__isnull=True) & (
+        Q(last_fetch_at__isnull=True) | Q(last_fetch_at__lte=threshold)
+    )
+    return (
+        MailBox.objects.filter(is_active=True)
+        .filter(without_cadence | Q(next_fetch_at__lte=now + timedelta(seconds=DUE_SLACK_SECONDS)))
+        .order_by('next_fetch_at', 'last_fetch_at', 'id')
+    )
+
+
+def _fetch_one(mailbox: MailBox, pool: ImapConnectionPool, limiter: HostLimiter, deadline: float) -> dict:
+    result = {"mailbox_id": mailbox.id, "host": None, "created": 0,
+              "wait_seconds": 0.0, "fetch_seconds": 0.0, "reused_connection": False,
+              "skipped": False, "error": None}
+    try:
+        params = mailbox_connection_params(mailbox)
+        result["host"] = params["host"]
+        if not params["host"] or not params["username"] or not params["password"]:
+            result["error"] = "host/username/password ausentes"
+            return result
+
+        queued_at = time.monotonic()
+        with limiter.slot(params["host"]):
+            started = time.monotonic()
+            result["wait_seconds"] = round(started - queued_at, 3)
+            if started > deadline:
+                # fica vencida e entra no próximo tick
+                result["skipped"] = True
+                return result
+
+            server, result["reused_connection"] = pool.acquire(params)
+            try:
+                result["created"] = fetch_mailbox(server, mailbox, params, deadline)
+            except Exception:
+                pool.discard(server)
+                raise
+            else:
+                pool.release(params, server)
+            finally:
+                result["fetch_seconds"] = round(time.monotonic() - started, 3)
+
+    except imapclient.exceptions.IMAPClientError as e:
+        result["error"] = str(e)
+        msg = f"[fetch_due_mailboxes] IMAPClientError MailBox {mailbox.id}: {e}"
+        logger.error(msg)
+        notify_telegram(msg)
+    except Exception as e:
+        result["error"] = str(e)
+        msg = f"[fetch_due_mailboxes] Erro inesperado MailBox {mailbox.id}: {e}"
+        logger.exception(msg)
+        notify_telegram(msg)
+    finally:
+        # cada thread do pool tem a própria conexão com o banco
+        connections.close_all()
+    return result
+
+
+def fetch_due_mailboxes(max_workers=None, pool=None):
+    """
+    Tarefa do orquestrador: busca em paralelo todas as MailBoxes vencidas.
+    MailBoxes que não começarem dentro de IMAP_FETCH_TICK_BUDGET_SECONDS
+    continuam vencidas e ficam para o próximo tick (cabe no 'timeout' do Q_CLUSTER);
+    as que já começaram param entre lotes IMAP no mesmo prazo (depois do primeiro)
+    e também voltam no próximo tick.
+    """
+    tick_started = time.monotonic()
+    deadline = tick_started + settings.IMAP_FETCH_TICK_BUDGET_SECONDS
+    mailboxes = list(due_mailboxes())
+    if not mailboxes:
+        return {"mailboxes": 0, "created": 0, "seconds": 0.0, "results": []}
+
+    if pool is None:
+        pool = get_connection_pool()
+    limiter = HostLimiter(settings.IMAP_MAX_CONNECTIONS_PER_HOST)
+    max_workers = max_workers or settings.IMAP_FETCH_CONCURRENCY
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(mailboxes)),
+                            thread_name_prefix="imap-fetch") as executor:
+        results = list(executor.map(lambda mb: _fetch_one(mb, pool, limiter, deadline), mailboxes))
+
+    summary = {
+        "mailboxes": len(results),
+        "created": sum(r["created"] for r in results),
+        "skipped": sum(1 for r in results if r["skipped"]),
+        "errors": sum(1 for r in results if r["error"]),
+        "seconds": round(time.monotonic() - tick_started, 3),
+        "results": results,
+    }
+    for r in results:
+        logger.info(
+            "[fetch_due_mailboxes] MailBox %s (%s): %s criados, espera %.3fs, fetch %.3fs%s%s",
+            r["mailbox_id"], r["host"], r["created"], r["wait_seconds"], r["fetch_seconds"],
+            " (conexão reaproveitada)" if r["reused_connection"] else "",
+            f" ERRO: {r['error']}" if r["error"] else "",
+        )
+    logger.info(
+        "[fetch_due_mailboxes] Tick: %s MailBoxes, %s emails, %s adiadas, %s erros em %.3fs.",
+        summary["mailboxes"], summary["created"], summary["skipped"], summary["errors"], summary["seconds"],
+    )
+    return summary
+
+
+def ensure_orchestrator_schedule():
+    """Cria (uma vez) o Schedule de 1 minuto que dispara o orquestrador (piso da cadência nesse modo)."""
+    schedule, _ = Schedule.objects.get_or_create(
+        name=ORCHESTRATOR_SCHEDULE_NAME,
+        defaults={
+            'func': ORCHESTRATOR_FUNC,
+            'schedule_type': Schedule.MINUTES,
+            'minutes': ORCHESTRATOR_TICK_SECONDS // 60,
+            'repeats': -1,
+        },
+    )
+    return schedule
@@ -0,0 +1,87 @@
+"""
+Estágio de parse MIME em pool de processos.
+
+O parse do RFC822 (BytesParser + decodificação de cabeçalhos + escolha do
+corpo) é CPU puro e, em sincronizações iniciais grandes, segurava o worker do
+Django-Q por minutos. Aqui cada lote IMAP é distribuído para um
+ProcessPoolExecutor e os registros compactos voltam na ordem dos UIDs.
+
+- Lotes pequenos (< IMAP_PARSE_POOL_MIN_BATCH) são parseados no próprio processo.
+- Erro em uma mensagem vira um resultado com `error`, sem derrubar o lote.
+- Se o pool não puder ser criado (ex: worker daemônico do Django-Q) ou quebrar,
+  o lote cai para o parse serial.
+
+Os processos filhos só importam este módulo e tasks.mime (sem Django).
+"""
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+
+from tasks.mime import parse_message
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def parse_one(item):
+    """(uid, raw_bytes) -> (uid, registro, None) ou (uid, None, mensagem de erro)."""
+    uid, raw_bytes = item
+    try:
+        return uid, parse_message(uid, raw_bytes), None
+    except Exception as e:
+        return uid, None, f"{type(e).__name__}: {e}"
+
+
+def get_executor(workers: int, start_method: str = "forkserver"):
+    """Pool do processo, criado na primeira vez e reaproveitado pelos próximos lotes."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(start_method),
+            )
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def iter_parsed(items, workers: int = None, min_batch: int = 0, start_method: str = "forkserver"):
+    """
+    Gera (uid, registro, erro) na ordem de `items`, à medida que cada
+    resultado fica pronto. `workers` vazio/0 desliga o pool.
+    """
+    items = list(items)
+    if not workers or len(items) < max(min_batch, 2):
+        yield from map(parse_one, items)
+        return
+
+    try:
+        executor = get_executor(workers, start_method)
+        chunksize = max(1, len(items) // (workers * 4))
+        results = executor.map(parse_one, items, chunksize=chunksize)
+    except (AssertionError, OSError, RuntimeError) as e:
+        # ex: "daemonic processes are not allowed to have children"
+        logger.warning("Pool de parse indisponível (%s); parse serial.", e)
+        yield from map(parse_one, items)
+        return
+
+    done = 0
+    try:
+        for result in results:
+            done += 1
+            yield result
+    except BrokenProcessPool as e:
+        logger.warning("Pool de parse quebrou (%s); refazendo %s mensagens em série.", e, len(items) - done)
+        shutdown_executor()
+        yield from map(parse_one, items[done:])
@@ -0,0 +1,164 @@
+"""
+Builders "compilados" uma vez por processo para o caminho quente do fetch.
+
+Antes, cada mensagem chamava `_model_has_field` ~12 vezes (cada chamada
+percorre `EmailMessage._meta.get_fields()`) e cada execução resolvia as
+credenciais da MailBox por uma cadeia de getattr. Aqui o mapeamento é
+resolvido na primeira chamada e reaproveitado pelo resto do processo.
+"""
+import os
+from functools import lru_cache
+
+from django.utils import timezone
+
+from emails.models import MailBox, EmailMessage, EmailStatus
+
+
+def _to_aware(dt):
+    if dt is None:
+        return timezone.now()
+    try:
+        if timezone.is_naive(dt):
+            return timezone.make_aware(dt, timezone.get_current_timezone())
+        return dt
+    except Exception:
+        return timezone.now()
+
+
+def _safe_int(value, default=None):
+    try:
+        return int(value)
+    except Exception:
+        return default
+
+
+def _first_field(names: set, *candidates):
+    for candidate in candidates:
+        if candidate in names:
+            return candidate
+    return None
+
+
+class EmailPayloadBuilder:
+    """
+    Resolve uma única vez quais campos do EmailMessage recebem cada parte do
+    registro parseado e expõe `build()`, que devolve a instância pronta para
+    o bulk_create.
+    """
+
+    def __init__(self, model=EmailMessage):
+        names = {getattr(f, "name", None) for f in model._meta.get_fields()}
+        self.model = model
+        self.mailbox_field = _first_field(names, "mailbox")
+        self.message_id_field = _first_field(names, "message_id")
+        self.subject_field = _first_field(names, "subject")
+        # REMAPEIA 'From' para o campo obrigatório 'sender'
+        self.sender_field = _first_field(names, "sender", "from_addr")
+        # REMAPEIA a data para o campo obrigatório 'received_at'
+        self.date_field = _first_field(names, "received_at", "date")
+        self.body_field = _first_field(names, "body_text")
+        self.uid_field = _first_field(names, "uid")
+        self.raw_sha256_field = _first_field(names, "raw_sha256")
+        self.headers_field = _first_field(names, "headers")
+        self.status_field = _first_field(names, "status")
+        self.status_value = getattr(EmailStatus, "RECEIVED", None) or getattr(EmailStatus, "received", None)
+        # timestamps obrigatórios (se o modelo não usar auto_now/auto_now_add)
+        self.timestamp_fields = tuple(f for f in ("created_at", "updated_at") if f in names)
+
+    def build(self, parsed_message: dict, mailbox, uid):
+        payload = {}
+        if self.mailbox_field:
+            payload[self.mailbox_field] = mailbox
+        if self.message_id_field:
+            payload[self.message_id_field] = parsed_message["message_id"]
+        if self.subject_field:
+            payload[self.subject_field] = parsed_message["subject"] or "(sem assunto)"
+        if self.sender_field:
+            payload[self.sender_field] = parsed_message["from_addr"]
+        if self.date_field:
+            payload[self.date_field] = _to_aware(parsed_message["date"])
+        if self.body_field:
+            payload[self.body_field] = parsed_message["body_text"] or ""
+        if self.uid_field:
+            payload[self.uid_field] = _safe_int(uid)
+        if self.raw_sha256_field:
+            payload[self.raw_sha256_field] = parsed_message.get("raw_sha256")
+        if self.headers_field:
+            payload[self.headers_field] = parsed_message.get("headers") or {}
+        if self.status_field and self.status_value is not None:
+            payload[self.status_field] = self.status_value
+        if self.timestamp_fields:
+            now = timezone.now()
+            for name in self.timestamp_fields:
+                payload[name] = now
+        return self.model(**payload)
+
+
+class MailBoxParamsResolver:
+    """
+    Resolve uma única vez quais atributos da MailBox guardam host, porta,
+    usuário, senha, SSL e pasta; `resolve()` só lê esses atributos e aplica
+    os overrides de ambiente (IMAP_HOST, IMAP_PORT, IMAP_USERNAME,
+    IMAP_PASSWORD, IMAP_SSL).
+    """
+
+    def __init__(self, model=MailBox):
+        names = {getattr(f, "name", None) for f in model._meta.get_fields()}
+        self.username_attr = _first_field(names, "username", "imap_username")
+        self.password_attr = _first_field(names, "password", "imap_password", "app_password")
+        self.host_attr = _first_field(names, "imap_host", "host")
+        self.port_attr = _first_field(names, "imap_port", "port")
+        self.ssl_attr = _first_field(names, "use_ssl")
+        self.folder_attr = _first_field(names, "folder")
+
+    def resolve(self, mailbox) -> dict:
+        def read(attr):
+            return getattr(mailbox, attr) if attr else None
+
+        host = read(self.host_attr)
+        port = read(self.port_attr) or 993
+        username = read(self.username_attr)
+        password = read(self.password_attr)
+        use_ssl = bool(read(self.ssl_attr)) if self.ssl_attr else True
+        folder = read(self.folder_attr) or "INBOX"
+
+        # ---- OVERRIDE via variáveis de ambiente ----
+        env_host = os.getenv("IMAP_HOST")
+        env_port = os.getenv("IMAP_PORT")
+        env_user = os.getenv("IMAP_USERNAME")
+        env_pass = os.getenv("IMAP_PASSWORD")
+        env_ssl = os.getenv("IMAP_SSL")
+
+        if env_host:
+            host = env_host
+        if env_port:
+            try:
+                port = int(env_port)
+            except Exception:
+                pass
+        if env_user:
+            username = env_user
+        if env_pass:
+            password = env_pass.replace(" ", "")  # remove espaços da app password do Gmail
+        if env_ssl:
+            # permite apontar para um servidor IMAP local sem TLS (ex: testes/dev)
+            use_ssl = env_ssl.strip().lower() not in ("0", "false", "no")
+
+        return {
+            "host": host,
+            "port": port,
+            "username": username,
+            "password": password,
+            "use_ssl": use_ssl,
+            "folder": folder,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_payload_builder() -> EmailPayloadBuilder:
+    return EmailPayloadBuilder()
+
+
+@lru_cache(maxsize=None)
+def get_params_resolver() -> MailBoxParamsResolver:
+    return MailBoxParamsResolver()
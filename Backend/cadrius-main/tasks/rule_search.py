@@ -0,0 +1,75 @@
+"""
+Tradução das AutomationRule ativas de uma MailBox em critérios de SEARCH IMAP.
+
+Cada regra vira um grupo AND (`SUBJECT x FROM y`) e os grupos são combinados
+com OR em árvore balanceada (profundidade log2, mesmo com centenas de regras).
+No Gmail (capability X-GM-EXT-1) o mesmo filtro vai numa única expressão X-GM-RAW.
+
+O filtro só precisa ser um superconjunto do que as regras aceitam: o
+process_email continua reavaliando as regras em cada email baixado. Por isso
+as `conditions` (emails.conditions), que só restringem, ficam de fora.
+"""
+
+
+def _encode(value: str) -> bytes:
+    # bytes passam intactos pelo imapclient (inclusive em listas aninhadas);
+    # a busca é feita com charset UTF-8.
+    return value.strip().encode("utf-8")
+
+
+def _rule_terms(rule) -> list:
+    terms = []
+    if rule.subject_contains and rule.subject_contains.strip():
+        terms += [b'SUBJECT', _encode(rule.subject_contains)]
+    if rule.sender_contains and rule.sender_contains.strip():
+        terms += [b'FROM', _encode(rule.sender_contains)]
+    if terms:
+        # O imapclient cola o ")" do grupo no último item e envia itens 8-bit como
+        # literal; terminar com ALL (casa com tudo) mantém o ")" fora do literal.
+        terms.append(b'ALL')
+    return terms
+
+
+def _or_key(groups: list) -> list:
+    """Um único search-key (lista = parênteses) que é o OR de todos os grupos."""
+    if len(groups) == 1:
+        return groups[0]
+    middle = len(groups) // 2
+    return [b'OR', _or_key(groups[:middle]), _or_key(groups[middle:])]
+
+
+def build_search_criteria(rules):
+    """
+    Critérios extras para o SEARCH ou None quando não há como filtrar
+    (nenhuma regra ativa, ou alguma regra sem condição, que casa com tudo).
+    """
+    groups = []
+    for rule in rules:
+        terms = _rule_terms(rule)
+        if not terms:
+            return None
+        groups.append(terms)
+    if not groups:
+        return None
+    return [_or_key(groups)]
+
+
+def _gmail_value(value: str) -> str:
+    return '"' + value.strip().replace('"', ' ') + '"'
+
+
+def build_gmail_raw(rules):
+    """Mesmo filtro em sintaxe de busca do Gmail, para `X-GM-RAW`; None se não há como filtrar."""
+    clauses = []
+    for rule in rules:
+        parts = []
+        if rule.subject_contains and rule.subject_contains.strip():
+            parts.append(f"subject:{_gmail_value(rule.subject_contains)}")
+        if rule.sender_contains and rule.sender_contains.strip():
+            parts.append(f"from:{_gmail_value(rule.sender_contains)}")
+        if not parts:
+            return None
+        clauses.append("(" + " ".join(parts) + ")")
+    if not clauses:
+        return None
+    return [b'X-GM-RAW', _encode(" OR ".join(clauses))]
@@ -0,0 +1,65 @@
+"""
+Checkpoints por etapa do pipeline do process_email (EmailMessage.stages).
+
+Cada etapa — regra (match), extração (extract) e cada integração — guarda
+status, tentativas, resultado e o último erro:
+
+    {"extract": {"status": "DONE", "attempts": 1, "result": {...}, "error": null, "updated_at": "..."}}
+
+As funções só alteram o dicionário do email em memória; o estado vai para o
+banco junto com os save() que o pipeline já faz, sem escrita extra. Um retry
+ou reprocessamento retoma da primeira etapa incompleta: com a extração
+concluída, uma falha transitória no Telegram não paga a IA de novo.
+"""
+from django.utils import timezone
+
+MATCH = 'match'
+EXTRACT = 'extract'
+TELEGRAM = 'telegram'
+# Integrações disparadas depois da extração, na ordem
+INTEGRATIONS = (TELEGRAM,)
+
+RUNNING = 'RUNNING'
+DONE = 'DONE'
+FAILED = 'FAILED'
+
+
+def _stage(email, name) -> dict:
+    if not isinstance(email.stages, dict):
+        email.stages = {}
+    return email.stages.setdefault(name, {"status": None, "attempts": 0, "result": None, "error": None})
+
+
+def _touch(stage: dict, status: str):
+    stage["status"] = status
+    stage["updated_at"] = timezone.now().isoformat()
+
+
+def is_done(email, name) -> bool:
+    return (email.stages or {}).get(name, {}).get("status") == DONE
+
+
+def start(email, name):
+    stage = _stage(email, name)
+    stage["attempts"] += 1
+    stage["error"] = None
+    _touch(stage, RUNNING)
+
+
+def complete(email, name, result=None):
+    stage = _stage(email, name)
+    stage["result"] = result
+    _touch(stage, DONE)
+
+
+def fail(email, name, error):
+    stage = _stage(email, name)
+    stage["error"] = str(error)[:1000]
+    _touch(stage, FAILED)
+
+
+def fail_running(email, error):
+    """Marca como FAILED a etapa que estava em andamento quando o pipeline quebrou."""
+    for name, stage in (email.stages or {}).items():
+        if stage.get("status") == RUNNING:
+            fail(email, name, error)
@@ -1,38 +1,41 @@
 import os
 import logging
+import time
+from dataclasses import dataclass, field
 from datetime import timedelta
+from django.conf import settings
 from django.utils import timezone
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django_q.tasks import async_task
 import imapclient 
-from extraction.schemas import ProcessoJuridicoSchema, ServiceOrderSchema, SupportRequestSchema 
 
-from email import policy
-from email.parser import BytesParser
-from email.header import decode_header, make_header
-from email.utils import parsedate_to_datetime
+from tasks.parsing import iter_parsed
+from emails.archive import get_raw_store
+from tasks.payload import get_payload_builder, get_params_resolver, _safe_int
+from tasks.imap_fetch import fetch_batch_partial
+from tasks.cadence import record_fetch
+from tasks.rule_search import build_search_criteria, build_gmail_raw
 
 # --- IMPORTS ATUALIZADOS ---
 # Importa os modelos, incluindo o novo AutomationRule
-from emails.models import MailBox, EmailMessage, EmailStatus, AutomationRule 
+from emails.models import MailBox, MailBoxSyncState, EmailMessage, EmailStatus, AutomationRule 
+from emails.matching import get_rule_matcher, match_rule
+from tasks import stages
 # Importa a lógica de processamento e os wrappers
 from integrations.telegram import notify_telegram 
-from extraction.ai_wrapper import extract_fields_from_text 
+from extraction.ai_wrapper import extract_fields_from_text, build_user_prompt, AI_MODEL
+from extraction.cache import get_extraction_cache, cache_key, profile_scope
+from extraction.registry import get_compiled_profile, get_partial_profile, CompiledProfile
+from extraction.fastpath import pre_extract
+from extraction.preprocess import preprocess_body
+from extraction import metrics
+from extraction.async_engine import ExtractionRequest, run_extractions
 # Importa o modelo de perfil de Juliano
-from extraction.models import ExtractionProfile 
+from extraction.models import ExtractionProfile, ExtractionBatchItem
 
 logger = logging.getLogger(__name__)
 
 
-# NOVO: Mapeamento para buscar a classe do schema pelo nome
-SCHEMA_MAP = {
-    'ProcessoJuridicoSchema': ProcessoJuridicoSchema,
-    'ServiceOrderSchema': ServiceOrderSchema,
-    'SupportRequestSchema': SupportRequestSchema,
-    # Adicionar novos schemas aqui
-}
-
-
 
 # -------------------------------------------------------------------
 # Wrapper: mantém o NOME notify_telegram, mas aceita assinaturas diferentes
@@ -90,87 +93,388 @@ def notify_telegram(*args, **kwargs):
     return None
 
 
-# ----------------- Helpers -----------------
-def _decode_str(value: str) -> str:
-    if not value:
-        return ""
+# ----------------- Atualiza checkpoint -----------------
+def touch_mailbox_checkpoint(mailbox: MailBox, processed_uids, sync_state: MailBoxSyncState = None):
+    """
+    Marca o momento do último fetch e, se houver UIDs processados, avança o
+    maior UID ingerido no checkpoint de sincronização da pasta.
+    """
+    mailbox.last_fetch_at = timezone.now()
     try:
-        return str(make_header(decode_header(value)))
-    except Exception:
-        return value
+        mailbox.save(update_fields=["last_fetch_at"])
+    except Exception as e:
+        logger.warning("Falha ao atualizar checkpoint da MailBox %s: %s", mailbox.id, e)
 
-def _to_aware(dt):
-    if dt is None:
-        return timezone.now()
-    try:
-        if timezone.is_naive(dt):
-            return timezone.make_aware(dt, timezone.get_current_timezone())
-        return dt
-    except Exception:
-        return timezone.now()
+    uids = [x for x in (processed_uids or []) if x is not None]
+    if sync_state is None or not uids:
+        return
+    highest = max(uids)
+    if sync_state.last_uid is None or highest > sync_state.last_uid:
+        sync_state.last_uid = highest
+        sync_state.save(update_fields=["last_uid", "updated_at"])
 
-def _extract_body(email_obj):
-    """Prefere text/plain; fallback para qualquer text/*."""
-    try:
-        if email_obj.is_multipart():
-            for part in email_obj.walk():
-                ctype = (part.get_content_type() or "").lower()
-                disp = (part.get_content_disposition() or "").lower()
-                if ctype == "text/plain" and "attachment" not in disp:
-                    return (part.get_content() or "").strip()
-            # fallback text/*
-            for part in email_obj.walk():
-                if (part.get_content_type() or "").lower().startswith("text/"):
-                    return (part.get_content() or "").strip()
-            return ""
-        return (email_obj.get_content() or "").strip()
-    except Exception:
-        return ""
 
-def _safe_int(value, default=None):
-    try:
-        return int(value)
-    except Exception:
-        return default
+def load_sync_state(mailbox: MailBox, folder: str, select_info) -> MailBoxSyncState:
+    """
+    Carrega (ou cria) o checkpoint da pasta selecionada. Se o UIDVALIDITY do
+    servidor mudou, os UIDs guardados não identificam mais as mesmas mensagens:
+    o checkpoint é zerado e a pasta volta a ser tratada como primeira sincronização
+    (a deduplicação por Message-ID evita registros repetidos).
+    """
+    sync_state, _ = MailBoxSyncState.objects.get_or_create(mailbox=mailbox, folder=folder)
+    uidvalidity = _safe_int((select_info or {}).get(b'UIDVALIDITY'))
+    if uidvalidity is not None and sync_state.uidvalidity != uidvalidity:
+        if sync_state.uidvalidity is not None:
+            logger.warning(
+                "UIDVALIDITY da MailBox %s/%s mudou (%s -> %s); checkpoint reiniciado.",
+                mailbox.id, folder, sync_state.uidvalidity, uidvalidity,
+            )
+        sync_state.reset(uidvalidity)
+        sync_state.save()
+    return sync_state
+
+
+def server_filter_criteria(server, mailbox: MailBox) -> list:
+    """
+    Critérios extras de SEARCH derivados das regras ativas, para MailBoxes com
+    `server_side_filter`. Lista vazia = sem filtro (baixa tudo).
+    """
+    if not mailbox.server_side_filter:
+        return []
+    rules = list(AutomationRule.objects.filter(mailbox=mailbox, is_active=True))
+    if server.has_capability('X-GM-EXT-1'):
+        criteria = build_gmail_raw(rules)
+    else:
+        criteria = build_search_criteria(rules)
+    if criteria is None:
+        logger.info("MailBox %s: regras ativas não permitem filtro no servidor; buscando tudo.", mailbox.id)
+        return []
+    return criteria
+
+
+def search_uids(server, criteria, filter_criteria=()):
+    if filter_criteria:
+        return server.search(list(criteria) + list(filter_criteria), 'UTF-8')
+    return server.search(criteria)
+
+
+def _search_new_uids(server, sync_state: MailBoxSyncState, select_info, filter_criteria=()) -> list:
+    """
+    UIDs acima do checkpoint, em ordem crescente. Sem custo de SEARCH quando o
+    UIDNEXT ou o HIGHESTMODSEQ (CONDSTORE) mostram que nada mudou na pasta.
+    Com `filter_criteria` só voltam os candidatos das regras; o resto da faixa
+    é pulado quando o checkpoint avança até UIDNEXT-1.
+    """
+    last_uid = int(sync_state.last_uid)
+    select_info = select_info or {}
+
+    uidnext = _safe_int(select_info.get(b'UIDNEXT'))
+    if uidnext is not None and uidnext <= last_uid + 1:
+        return []
+
+    criteria = ['UID', f'{last_uid + 1}:*']
+    highest_modseq = _safe_int(select_info.get(b'HIGHESTMODSEQ'))
+    if highest_modseq is not None and sync_state.highest_modseq is not None:
+        if highest_modseq == sync_state.highest_modseq:
+            return []
+        # CONDSTORE: só mensagens alteradas/criadas desde o último MODSEQ visto
+        criteria += ['MODSEQ', sync_state.highest_modseq + 1]
+
+    uids = search_uids(server, criteria, filter_criteria)
+    # "n:*" sempre devolve ao menos a última mensagem, mesmo com UID < n
+    return sorted(u for u in uids if int(u) > last_uid)
 
-def _model_has_field(model_cls, field_name: str) -> bool:
+
+def _arrivals(select_info, last_uid: int, uids) -> int:
+    """
+    Mensagens que chegaram à pasta acima do checkpoint: UIDNEXT-1 - last_uid,
+    contando as descartadas pelo filtro no servidor. Sem UIDNEXT, os UIDs vistos.
+    """
+    uidnext = _safe_int((select_info or {}).get(b'UIDNEXT'))
+    if uidnext is None:
+        return len(uids)
+    return max(len(uids), uidnext - 1 - int(last_uid))
+
+
+def _complete_sync_state(sync_state: MailBoxSyncState, select_info):
+    """
+    Chamado só quando todos os UIDs da rodada foram commitados: fixa o
+    HIGHESTMODSEQ visto no SELECT e leva o checkpoint até UIDNEXT-1, para que a
+    próxima rodada não reabra o histórico já considerado.
+    """
+    select_info = select_info or {}
+    uidnext = _safe_int(select_info.get(b'UIDNEXT'))
+    if uidnext is not None:
+        sync_state.last_uid = max(sync_state.last_uid or 0, uidnext - 1)
+    sync_state.highest_modseq = _safe_int(select_info.get(b'HIGHESTMODSEQ'))
+    sync_state.save(update_fields=["last_uid", "highest_modseq", "updated_at"])
+
+
+# ----------------- Conexão IMAP -----------------
+def mailbox_connection_params(mailbox: MailBox) -> dict:
+    """
+    Resolve host/porta/credenciais/pasta da MailBox, aplicando os overrides
+    de ambiente (IMAP_HOST, IMAP_PORT, IMAP_USERNAME, IMAP_PASSWORD, IMAP_SSL).
+    O mapeamento de atributos é resolvido uma vez por processo.
+    """
+    return get_params_resolver().resolve(mailbox)
+
+
+def connect_imap(params: dict):
+    """Abre a conexão IMAP e autentica; a pasta é selecionada por quem chama."""
+    server = imapclient.IMAPClient(params["host"], ssl=params["use_ssl"], port=params["port"], timeout=30)
+    server.login(params["username"], params["password"])
+    return server
+
+
+# ----------------- Parse + persistência -----------------
+def _fetch_batch_full(server, batch, mailbox_id) -> list:
+    """
+    Modo padrão: baixa o RFC822 completo de cada UID e faz o parse no pool de
+    processos (tasks.parsing), preservando a ordem do lote. Com o arquivo
+    bruto ligado (RAW_ARCHIVE_BACKEND), o RFC822 também é gravado em emails.archive.
+    """
+    fetched = server.fetch(batch, ['RFC822', 'UID', 'FLAGS', 'ENVELOPE'])
+    items = []
+    for uid in batch:
+        data = fetched.get(uid)
+        if not data:
+            continue
+
+        raw_bytes = data.get(b'RFC822') or data.get('RFC822') \
+                    or data.get(b'BODY[]') or data.get('BODY[]')
+        if not raw_bytes:
+            logger.warning("UID %s sem corpo (RFC822/BODY[] ausentes) na MailBox %s", uid, mailbox_id)
+            continue
+        items.append((uid, raw_bytes))
+
+    store = get_raw_store()
+    raw_by_uid = dict(items) if store is not None else {}
+
+    records = []
+    for uid, record, error in iter_parsed(
+        items,
+        workers=settings.IMAP_PARSE_WORKERS,
+        min_batch=settings.IMAP_PARSE_POOL_MIN_BATCH,
+        start_method=settings.IMAP_PARSE_START_METHOD,
+    ):
+        if error:
+            logger.error("Erro ao processar UID %s na MailBox %s: %s", uid, mailbox_id, error)
+            notify_telegram(f"[fetch_emails] Erro UID {uid} MailBox {mailbox_id}: {error}")
+            continue
+        if store is not None:
+            # arquiva antes do INSERT: o EmailMessage nunca aponta para um hash ausente
+            try:
+                record["raw_sha256"] = store.put(raw_by_uid[uid], record["sha256"])
+            except Exception as e:
+                logger.warning("Falha ao arquivar RFC822 do UID %s na MailBox %s: %s", uid, mailbox_id, e)
+        records.append(record)
+    return records
+
+
+def _bulk_insert_emails(rows: list) -> list:
+    """
+    Insere as linhas com um único bulk_create. Se outro worker inseriu algum
+    Message-ID no meio tempo (IntegrityError no índice único), refaz linha a
+    linha com savepoint, descartando apenas as duplicadas.
+    """
     try:
-        return any(getattr(f, "name", None) == field_name for f in model_cls._meta.get_fields())
-    except Exception:
-        return False
+        with transaction.atomic():
+            created = EmailMessage.objects.bulk_create(rows)
+    except IntegrityError:
+        created = []
+        for row in rows:
+            row.pk = None
+            try:
+                with transaction.atomic():
+                    row.save(force_insert=True)
+                created.append(row)
+            except IntegrityError:
+                logger.info("Email duplicado (message_id=%s) inserido em paralelo - ignorando.", row.message_id)
+        return created
+
+    # Backends sem RETURNING (ex: MySQL) não preenchem o pk no bulk_create
+    if created and created[0].pk is None:
+        ids = dict(
+            EmailMessage.objects.filter(message_id__in=[r.message_id for r in created])
+            .values_list('message_id', 'id')
+        )
+        for row in created:
+            row.pk = ids.get(row.message_id)
+    return created
 
 
-# ----------------- Atualiza checkpoint -----------------
-def _touch_mailbox_checkpoint(mailbox: MailBox, processed_uids):
-    update_fields = []
-
-    # marca o momento do último fetch
-    if hasattr(mailbox, "last_checked"):
-        mailbox.last_checked = timezone.now()
-        update_fields.append("last_checked")
-    elif hasattr(mailbox, "last_fetch_at"):
-        mailbox.last_fetch_at = timezone.now()
-        update_fields.append("last_fetch_at")
-
-    # avança last_uid, se existir e houver UIDs processados
-    if processed_uids and hasattr(mailbox, "last_uid"):
-        try:
-            mailbox.last_uid = max([x for x in processed_uids if x is not None])
-            if "last_checked" not in update_fields and hasattr(mailbox, "last_checked"):
-                update_fields.append("last_checked")
-            if "last_fetch_at" not in update_fields and hasattr(mailbox, "last_fetch_at"):
-                update_fields.append("last_fetch_at")
-        except Exception:
-            pass
+def enqueue_processing(email_ids):
+    """Enfileira o processamento em jobs agrupados (PROCESS_EMAIL_GROUP_SIZE ids por job)."""
+    group_size = max(1, settings.PROCESS_EMAIL_GROUP_SIZE)
+    for i in range(0, len(email_ids), group_size):
+        async_task('tasks.tasks.process_email_batch', email_ids[i:i + group_size])
+
+
+def _persist_batch(mailbox: MailBox, records: list, host: str) -> list:
+    """
+    Persiste um lote de registros: uma query IN para a deduplicação, a escolha
+    da AutomationRule de cada email, um bulk_create e o enfileiramento agrupado,
+    disparado só após o commit. Emails sem regra ficam IGNORED e não entram na
+    fila. Retorna a lista de EmailMessage criados.
+    """
+    for record in records:
+        # --- garante message_id não-nulo (alguns emails vêm sem) ---
+        if not record["message_id"]:
+            record["message_id"] = f"<uid-{int(record['uid'])}@{host}>"
+
+    # Deduplicação por Message-ID (índice único global): 1 query para o lote todo
+    message_ids = [record["message_id"] for record in records]
+    seen = set(
+        EmailMessage.objects.filter(message_id__in=message_ids).values_list('message_id', flat=True)
+    )
+
+    builder = get_payload_builder()
+    rows = []
+    for record in records:
+        if record["message_id"] in seen:
+            continue
+        seen.add(record["message_id"])  # duplicatas dentro do próprio lote
+        rows.append(builder.build(record, mailbox, record["uid"]))
+
+    if not rows:
+        return []
+
+    # Regras avaliadas na ingestão (emails.matching, matcher em cache): o worker já recebe a regra
+    matcher = get_rule_matcher(mailbox.id)
+    for row in rows:
+        row.matched_rule_id = matcher.match(row.subject, row.sender, row)
+        if row.matched_rule_id is None:
+            row.status = EmailStatus.IGNORED
+
+    with transaction.atomic():
+        created = _bulk_insert_emails(rows)
+        email_ids = [email.pk for email in created if email.pk is not None and email.matched_rule_id is not None]
+        if len(email_ids) < len(created):
+            logger.info("MailBox %s: %s emails sem regra correspondente (IGNORED, não enfileirados).",
+                        mailbox.id, len(created) - len(email_ids))
+        if email_ids:
+            # Enfileira o processamento para a próxima etapa (Juliano/Thales)
+            transaction.on_commit(lambda: enqueue_processing(email_ids))
+    return created
+
+
+def ingest_uids(server, mailbox: MailBox, uids, host: str, sync_state: MailBoxSyncState = None,
+                deadline: float = None):
+    """
+    Baixa os UIDs informados da pasta já selecionada em `server`, cria um
+    EmailMessage para cada mensagem nova e enfileira o processamento.
+
+    Cada lote IMAP é persistido em uma transação; o checkpoint (sync_state) só
+    avança depois que o lote foi commitado. Uma falha interrompe a ingestão
+    para que os UIDs do lote sejam buscados de novo na próxima execução.
+
+    Com `deadline` (time.monotonic), para entre lotes quando ele passa: os UIDs
+    restantes ficam acima do checkpoint e entram na próxima execução. O primeiro
+    lote sempre roda, para a caixa andar mesmo começando em cima do prazo.
+
+    Usado tanto pelo polling (fetch_emails) quanto pelo daemon IMAP IDLE.
+    Retorna (total_criado, uids_processados).
+    """
+    mailbox_id = mailbox.id
+    processed_uids = []
+    total_created = 0
+    partial = settings.IMAP_PARTIAL_FETCH
+
+    # ---- Busca em lotes ----
+    BATCH_SIZE = 200
+    for i in range(0, len(uids), BATCH_SIZE):
+        if i and deadline is not None and time.monotonic() >= deadline:
+            logger.info("MailBox %s: prazo do fetch esgotado; %s UIDs ficam para a próxima execução.",
+                        mailbox_id, len(uids) - i)
+            break
+        batch = uids[i:i+BATCH_SIZE]
+        if partial:
+            # header-first: ENVELOPE/BODYSTRUCTURE e só a parte de texto (sem anexos)
+            records = fetch_batch_partial(server, batch, settings.IMAP_MAX_MESSAGE_BYTES)
+        else:
+            records = _fetch_batch_full(server, batch, mailbox_id)
 
-    if update_fields:
         try:
-            mailbox.save(update_fields=update_fields)
+            created = _persist_batch(mailbox, records, host)
         except Exception as e:
-            logger.warning("Falha ao atualizar checkpoint da MailBox %s: %s", mailbox.id, e)
+            logger.exception("Falha ao persistir lote de %s UIDs na MailBox %s: %s", len(batch), mailbox_id, e)
+            notify_telegram(f"[fetch_emails] Falha ao salvar lote (UIDs {batch[0]}..{batch[-1]}) MailBox {mailbox_id}: {e}")
+            break
+
+        total_created += len(created)
+        batch_uids = [_safe_int(uid) for uid in batch]
+        processed_uids.extend(batch_uids)
+        touch_mailbox_checkpoint(mailbox, processed_uids=batch_uids, sync_state=sync_state)
+
+    return total_created, processed_uids
 
 
 # ----------------- FUNÇÃO PRINCIPAL -----------------
+def fetch_mailbox(server, mailbox: MailBox, params: dict, deadline: float = None) -> int:
+    """
+    Sincroniza a pasta da MailBox usando uma conexão IMAP já autenticada
+    (aberta pelo fetch_emails ou reaproveitada pelo orquestrador).
+    `deadline` (time.monotonic) limita a ingestão: a caixa interrompida no
+    prazo continua vencida para o próximo tick do orquestrador.
+    Retorna quantos EmailMessage foram criados.
+    """
+    mailbox_id = mailbox.id
+    previous_fetch_at = mailbox.last_fetch_at
+    select_info = server.select_folder(params["folder"], readonly=True)
+    sync_state = load_sync_state(mailbox, params["folder"], select_info)
+    incremental = sync_state.last_uid is not None
+    previous_last_uid = sync_state.last_uid
+    filter_criteria = server_filter_criteria(server, mailbox)
+
+    # ---- Estratégia de busca ----
+    uids = []
+    if incremental:
+        # incremental: apenas UIDs acima do checkpoint
+        uids = _search_new_uids(server, sync_state, select_info, filter_criteria)
+    else:
+        # primeira sincronização (ou UIDVALIDITY novo)
+        try:
+            uids = search_uids(server, ['UNSEEN'], filter_criteria)
+        except Exception as e:
+            logger.warning("[fetch_emails] Falha search UNSEEN em MailBox %s: %s", mailbox_id, e)
+
+        if not uids:
+            try:
+                all_uids = search_uids(server, ['ALL'], filter_criteria)
+                all_uids.sort()
+                uids = all_uids[-50:]  # fallback seguro
+            except Exception as e:
+                logger.error("[fetch_emails] Falha search ALL em MailBox %s: %s", mailbox_id, e)
+                uids = []
+        uids = sorted(uids)
+
+    total_created = 0
+    cut_short = False
+    if not uids:
+        touch_mailbox_checkpoint(mailbox, processed_uids=False)
+        _complete_sync_state(sync_state, select_info)
+    else:
+        total_created, processed_uids = ingest_uids(server, mailbox, uids, params["host"], sync_state, deadline)
+        if len(processed_uids) == len(uids):
+            _complete_sync_state(sync_state, select_info)
+        else:
+            cut_short = deadline is not None and time.monotonic() >= deadline
+
+    # ---- Cadência adaptativa: só mensagens novas contam como tráfego (não o histórico da 1ª sincronização) ----
+    try:
+        if incremental:
+            record_fetch(mailbox, _arrivals(select_info, previous_last_uid, uids), previous_fetch_at)
+        else:
+            record_fetch(mailbox, 0)
+        if cut_short:
+            # ainda há UIDs na fila: vencida de novo já no próximo tick
+            MailBox.objects.filter(pk=mailbox_id).update(next_fetch_at=timezone.now())
+    except Exception as e:
+        logger.warning("[fetch_emails] Falha ao atualizar cadência da MailBox %s: %s", mailbox_id, e)
+    return total_created
+
+
 def fetch_emails(mailbox_id) -> int: 
     """
     Lê emails via IMAP e cria EmailMessage para cada mensagem nova.
@@ -186,205 +490,22 @@ def fetch_emails(mailbox_id) -> int:
         return 0
         
     server = None
-    processed_uids = []
-    total_created = 0
 
     try:
         mailbox = MailBox.objects.get(id=mailbox_id)
 
-        # ---- Campos reais do seu modelo ----
-        
-        username = getattr(mailbox, "username", None) or getattr(mailbox, "imap_username", None)
-        password = (
-            getattr(mailbox, "password", None)
-            or getattr(mailbox, "imap_password", None)
-            or getattr(mailbox, "app_password", None)
-        )
-        host = getattr(mailbox, "imap_host", None) or getattr(mailbox, "host", None)
-        port = getattr(mailbox, "imap_port", None) or getattr(mailbox, "port", None) or 993
-        use_ssl = True if not hasattr(mailbox, "use_ssl") else bool(getattr(mailbox, "use_ssl", True))
-        folder = getattr(mailbox, "folder", None) or "INBOX"
-        last_uid = getattr(mailbox, "last_uid", None)
-
-        # ---- OVERRIDE via variáveis de ambiente ----
-        env_host = os.getenv("IMAP_HOST")
-        env_port = os.getenv("IMAP_PORT")
-        env_user = os.getenv("IMAP_USERNAME")
-        env_pass = os.getenv("IMAP_PASSWORD")
-
-        if env_host:
-            host = env_host
-        if env_port:
-            try:
-                port = int(env_port)
-            except Exception:
-                pass
-        if env_user:
-            username = env_user
-        if env_pass:
-            password = env_pass.replace(" ", "")  # remove espaços da app password do Gmail
+        params = mailbox_connection_params(mailbox)
 
         # validação
-        if not host or not username or not password:
+        if not params["host"] or not params["username"] or not params["password"]:
             msg = f"[fetch_emails] MailBox {mailbox_id} incompleta: host/username/password ausentes."
             logger.error(msg)
             notify_telegram(msg)
             return 0
 
         # ---- Conexão IMAP ----
-        server = imapclient.IMAPClient(host, ssl=use_ssl, port=port, timeout=30)
-        server.login(username, password)
-        server.select_folder(folder, readonly=True)
-
-        # ---- Estratégia de busca ----
-        uids = []
-        if last_uid is not None:
-            try:
-                uids = server.search(['UID', f'{int(last_uid) + 1}:*'])
-            except Exception as e:
-                logger.warning("[fetch_emails] Falha search por UID em MailBox %s: %s", mailbox_id, e)
-
-        if not uids:
-            try:
-                uids = server.search(['UNSEEN'])
-            except Exception as e:
-                logger.warning("[fetch_emails] Falha search UNSEEN em MailBox %s: %s", mailbox_id, e)
-
-        if not uids:
-            try:
-                all_uids = server.search(['ALL'])
-                all_uids.sort()
-                uids = all_uids[-50:]  # fallback seguro
-            except Exception as e:
-                logger.error("[fetch_emails] Falha search ALL em MailBox %s: %s", mailbox_id, e)
-                uids = []
-
-        if not uids:
-            _touch_mailbox_checkpoint(mailbox, processed_uids=False)
-            return 0
-
-        # ---- Busca em lotes ----
-        BATCH_SIZE = 200
-        for i in range(0, len(uids), BATCH_SIZE):
-            batch = uids[i:i+BATCH_SIZE]
-            fetched = server.fetch(batch, ['RFC822', 'UID', 'FLAGS', 'ENVELOPE'])
-
-            for uid in batch:
-                try:
-                    data = fetched.get(uid)
-                    if not data:
-                        continue
-
-                    raw_bytes = data.get(b'RFC822') or data.get('RFC822') \
-                                or data.get(b'BODY[]') or data.get('BODY[]')
-                    if not raw_bytes:
-                        logger.warning("UID %s sem corpo (RFC822/BODY[] ausentes) na MailBox %s", uid, mailbox_id)
-                        continue
-
-                    msg = BytesParser(policy=policy.default).parsebytes(raw_bytes)
-
-                    message_id = (msg.get('Message-Id') or msg.get('Message-ID') or "").strip() or None
-                    subject = _decode_str(msg.get('Subject'))
-                    from_addr = _decode_str(msg.get('From'))
-                    to_addr = _decode_str(msg.get('To'))
-                    date_hdr = msg.get('Date')
-
-                    try:
-                        dt = parsedate_to_datetime(date_hdr) if date_hdr else None
-                    except Exception:
-                        dt = None
-                    date_aware = _to_aware(dt)
-
-                    body_text = _extract_body(msg)
-
-                    # Deduplicação por Message-ID (se o modelo tiver)
-                    if message_id and _model_has_field(EmailMessage, "message_id"):
-                        try:
-                            qs = EmailMessage.objects.filter(message_id=message_id)
-                            if _model_has_field(EmailMessage, "mailbox"):
-                                qs = qs.filter(mailbox=mailbox)
-                            if qs.exists():
-                                processed_uids.append(_safe_int(uid))
-                                continue
-                        except Exception:
-                            pass
-
-                    # Monta payload respeitando campos existentes
-                    # --- garante message_id não-nulo (alguns emails vêm sem) ---
-                    if not message_id:
-                        message_id = f"<uid-{int(uid)}@{host}>"
-
-                    # --- Monta payload respeitando os campos do seu modelo ---
-                    payload = {}
-
-                    # FK para a mailbox
-                    if _model_has_field(EmailMessage, "mailbox"):
-                        payload["mailbox"] = mailbox
-
-                    # IDs / cabeçalhos
-                    if _model_has_field(EmailMessage, "message_id"):
-                        payload["message_id"] = message_id
-
-                    if _model_has_field(EmailMessage, "subject"):
-                        payload["subject"] = subject or "(sem assunto)"
-
-                    # REMAPEIA 'From' para o campo obrigatório 'sender'
-                    if _model_has_field(EmailMessage, "sender"):
-                        payload["sender"] = from_addr
-                    elif _model_has_field(EmailMessage, "from_addr"):
-                        payload["from_addr"] = from_addr  # caso exista também
-
-                    # REMAPEIA a data para o campo obrigatório 'received_at'
-                    if _model_has_field(EmailMessage, "received_at"):
-                        payload["received_at"] = date_aware
-                    elif _model_has_field(EmailMessage, "date"):
-                        payload["date"] = date_aware
-
-                    # Corpo
-                    if _model_has_field(EmailMessage, "body_text"):
-                        payload["body_text"] = body_text or ""
-
-                    # UID (se existir no modelo)
-                    if _model_has_field(EmailMessage, "uid"):
-                        payload["uid"] = _safe_int(uid)
-
-                    # Status (se existir e houver enum)
-                    if _model_has_field(EmailMessage, "status"):
-                        try:
-                            status_value = getattr(EmailStatus, "RECEIVED", None) or getattr(EmailStatus, "received", None)
-                            if status_value is not None:
-                                payload["status"] = status_value
-                        except Exception:
-                            pass
-
-                    # timestamps obrigatórios (se o modelo não usar auto_now/auto_now_add)
-                    now = timezone.now()
-                    if _model_has_field(EmailMessage, "created_at"):
-                        payload["created_at"] = now
-                    if _model_has_field(EmailMessage, "updated_at"):
-                        payload["updated_at"] = now
-
-                    try:
-                        email_msg = EmailMessage.objects.create(**payload)
-                        total_created += 1
-                        processed_uids.append(_safe_int(uid))
-                        # Enfileira o processamento para a próxima etapa (Juliano/Thales)
-                        async_task('tasks.tasks.process_email', email_msg.id)
-                    except IntegrityError:
-                        logger.info("Email duplicado (uid=%s, mailbox=%s) - ignorando.", uid, mailbox_id)
-                        processed_uids.append(_safe_int(uid))
-                        continue
-                    except Exception as e:
-                        logger.exception("Falha ao criar EmailMessage (UID %s MailBox %s): %s", uid, mailbox_id, e)
-                        notify_telegram(f"[fetch_emails] Falha ao salvar email UID {uid} MailBox {mailbox_id}: {e}")
-                        continue
-
-                except Exception as e:
-                    logger.exception("Erro ao processar UID %s na MailBox %s: %s", uid, mailbox_id, e)
-                    notify_telegram(f"[fetch_emails] Erro UID {uid} MailBox {mailbox_id}: {e}")
-
-        _touch_mailbox_checkpoint(mailbox, processed_uids=processed_uids)
-        return total_created
+        server = connect_imap(params)
+        return fetch_mailbox(server, mailbox, params)
 
     except MailBox.DoesNotExist:
         msg = f"[fetch_emails] MailBox {mailbox_id} não encontrada."
@@ -411,87 +532,294 @@ def fetch_emails(mailbox_id) -> int:
 
 # --- FUNÇÃO PRINCIPAL DO PIPELINE (THALES) ---
 
-def process_email(email_id):
+def process_email_batch(email_ids):
     """
-    Worker principal: coordena a extração de IA e as integrações externas.
-    Agora usa o modelo AutomationRule para definir o fluxo dinamicamente.
+    Job agrupado enfileirado pelo fetch_emails: processa vários emails em uma
+    única tarefa do Django-Q (um round trip de broker por grupo, não por email).
+
+    Com EXTRACTION_ASYNC_ENABLED, as chamadas à IA do grupo rodam concorrentes
+    no motor assíncrono (extraction.async_engine); preparação e integrações
+    continuam síncronas, email a email.
+
+    Passado PROCESS_EMAIL_TIME_BUDGET_SECONDS, os ids que faltam voltam para a
+    fila em um novo job, em vez de o grupo ser morto pelo 'timeout' do Q_CLUSTER
+    com emails presos em PENDING/PROCESSING. Retorna quantos ids este job tratou.
     """
+    deadline = time.monotonic() + settings.PROCESS_EMAIL_TIME_BUDGET_SECONDS
+    if not settings.EXTRACTION_ASYNC_ENABLED:
+        for index, email_id in enumerate(email_ids):
+            if index and _requeue_if_over_budget(email_ids[index:], deadline):
+                return index
+            process_email(email_id)
+        return len(email_ids)
+
+    pending = []
+    handled = len(email_ids)
+    for index, email_id in enumerate(email_ids):
+        if index and _requeue_if_over_budget(email_ids[index:], deadline):
+            handled = index
+            break
+        job = _prepare_extraction(email_id)
+        if job is None:
+            continue
+        if job.resumed:
+            finish_extraction(job, job.email.extracted_data)
+            continue
+        try:
+            resolved = _resolve_without_llm(job)
+            if resolved is None and job.profile.delivery_mode == ExtractionProfile.DeliveryMode.BATCH:
+                _defer_to_batch(job)
+                continue
+        except Exception as e:
+            _handle_pipeline_error(job.email, email_id, e)
+            continue
+        if resolved is not None:
+            finish_extraction(job, resolved)
+        else:
+            pending.append(job)
+
+    if pending:
+        logger.info(f"Extraindo {len(pending)} emails em paralelo (motor assíncrono).")
+        try:
+            results = run_extractions([
+                ExtractionRequest(text=job.text, compiled=job.llm_compiled, instructions=job.instructions)
+                for job in pending
+            ])
+        except Exception as e:
+            results = [e] * len(pending)
+
+        for job, extracted_data in zip(pending, results):
+            try:
+                if isinstance(extracted_data, Exception):
+                    raise extracted_data
+                extracted_data = _merge_prefilled(job, extracted_data)
+                store_extraction(job, extracted_data)
+            except Exception as e:
+                _handle_pipeline_error(job.email, job.email.id, e)
+                continue
+            finish_extraction(job, extracted_data)
+
+    return handled
+
+
+def _requeue_if_over_budget(remaining, deadline: float) -> bool:
+    if time.monotonic() < deadline:
+        return False
+    logger.warning(f"process_email_batch: orçamento de tempo esgotado; reenfileirando {len(remaining)} emails.")
+    async_task('tasks.tasks.process_email_batch', list(remaining))
+    return True
+
+
+@dataclass
+class ExtractionJob:
+    """Email pronto para a chamada à IA (regra, perfil compilado e instruções resolvidos)."""
+    email: EmailMessage
+    rule: AutomationRule
+    profile: ExtractionProfile
+    compiled: CompiledProfile
+    instructions: str
+    text: str
+    cache_key: str = None
+    # Campos já preenchidos pelo extraction.fastpath e o perfil (parcial) pedido à IA
+    prefilled: dict = field(default_factory=dict)
+    llm_compiled: CompiledProfile = None
+    # Extração já concluída numa execução anterior: só faltam as integrações
+    resumed: bool = False
+
+    def __post_init__(self):
+        if self.llm_compiled is None:
+            self.llm_compiled = self.compiled
+
+
+def _handle_pipeline_error(email, email_id, e):
+    # Lógica de erro: marcar como FAILED e logar
     try:
-        email = EmailMessage.objects.get(pk=email_id)
-        
-        # 1. ATUALIZA STATUS INICIAL
-        email.status = EmailStatus.PROCESSING
-        email.processing_attempts += 1
+        stages.fail_running(email, e)
+        email.status = EmailStatus.FAILED
         email.save()
+        logger.exception(f"Erro crítico no processamento do email {email_id}: {e}")
+        notify_telegram(email_msg=email, message=f"⚠️ Erro Crítico no pipeline para email ID: {email.id}. Detalhes: {e}")
+    except Exception:
+        logger.exception(f"Erro duplo no processamento e no logging do email {email_id}")
+
+
+def _prepare_extraction(email_id):
+    """
+    Etapas 1-3 do pipeline até a chamada à IA. Devolve None quando o email já
+    foi resolvido aqui (sem regra, sem perfil, schema desconhecido ou erro).
+    Se a extração já foi concluída antes (tasks.stages), devolve um job
+    `resumed` que só dispara as integrações pendentes.
+    """
+    email = None
+    try:
+        email = EmailMessage.objects.select_related('matched_rule__extraction_profile').get(pk=email_id)
+
+        if (stages.is_done(email, stages.EXTRACT) and email.extracted_data is not None
+                and email.matched_rule is not None and email.matched_rule.extraction_profile is not None):
+            email.processing_attempts += 1
+            logger.info(f"Email ID: {email.id} já extraído; retomando das integrações pendentes.")
+            return ExtractionJob(email=email, rule=email.matched_rule, profile=email.matched_rule.extraction_profile,
+                                 compiled=None, instructions='', text='', resumed=True)
+
+        # 1. REGRA DE AUTOMAÇÃO
         
-        # 2. BUSCA E AVALIA AS REGRAS DE AUTOMAÇÃO
-        
-        # Busca todas as regras ativas para a MailBox, ordenadas por prioridade
-        rules = AutomationRule.objects.filter(
-            mailbox=email.mailbox, 
-            is_active=True
-        ).order_by('priority')
-
-        matched_rule = None
-        for rule in rules:
-            # Lógica de correspondência de assunto
-            subject_match = True
-            if rule.subject_contains and rule.subject_contains.strip():
-                if rule.subject_contains.lower() not in email.subject.lower():
-                    subject_match = False
-            
-            # Lógica de correspondência de remetente
-            sender_match = True
-            if rule.sender_contains and rule.sender_contains.strip():
-                if rule.sender_contains.lower() not in email.sender.lower():
-                    sender_match = False
-                    
-            if subject_match and sender_match:
-                matched_rule = rule
-                logger.info(f"Regra de Automação correspondente encontrada: {rule.name}")
-                break
-        
+        # Normalmente já escolhida na ingestão (_persist_batch). Só reavalia (emails.matching) em
+        # emails sem regra gravada (antigos, replay) ou se a regra foi apagada/desativada desde então.
+        stages.start(email, stages.MATCH)
+        matched_rule = email.matched_rule
+        if matched_rule is None or not matched_rule.is_active:
+            matched_rule = match_rule(email)
+            email.matched_rule = matched_rule
+        stages.complete(email, stages.MATCH, {"rule_id": matched_rule and matched_rule.id})
+
         if not matched_rule:
-            # Não encontrou regra, ignora e marca como pendente (ou adiciona status 'IGNORED')
-            email.status = EmailStatus.PENDING 
+            email.status = EmailStatus.IGNORED
             email.save()
             logger.info(f"Nenhuma regra de automação correspondente encontrada para o email ID: {email.id}")
-            return
+            return None
+        logger.info(f"Regra de Automação correspondente encontrada: {matched_rule.name}")
+
+        # 2. ATUALIZA STATUS INICIAL
+        email.status = EmailStatus.PROCESSING
+        email.processing_attempts += 1
+        stages.start(email, stages.EXTRACT)
+        email.save()
             
         # 3. EXTRAÇÃO DE DADOS (Juliano) usando o perfil da regra
         profile = matched_rule.extraction_profile
         if not profile:
             msg = f"Regra '{matched_rule.name}' não possui Perfil de Extração. Requer Revisão."
             logger.error(msg)
+            stages.fail(email, stages.EXTRACT, msg)
             email.status = EmailStatus.REQUIRES_REVIEW
             email.save()
             notify_telegram(email_msg=email, message=msg)
-            return
+            return None
 
-        schema_cls = SCHEMA_MAP.get(profile.pydantic_schema_name)
-        if not schema_cls:
+        # Perfil compilado (schema, prompt de sistema e validador), reaproveitado entre emails
+        compiled = get_compiled_profile(profile, AI_MODEL)
+        if not compiled:
             msg = f"Schema '{profile.pydantic_schema_name}' não encontrado no mapeamento. Falha Crítica."
             logger.error(msg)
+            stages.fail(email, stages.EXTRACT, msg)
             email.status = EmailStatus.FAILED
             email.save()
             notify_telegram(email_msg=email, message=msg)
-            return
+            return None
             
         # Usa o prompt template do DB
-        dynamic_prompt = profile.system_prompt_template.format(
-            data_atual=timezone.now().strftime('%d/%m/%Y')
-        )
+        dynamic_prompt = compiled.render_instructions(timezone.now().date())
+
+        # Texto enviado à IA: sem citações/assinaturas/avisos e dentro do orçamento do perfil
+        text = _preprocessed_text(email, profile)
 
         logger.info(f"Iniciando extração IA para email ID: {email.id} usando perfil: {profile.name}")
-        
-        extracted_data = extract_fields_from_text(
-            text=email.body_text,
-            schema=schema_cls, 
-            prompt_template=dynamic_prompt, 
-            examples=[]
-        )
-        
+        return ExtractionJob(email=email, rule=matched_rule, profile=profile,
+                             compiled=compiled, instructions=dynamic_prompt, text=text)
+
+    except EmailMessage.DoesNotExist:
+        logger.error(f"EmailMessage {email_id} não encontrado.")
+    except Exception as e:
+        _handle_pipeline_error(email, email_id, e)
+    return None
+
+
+def _preprocessed_text(email, profile):
+    """Pré-processa o corpo (extraction.preprocess) e guarda o resultado no email para auditoria."""
+    if not settings.EXTRACTION_PREPROCESS_ENABLED:
+        return email.body_text
+    body = preprocess_body(email.body_text, profile.max_input_tokens, AI_MODEL)
+    email.preprocessed_text = body.text
+    email.input_tokens = body.tokens
+    email.save(update_fields=['preprocessed_text', 'input_tokens', 'updated_at'])
+    metrics.incr('input_tokens_original', body.original_tokens)
+    metrics.incr('input_tokens_sent', body.tokens)
+    return body.text
+
+
+def _cached_extraction(job):
+    """
+    Consulta o cache de resultados (extraction.cache) antes de chamar a API.
+    Guarda a chave no job para store_extraction gravar o resultado depois.
+    """
+    cache = get_extraction_cache()
+    if cache is None:
+        return None
+    job.cache_key = cache_key(
+        job.text, job.compiled.cache_schema_id, job.instructions, job.compiled.cascade_id,
+        scope=profile_scope(job.profile, job.email.mailbox.user_id),
+    )
+    cached = cache.get(job.cache_key)
+    if cached is not None:
+        logger.info(f"Extração do email ID: {job.email.id} servida pelo cache (perfil: {job.profile.name}).")
+    return cached
+
+
+def _fast_path(job):
+    """
+    Pré-extrator determinístico (extraction.fastpath): guarda no job os campos
+    preenchidos com certeza e o perfil parcial que a IA ainda precisa responder.
+    Devolve o resultado completo quando nenhum campo sobra para a IA.
+    """
+    if not settings.EXTRACTION_FASTPATH_ENABLED:
+        return None
+    job.prefilled = pre_extract(job.compiled.schema, job.text)
+    partial = get_partial_profile(job.compiled, frozenset(job.prefilled), AI_MODEL)
+    metrics.incr('fastpath_emails')
+    metrics.incr('fastpath_fields', len(job.prefilled))
+    if partial is None:
+        metrics.incr('fastpath_llm_skipped')
+        logger.info(f"Email ID: {job.email.id} extraído sem IA (fast path).")
+        return job.compiled.compiled_schema.validate_python(job.prefilled)
+    job.llm_compiled = partial
+    return None
+
+
+def _resolve_without_llm(job):
+    """Cache de resultados e, se não houver acerto, o fast path. None se a IA for necessária."""
+    extracted_data = _cached_extraction(job)
+    if extracted_data is None:
+        extracted_data = _fast_path(job)
+    return extracted_data
+
+
+def _merge_prefilled(job, extracted_data):
+    """Junta a resposta (parcial) da IA aos campos do fast path e valida com o schema completo."""
+    if extracted_data is None or not job.prefilled:
+        return extracted_data
+    return job.compiled.compiled_schema.validate_python({**extracted_data, **job.prefilled})
+
+
+def store_extraction(job, extracted_data):
+    # Só resultados válidos são guardados; falhas sempre vão de novo para a IA.
+    cache = get_extraction_cache()
+    if cache is not None and job.cache_key is not None and extracted_data is not None:
+        cache.set(job.cache_key, extracted_data)
+
+
+def _defer_to_batch(job):
+    """Perfil em modo BATCH: o email fica em PROCESSING até o lote (tasks.batch) voltar."""
+    ExtractionBatchItem.objects.create(
+        email=job.email, rule=job.rule, profile=job.profile,
+        user_prompt=build_user_prompt(job.instructions, job.text),
+        cache_key=job.cache_key,
+        prefilled=job.prefilled or None,
+    )
+    from tasks.batch import ensure_batch_schedule
+    ensure_batch_schedule()
+    logger.info(f"Email ID: {job.email.id} aguardando o próximo lote da Batch API (perfil: {job.profile.name}).")
+
+
+def finish_extraction(job, extracted_data):
+    """
+    Etapas 4-5: persiste o resultado da IA e dispara as integrações. Cada
+    integração tem checkpoint (tasks.stages): numa retomada, as já concluídas
+    não são repetidas.
+    """
+    email, profile, matched_rule = job.email, job.profile, job.rule
+    try:
         if extracted_data is None:
+            stages.fail(email, stages.EXTRACT, "Extração IA falhou (resultado inválido).")
             email.status = EmailStatus.REQUIRES_REVIEW
             email.save()
             notify_telegram(email_msg=email, message=f"Revisão necessária para email ID: {email.id}. Extração IA falhou para perfil '{profile.name}'.")
@@ -499,56 +827,92 @@ def process_email(email_id):
 
         email.extracted_data = extracted_data
         email.status = EmailStatus.EXTRACTED
+        if not stages.is_done(email, stages.EXTRACT):
+            stages.complete(email, stages.EXTRACT, {"fields": len(extracted_data)})
         email.save()
         
         # 4. INTEGRAÇÕES (Thales) - Chamada de Integrações
-        
-        logger.info(f"Iniciando notificação Telegram para email ID: {email.id}")
-        
-        # Formatação de Mensagem (Adaptação para o Processo Jurídico ou Genérico)
-        
-        if profile.pydantic_schema_name == 'ProcessoJuridicoSchema':
-            proc_numero = extracted_data.get('numero_processo', 'N/A')
-            movimento = extracted_data.get('resumo_movimentacao', 'Sem resumo.')
-            sugestao = extracted_data.get('sugestao_proximo_passo', 'Revisão manual necessária.')
-            prazo = extracted_data.get('prazo_fatal', None)
-
-            prazo_formatado = f"*{prazo}*" if prazo else "_Não identificado_"
-
-            message = (
-                f"⚖️ **Nova Movimentação Processual (Regra: {matched_rule.name})**\n\n"
-                f"**Processo:** `{proc_numero}`\n"
-                f"**Assunto do E-mail:** {email.subject}\n\n"
-                f"**Resumo da IA:**\n_{movimento}_\n\n"
-                f"**Prazo Fatal:** {prazo_formatado}\n\n"
-                f"**➡️ Próximo Passo Sugerido:**\n`{sugestao}`"
-            )
-        else:
-            document_type = extracted_data.get('document_type', 'Dados Extraídos')
-            confidence = extracted_data.get('confidence_score', 'N/A')
-            
-            message = (
-                f"✅ **Extração Concluída ({document_type}) - Regra: {matched_rule.name}**\n\n"
-                f"**Assunto:** {email.subject}\n"
-                f"**Confiança da IA:** {confidence}%\n\n"
-                f"Dados extraídos salvos para processamento adicional."
-            )
-            
-        notify_telegram(email_msg=email, message=message)   
+        if not stages.is_done(email, stages.TELEGRAM):
+            _notify_extraction(job, extracted_data)
              
         # 5. FINALIZAÇÃO
         email.status = EmailStatus.INTEGRATED 
         email.last_processed_at = timezone.now()
         email.save()
         
-    except EmailMessage.DoesNotExist:
-        logger.error(f"EmailMessage {email_id} não encontrado.")
     except Exception as e:
-        # Lógica de erro: marcar como FAILED e logar
-        try:
-            email.status = EmailStatus.FAILED
-            email.save()
-            logger.exception(f"Erro crítico no processamento do email {email_id}: {e}")
-            notify_telegram(email_msg=email, message=f"⚠️ Erro Crítico no pipeline para email ID: {email.id}. Detalhes: {e}")
-        except Exception:
-            logger.exception(f"Erro duplo no processamento e no logging do email {email_id}")
\ No newline at end of file
+        _handle_pipeline_error(email, email.id, e)
+
+
+def _notify_extraction(job, extracted_data):
+    email, profile, matched_rule = job.email, job.profile, job.rule
+    logger.info(f"Iniciando notificação Telegram para email ID: {email.id}")
+    
+    # Formatação de Mensagem (Adaptação para o Processo Jurídico ou Genérico)
+    
+    if profile.pydantic_schema_name == 'ProcessoJuridicoSchema':
+        proc_numero = extracted_data.get('numero_processo', 'N/A')
+        movimento = extracted_data.get('resumo_movimentacao', 'Sem resumo.')
+        sugestao = extracted_data.get('sugestao_proximo_passo', 'Revisão manual necessária.')
+        prazo = extracted_data.get('prazo_fatal', None)
+
+        prazo_formatado = f"*{prazo}*" if prazo else "_Não identificado_"
+
+        message = (
+            f"⚖️ **Nova Movimentação Processual (Regra: {matched_rule.name})**\n\n"
+            f"**Processo:** `{proc_numero}`\n"
+            f"**Assunto do E-mail:** {email.subject}\n\n"
+            f"**Resumo da IA:**\n_{movimento}_\n\n"
+            f"**Prazo Fatal:** {prazo_formatado}\n\n"
+            f"**➡️ Próximo Passo Sugerido:**\n`{sugestao}`"
+        )
+    else:
+        document_type = extracted_data.get('document_type', 'Dados Extraídos')
+        confidence = extracted_data.get('confidence_score', 'N/A')
+        
+        message = (
+            f"✅ **Extração Concluída ({document_type}) - Regra: {matched_rule.name}**\n\n"
+            f"**Assunto:** {email.subject}\n"
+            f"**Confiança da IA:** {confidence}%\n\n"
+            f"Dados extraídos salvos para processamento adicional."
+        )
+
+    stages.start(email, stages.TELEGRAM)
+    response = notify_telegram(email_msg=email, message=message)
+    sent = response.get('result') if isinstance(response, dict) else None
+    stages.complete(email, stages.TELEGRAM, {"message_id": sent.get('message_id') if isinstance(sent, dict) else None})
+
+
+def process_email(email_id):
+    """
+    Worker principal: coordena a extração de IA e as integrações externas.
+    Agora usa o modelo AutomationRule para definir o fluxo dinamicamente.
+    """
+    job = _prepare_extraction(email_id)
+    if job is None:
+        return
+    if job.resumed:
+        finish_extraction(job, job.email.extracted_data)
+        return
+
+    try:
+        extracted_data = _resolve_without_llm(job)
+        if extracted_data is None and job.profile.delivery_mode == ExtractionProfile.DeliveryMode.BATCH:
+            _defer_to_batch(job)
+            return
+        if extracted_data is None:
+            extracted_data = extract_fields_from_text(
+                text=job.text,
+                schema=job.llm_compiled.schema, 
+                prompt_template=job.instructions, 
+                examples=[],
+                models=job.compiled.models,
+                min_confidence=job.compiled.min_confidence,
+            )
+            extracted_data = _merge_prefilled(job, extracted_data)
+            store_extraction(job, extracted_data)
+    except Exception as e:
+        _handle_pipeline_error(job.email, email_id, e)
+        return
+
+    finish_extraction(job, extracted_data)
@@ -1,3 +1,1016 @@
-from django.test import TestCase
+import base64
+import itertools
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django_q.models import Schedule
+from django.test.utils import CaptureQueriesContext
+from imapclient.imapclient import _normalise_search_criteria
+from imapclient.response_parser import parse_fetch_response
+
+from emails.archive import get_raw_store
+from emails.models import MailBox, MailBoxSyncState, EmailMessage, AutomationRule
+from tasks.batch import _finish_item, poll_extraction_batches, submit_pending_batches, BATCH_SCHEDULE_NAME
+from tasks.cadence import compute_interval, record_fetch
+from tasks.idle import IdleSupervisor, MailBoxIdleWorker
+from tasks.imap_fetch import fetch_batch_partial
+from tasks.mime import parse_message
+from tasks.orchestrator import ImapConnectionPool, fetch_due_mailboxes
+from tasks.parsing import iter_parsed, shutdown_executor
+from tasks.rule_search import build_search_criteria
+from tasks.payload import get_payload_builder
+from tasks.tasks import _persist_batch, _bulk_insert_emails, ingest_uids, fetch_emails, process_email, process_email_batch
+from extraction.cache import ExtractionCache, LocalLRU
+from extraction.models import ExtractionProfile, ExtractionBatchItem, ExtractionBatchJob
+
+User = get_user_model()
+
+
+def make_raw_email(uid, subject="Intimação eletrônica", sender="intimacao@tjsp.jus.br", body="Corpo do email"):
+    return (
+        f"Message-ID: <msg-{uid}@tjsp.jus.br>\r\n"
+        f"Subject: {subject}\r\n"
+        f"From: {sender}\r\n"
+        f"To: escritorio@example.com\r\n"
+        f"Date: Mon, 17 Nov 2025 10:00:00 -0300\r\n"
+        f"Content-Type: text/plain; charset=utf-8\r\n"
+        f"\r\n"
+        f"{body}\r\n"
+    ).encode("utf-8")
+
+
+class FakeIMAPServer:
+    """
+    Stand-in local de um servidor IMAP (interface do imapclient.IMAPClient).
+    Guarda mensagens por UID e executa um roteiro para cada idle_check/noop.
+    """
+
+    def __init__(self, messages=None, capabilities=(b'IDLE',)):
+        self.messages = dict(messages or {})
+        self.capabilities = {c.upper() for c in capabilities}
+        self.idle_script = []
+        self.noop_script = []
+        self.fetch_calls = []
+        self.search_calls = []
+        self.in_idle = False
+        self.uidvalidity = 1
+        self.highest_modseq = None  # None = servidor sem CONDSTORE
+
+    def deliver(self, uid, raw=None):
+        self.messages[uid] = raw or make_raw_email(uid)
+        if self.highest_modseq is not None:
+            self.highest_modseq += 1
+
+    # --- API usada pelo código de produção ---
+    def login(self, username, password):
+        return b'OK'
+
+    def logout(self):
+        return b'BYE'
+
+    def select_folder(self, folder, readonly=False):
+        uidnext = max(self.messages, default=0) + 1
+        info = {b'EXISTS': len(self.messages), b'UIDNEXT': uidnext, b'UIDVALIDITY': self.uidvalidity}
+        if self.highest_modseq is not None:
+            info[b'HIGHESTMODSEQ'] = self.highest_modseq
+        return info
+
+    def has_capability(self, capability):
+        if isinstance(capability, str):
+            capability = capability.encode()
+        return capability.upper() in self.capabilities
+
+    def search(self, criteria, charset=None):
+        self.search_calls.append(list(criteria))
+        uids = sorted(self.messages)
+        keys = list(criteria)
+        if keys and keys[0] == 'UID':
+            start = int(keys[1].split(':')[0])
+            # comportamento real: "n:*" sempre inclui a última mensagem
+            uids = [u for u in uids if u >= start] or uids[-1:]
+            keys = keys[2:]
+        elif keys and keys[0] in ('ALL', 'UNSEEN'):
+            keys = keys[1:]
+        return [u for u in uids if self._match_keys(parse_message(u, self.messages[u]), keys)]
+
+    def _match_keys(self, record, keys):
+        keys = list(keys)
+        while keys:
+            if not self._match_one(record, keys):
+                return False
+        return True
+
+    def _match_one(self, record, keys):
+        """Avalia (e consome) um search-key: OR, listas (parênteses), SUBJECT, FROM."""
+        key = keys.pop(0)
+        if isinstance(key, list):
+            return self._match_keys(record, key)
+        key = (key.decode() if isinstance(key, bytes) else str(key)).upper()
+        if key == 'OR':
+            left = self._match_one(record, keys)
+            right = self._match_one(record, keys)
+            return left or right
+        if key in ('SUBJECT', 'FROM'):
+            value = keys.pop(0)
+            value = value.decode('utf-8') if isinstance(value, bytes) else value
+            field = record['subject'] if key == 'SUBJECT' else record['from_addr']
+            return value.lower() in field.lower()
+        if key in ('MODSEQ', 'X-GM-RAW'):
+            keys.pop(0)
+        return True
+
+    def fetch(self, uids, items):
+        self.fetch_calls.append((list(uids), list(items)))
+        return {uid: {b'RFC822': self.messages[uid], b'FLAGS': ()} for uid in uids if uid in self.messages}
+
+    def idle(self):
+        self.in_idle = True
+
+    def idle_check(self, timeout=None):
+        step = self.idle_script.pop(0) if self.idle_script else None
+        return step() if step else []
+
+    def idle_done(self):
+        self.in_idle = False
+        return (b'OK', [])
+
+    def noop(self):
+        step = self.noop_script.pop(0) if self.noop_script else None
+        return step() if step else (b'OK', [])
+
+
+class MailBoxIdleWorkerTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='idle', password='x')
+        self.mailbox = MailBox.objects.create(
+            user=self.user, name="Intimações", imap_host="imap.local",
+            username="caixa@example.com", password="secret",
+        )
+        AutomationRule.objects.create(user=self.user, mailbox=self.mailbox, name="Tudo")
+        self.server = FakeIMAPServer(messages={1: make_raw_email(1)})
+        self.stop_event = threading.Event()
+        self.worker = MailBoxIdleWorker(
+            self.mailbox.id, stop_event=self.stop_event,
+            client_factory=lambda params: self.server, poll_interval=0.01,
+        )
+
+    def _stop(self, responses=None):
+        def step():
+            self.stop_event.set()
+            return responses or []
+        return step
+
+    @mock.patch('tasks.tasks.async_task')
+    def test_exists_notification_ingests_only_new_uids(self, async_task):
+        def new_mail():
+            self.server.deliver(2)
+            return [(2, b'EXISTS')]
+
+        self.server.idle_script = [new_mail, self._stop()]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.worker.run_session()
+
+        # a mensagem pré-existente (UID 1) fica com o polling/histórico
+        self.assertEqual(
+            list(EmailMessage.objects.values_list('message_id', flat=True)),
+            ['<msg-2@tjsp.jus.br>'],
+        )
+        self.assertEqual(self.worker.last_uid, 2)
+        self.assertFalse(self.server.in_idle)
+        async_task.assert_called_once_with(
+            'tasks.tasks.process_email_batch', [EmailMessage.objects.get().id]
+        )
+
+    @mock.patch('tasks.tasks.async_task')
+    def test_falls_back_to_polling_without_idle_capability(self, async_task):
+        self.server.capabilities = set()
+
+        def new_mail():
+            self.server.deliver(2)
+            return (b'OK', [])
+
+        self.server.noop_script = [new_mail, self._stop()]
+        self.worker.run_session()
+
+        self.assertTrue(EmailMessage.objects.filter(message_id='<msg-2@tjsp.jus.br>').exists())
+        self.assertEqual(self.worker.last_uid, 2)
+
+    @mock.patch('tasks.tasks.async_task')
+    def test_reconnect_catches_up_from_last_seen_uid(self, async_task):
+        MailBoxSyncState.objects.create(mailbox=self.mailbox, folder='INBOX', uidvalidity=1, last_uid=1)
+        self.server.deliver(2)
+        self.server.deliver(3)
+        self.server.idle_script = [self._stop()]
+
+        self.worker.run_session()
+
+        self.assertEqual(EmailMessage.objects.count(), 2)
+        self.assertEqual(self.worker.last_uid, 3)
+        self.assertEqual(MailBoxSyncState.objects.get(mailbox=self.mailbox).last_uid, 3)
+
+
+@mock.patch('tasks.idle.MailBoxIdleWorker')
+class IdleSupervisorTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='supervisor', password='x')
+        self.mailboxes = [
+            MailBox.objects.create(user=user, name=f"Caixa {i}", imap_host="imap.local",
+                                   username=f"caixa{i}@example.com", password="secret")
+            for i in range(2)
+        ]
+        for mailbox in self.mailboxes:
+            Schedule.objects.create(func='tasks.tasks.fetch_emails', args=f'{mailbox.id}',
+                                    schedule_type=Schedule.MINUTES, minutes=5, repeats=-1)
+
+    def _repeats(self):
+        return [Schedule.objects.get(args=f'{m.id}').repeats for m in self.mailboxes]
+
+    def test_polling_is_paused_while_mailbox_is_under_idle(self, _):
+        supervisor = IdleSupervisor()
+
+        supervisor.reconcile()
+        self.assertEqual(self._repeats(), [0, 0])
+
+        MailBox.objects.filter(pk=self.mailboxes[1].pk).update(is_active=False)
+        supervisor.reconcile()
+        self.assertEqual(self._repeats(), [0, -1])
+
+        supervisor.shutdown()
+        self.assertEqual(self._repeats(), [-1, -1])
+
+
+@mock.patch('tasks.tasks.async_task')
+class FetchCheckpointTests(TestCase):
+    """fetch_emails incremental: UIDVALIDITY + maior UID + HIGHESTMODSEQ persistidos."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='sync', password='x')
+        self.mailbox = MailBox.objects.create(
+            user=self.user, name="Sync", imap_host="imap.local",
+            username="caixa@example.com", password="secret",
+        )
+        self.server = FakeIMAPServer(messages={1: make_raw_email(1), 2: make_raw_email(2)})
+        self.server.highest_modseq = 100
+        patcher = mock.patch('tasks.tasks.connect_imap', side_effect=lambda params: self.server)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _fetch(self):
+        self.server.search_calls.clear()
+        self.server.fetch_calls.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            return fetch_emails(self.mailbox.id)
+
+    def _state(self):
+        return MailBoxSyncState.objects.get(mailbox=self.mailbox, folder='INBOX')
+
+    def test_first_sync_persists_checkpoint(self, async_task):
+        self.assertEqual(self._fetch(), 2)
+        state = self._state()
+        self.assertEqual((state.uidvalidity, state.last_uid, state.highest_modseq), (1, 2, 100))
+
+    def test_unchanged_folder_skips_search_and_fetch(self, async_task):
+        self._fetch()
+        self.assertEqual(self._fetch(), 0)
+        self.assertEqual(self.server.search_calls, [])
+        self.assertEqual(self.server.fetch_calls, [])
+
+    def test_fetches_only_uids_above_checkpoint_changed_since_modseq(self, async_task):
+        self._fetch()
+        self.server.deliver(3)
+
+        self.assertEqual(self._fetch(), 1)
+        self.assertEqual(self.server.search_calls, [['UID', '3:*', 'MODSEQ', 101]])
+        self.assertEqual([uids for uids, _ in self.server.fetch_calls], [[3]])
+        self.assertEqual((self._state().last_uid, self._state().highest_modseq), (3, 101))
+
+    def test_archives_raw_message_when_enabled(self, async_task):
+        self.addCleanup(get_raw_store.cache_clear)
+        with tempfile.TemporaryDirectory() as root, override_settings(
+            RAW_ARCHIVE_BACKEND='filesystem', RAW_ARCHIVE_ROOT=root, RAW_ARCHIVE_COMPRESSION='gzip',
+        ):
+            get_raw_store.cache_clear()
+            self._fetch()
+            email = EmailMessage.objects.get(message_id='<msg-1@tjsp.jus.br>')
+            self.assertEqual(get_raw_store().read(email.raw_sha256), make_raw_email(1))
+
+    def test_uidvalidity_change_resets_checkpoint(self, async_task):
+        self._fetch()
+        # pasta recriada no servidor: mesmos emails, UIDs renumerados
+        self.server.uidvalidity = 2
+        self.server.messages = {10: make_raw_email(1), 11: make_raw_email(2), 12: make_raw_email(3)}
+
+        self.assertEqual(self._fetch(), 1)
+        self.assertEqual(self.server.search_calls[0], ['UNSEEN'])
+        state = self._state()
+        self.assertEqual((state.uidvalidity, state.last_uid), (2, 12))
+        self.assertEqual(EmailMessage.objects.count(), 3)
+
+
+@mock.patch('tasks.tasks.async_task')
+class ServerSideFilterTests(TestCase):
+    """Com server_side_filter, só os candidatos das regras são baixados."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='filtro', password='x')
+        self.mailbox = MailBox.objects.create(
+            user=self.user, name="Filtro", imap_host="imap.local",
+            username="caixa@example.com", password="secret", server_side_filter=True,
+        )
+        self.rule = AutomationRule.objects.create(
+            user=self.user, mailbox=self.mailbox, name="TJSP", sender_contains="tjsp.jus.br",
+        )
+        self.server = FakeIMAPServer(messages={
+            1: make_raw_email(1),
+            2: make_raw_email(2, subject="Promoção", sender="ofertas@loja.com"),
+        })
+        patcher = mock.patch('tasks.tasks.connect_imap', side_effect=lambda params: self.server)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _fetch(self):
+        self.server.fetch_calls.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            return fetch_emails(self.mailbox.id)
+
+    def test_rules_become_or_of_and_groups(self, async_task):
+        other = AutomationRule(subject_contains="Intimação", sender_contains="trt2.jus.br")
+        criteria = build_search_criteria([self.rule, other])
+
+        self.assertEqual(
+            b" ".join(_normalise_search_criteria(criteria, 'UTF-8')),
+            b'(OR (FROM tjsp.jus.br ALL) (SUBJECT Intima\xc3\xa7\xc3\xa3o FROM trt2.jus.br ALL))',
+        )
+        # uma regra sem condição casa com tudo: não há o que filtrar
+        self.assertIsNone(build_search_criteria([self.rule, AutomationRule()]))
+
+    def test_non_matching_mail_is_never_downloaded_but_checkpoint_advances(self, async_task):
+        self.assertEqual(self._fetch(), 1)
+        self.assertEqual([uids for uids, _ in self.server.fetch_calls], [[1]])
+
+        self.server.deliver(3, make_raw_email(3, sender="ofertas@loja.com"))
+        self.server.deliver(4)
+        with mock.patch('tasks.tasks.record_fetch', wraps=record_fetch) as recorded:
+            self.assertEqual(self._fetch(), 1)
+        # a cadência conta as 2 chegadas, não só o candidato do filtro
+        self.assertEqual(recorded.call_args.args[1], 2)
+
+        self.assertEqual([uids for uids, _ in self.server.fetch_calls], [[4]])
+        self.assertEqual(MailBoxSyncState.objects.get(mailbox=self.mailbox).last_uid, 4)
+        self.assertEqual(
+            sorted(EmailMessage.objects.values_list('message_id', flat=True)),
+            ['<msg-1@tjsp.jus.br>', '<msg-4@tjsp.jus.br>'],
+        )
+
+    def test_gmail_uses_x_gm_raw(self, async_task):
+        self.server.capabilities.add(b'X-GM-EXT-1')
+        self._fetch()
+        self.assertIn(['UNSEEN', b'X-GM-RAW', b'(from:"tjsp.jus.br")'], self.server.search_calls)
+
+
+@override_settings(IMAP_MAX_CONNECTIONS_PER_HOST=1, IMAP_POOL_MAX_IDLE_SECONDS=60)
+@mock.patch('tasks.tasks.async_task')
+class FetchOrchestratorTests(TransactionTestCase):
+    """Threads do orquestrador usam conexões próprias com o banco: TransactionTestCase."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='orq', password='x')
+        self.mailboxes = [
+            MailBox.objects.create(
+                user=self.user, name=f"Caixa {i}", imap_host="imap.local",
+                username=f"caixa{i}@example.com", password="secret",
+            )
+            for i in (1, 2)
+        ]
+        # já buscada agora há pouco: não está vencida
+        MailBox.objects.create(
+            user=self.user, name="Recente", imap_host="imap.local",
+            username="recente@example.com", password="secret", last_fetch_at=timezone.now(),
+        )
+        self.servers = {
+            "caixa1@example.com": FakeIMAPServer(messages={1: make_raw_email(1)}),
+            "caixa2@example.com": FakeIMAPServer(messages={2: make_raw_email(2)}),
+        }
+        self.logins = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+        for server in self.servers.values():
+            select_folder = server.select_folder
+
+            def slow_select(folder, readonly=False, _select=select_folder):
+                with self.lock:
+                    self.active += 1
+                    self.max_active = max(self.max_active, self.active)
+                time.sleep(0.05)
+                with self.lock:
+                    self.active -= 1
+                return _select(folder, readonly)
+
+            server.select_folder = slow_select
+
+    def _factory(self, params):
+        self.logins.append(params["username"])
+        return self.servers[params["username"]]
+
+    def test_fetches_due_mailboxes_respecting_per_host_limit(self, async_task):
+        summary = fetch_due_mailboxes(max_workers=4, pool=ImapConnectionPool(60, client_factory=self._factory))
+
+        self.assertEqual(summary["mailboxes"], 2)
+        self.assertEqual(summary["created"], 2)
+        self.assertEqual(self.max_active, 1)
+        self.assertEqual(sorted(self.logins), ["caixa1@example.com", "caixa2@example.com"])
+        self.assertTrue(all(r["fetch_seconds"] > 0 and r["error"] is None for r in summary["results"]))
+
+    def test_reuses_authenticated_connections_across_ticks(self, async_task):
+        pool = ImapConnectionPool(60, client_factory=self._factory)
+        fetch_due_mailboxes(pool=pool)
+        MailBox.objects.filter(id__in=[m.id for m in self.mailboxes]).update(last_fetch_at=None, next_fetch_at=None)
+
+        summary = fetch_due_mailboxes(pool=pool)
+
+        self.assertEqual(len(self.logins), 2)
+        self.assertTrue(all(r["reused_connection"] for r in summary["results"]))
+
+    def test_dead_pooled_connection_is_replaced(self, async_task):
+        pool = ImapConnectionPool(60, client_factory=self._factory)
+        params = {"host": "imap.local", "port": 993, "username": "caixa1@example.com"}
+        dead = mock.Mock()
+        dead.noop.side_effect = OSError("connection reset")
+        pool.release(params, dead)
+
+        server, reused = pool.acquire(params)
+
+        self.assertIs(server, self.servers["caixa1@example.com"])
+        self.assertFalse(reused)
+        dead.logout.assert_called_once()
+
+
+@override_settings(IMAP_POLL_MIN_SECONDS=30, IMAP_POLL_MAX_SECONDS=3600, IMAP_POLL_TARGET_MESSAGES=1.0,
+                   IMAP_ARRIVAL_RATE_WINDOW_SECONDS=3600, IMAP_FETCH_INTERVAL_SECONDS=300)
+class AdaptiveCadenceTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cadence', password='x')
+        self.mailbox = MailBox.objects.create(
+            user=self.user, name="Cadência", imap_host="imap.local",
+            username="caixa@example.com", password="secret",
+        )
+        self.schedule = Schedule.objects.create(
+            func='tasks.tasks.fetch_emails', args=f'{self.mailbox.id}',
+            schedule_type=Schedule.MINUTES, minutes=5,
+        )
+        self.now = timezone.now()
+
+    def test_interval_bounds_and_override(self):
+        self.assertEqual(compute_interval(100.0), 36)
+        self.assertEqual(compute_interval(500.0), 30)
+        self.assertEqual(compute_interval(12.0), 300)
+        self.assertEqual(compute_interval(0.0), 3600)
+        self.assertEqual(compute_interval(500.0, override=900), 900)
+
+    @override_settings(IMAP_FETCH_ORCHESTRATOR=True)
+    def test_orchestrator_tick_is_the_floor(self):
+        self.assertEqual(compute_interval(500.0), 60)
+        self.assertEqual(compute_interval(500.0, override=20), 60)
+        self.assertEqual(compute_interval(12.0), 300)
+
+    def test_hot_mailbox_polls_faster_and_rewrites_schedule(self):
+        record_fetch(self.mailbox, 0)  # primeira sincronização: cadência padrão
+        self.assertEqual(self.mailbox.poll_interval_seconds, 300)
+
+        # 240 emails/h sustentados por uma hora, em polls de 1 minuto
+        at = self.now
+        for _ in range(60):
+            previous, at = at, at + timedelta(seconds=60)
+            record_fetch(self.mailbox, 4, previous_fetch_at=previous, now=at)
+
+        self.mailbox.refresh_from_db()
+        self.schedule.refresh_from_db()
+        self.assertEqual(self.mailbox.poll_interval_seconds, 30)
+        self.assertEqual(self.schedule.minutes, 1)
+        self.assertEqual(self.schedule.next_run, at + timedelta(seconds=30))
+
+    def test_cold_mailbox_backs_off_to_ceiling(self):
+        record_fetch(self.mailbox, 0)
+        at = self.now
+        for _ in range(24):
+            previous, at = at, at + timedelta(seconds=self.mailbox.poll_interval_seconds)
+            record_fetch(self.mailbox, 0, previous_fetch_at=previous, now=at)
+
+        self.schedule.refresh_from_db()
+        self.assertEqual(self.mailbox.poll_interval_seconds, 3600)
+        self.assertEqual(self.schedule.minutes, 60)
+
+    def test_override_wins_over_observed_rate(self):
+        self.mailbox.poll_interval_override = 120
+        record_fetch(self.mailbox, 50, previous_fetch_at=self.now - timedelta(minutes=1), now=self.now)
+        self.assertEqual(self.mailbox.poll_interval_seconds, 120)
+        self.assertEqual(self.mailbox.next_fetch_at, self.now + timedelta(seconds=120))
+
+
+class BulkPersistenceTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulk', password='x')
+        self.mailbox = MailBox.objects.create(
+            user=self.user, name="Bulk", imap_host="imap.local",
+            username="caixa@example.com", password="secret",
+        )
+        AutomationRule.objects.create(user=self.user, mailbox=self.mailbox, name="Tudo")
+
+    def _records(self, *uids):
+        return [parse_message(uid, make_raw_email(uid)) for uid in uids]
+
+    @mock.patch('tasks.tasks.async_task')
+    def test_batch_dedups_with_one_query_and_enqueues_one_group(self, async_task):
+        _persist_batch(self.mailbox, self._records(1), "imap.local")
+        records = self._records(1, 2, 3) + self._records(3)  # UID 1 já existe; 3 repetido no lote
+
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            created = _persist_batch(self.mailbox, records, "imap.local")
+
+        # 1 SELECT ... IN para a dedup e 1 INSERT em lote (fora os savepoints)
+        statements = [q['sql'].split()[0] for q in ctx.captured_queries]
+        self.assertEqual([s for s in statements if s in ('SELECT', 'INSERT')], ['SELECT', 'INSERT'])
+
+        self.assertEqual(len(created), 2)
+        self.assertEqual(EmailMessage.objects.count(), 3)
+        self.assertEqual(created[0].headers['to'], 'escritorio@example.com')
+        async_task.assert_called_once_with('tasks.tasks.process_email_batch', [e.pk for e in created])
+
+    @override_settings(PROCESS_EMAIL_TIME_BUDGET_SECONDS=30)
+    @mock.patch('tasks.tasks.async_task')
+    def test_batch_requeues_the_rest_when_the_time_budget_runs_out(self, async_task):
+        clock = iter([0, 10, 31])  # deadline, antes do 2º email, antes do 3º
+        with mock.patch('tasks.tasks.process_email') as process, \
+                mock.patch('tasks.tasks.time.monotonic', side_effect=lambda: next(clock)):
+            self.assertEqual(process_email_batch([1, 2, 3, 4]), 2)
+
+        self.assertEqual([c.args[0] for c in process.call_args_list], [1, 2])
+        async_task.assert_called_once_with('tasks.tasks.process_email_batch', [3, 4])
+
+    @override_settings(IMAP_PARTIAL_FETCH=False)
+    def test_ingestion_stops_between_batches_once_the_deadline_passes(self):
+        clock = iter([5, 11])  # antes do 2º lote, antes do 3º
+        with mock.patch('tasks.tasks._fetch_batch_full', return_value=[]), \
+                mock.patch('tasks.tasks._persist_batch', return_value=[]), \
+                mock.patch('tasks.tasks.touch_mailbox_checkpoint'), \
+                mock.patch('tasks.tasks.time.monotonic', side_effect=lambda: next(clock)):
+            _, processed = ingest_uids(None, self.mailbox, list(range(1, 451)), "imap.local", deadline=10)
+
+        self.assertEqual(processed, list(range(1, 401)))
+
+    @mock.patch('tasks.tasks.async_task')
+    def test_enqueue_waits_for_commit(self, async_task):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            _persist_batch(self.mailbox, self._records(1), "imap.local")
+        async_task.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+
+    @mock.patch('tasks.tasks.async_task')
+    def test_rules_are_matched_at_ingestion_and_unmatched_emails_are_not_enqueued(self, async_task):
+        AutomationRule.objects.filter(mailbox=self.mailbox).update(subject_contains="intimação")
+        rule = AutomationRule.objects.get(mailbox=self.mailbox)
+        rule.save()  # invalida o matcher em cache
+        records = self._records(1) + [parse_message(2, make_raw_email(2, subject="Newsletter"))]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            created = _persist_batch(self.mailbox, records, "imap.local")
+
+        matched, ignored = created
+        self.assertEqual((matched.matched_rule_id, matched.status), (rule.pk, 'PENDING'))
+        self.assertEqual((ignored.matched_rule_id, ignored.status), (None, 'IGNORED'))
+        async_task.assert_called_once_with('tasks.tasks.process_email_batch', [matched.pk])
+
+        # o worker usa a regra resolvida na ingestão, sem reavaliar as regras
+        with mock.patch('tasks.tasks.match_rule') as match_rule, \
+                mock.patch('tasks.tasks.notify_telegram'):
+            process_email(matched.pk)
+        match_rule.assert_not_called()
+        self.assertEqual(EmailMessage.objects.get(pk=matched.pk).status, 'REVIEW')  # regra sem perfil
+
+    def test_concurrent_insert_falls_back_to_row_by_row(self):
+        _persist_batch(self.mailbox, self._records(1), "imap.local")
+        # Linhas montadas sem passar pela dedup, simulando outro worker que gravou o UID 1
+        builder = get_payload_builder()
+        rows = [builder.build(r, self.mailbox, r['uid']) for r in self._records(1, 2)]
+
+        created = _bulk_insert_emails(rows)
+
+        self.assertEqual([e.message_id for e in created], ['<msg-2@tjsp.jus.br>'])
+        self.assertEqual(EmailMessage.objects.count(), 2)
+
+
+@mock.patch('extraction.metrics.get_redis_client', return_value=None)
+@mock.patch('tasks.tasks.notify_telegram')
+class ExtractionCacheIntegrationTests(TestCase):
+
+    def setUp(self):
+        cache = ExtractionCache(LocalLRU(100, 600))
+        patcher = mock.patch('tasks.tasks.get_extraction_cache', return_value=cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _email(self, username, message_id, profile=None):
+        user = User.objects.get_or_create(username=username)[0]
+        mailbox = MailBox.objects.create(user=user, name=message_id, imap_host="imap.local",
+                                         username=f"{username}@example.com", password="secret")
+        profile = profile or ExtractionProfile.objects.create(
+            user=user, name=f"Perfil {username}", system_prompt_template="Extraia o prazo.",
+            pydantic_schema_name="SupportRequestSchema",
+        )
+        AutomationRule.objects.create(user=user, mailbox=mailbox, name="Tudo", extraction_profile=profile)
+        return EmailMessage.objects.create(
+            mailbox=mailbox, message_id=message_id, subject="Intimação", sender="intimacao@tjsp.jus.br",
+            received_at=timezone.now(), body_text="Prazo de 15 dias.\r\n",
+        ), profile
+
+    def test_identical_notice_calls_api_once_per_tenant(self, notify, _):
+        first, profile = self._email('escritorio', '<a@x>')
+        # mesma intimação recebida em outra caixa do mesmo usuário, com espaços diferentes
+        second, _ = self._email('escritorio', '<b@x>', profile=profile)
+        EmailMessage.objects.filter(pk=second.pk).update(body_text="Prazo de  15 dias.")
+        other_tenant, _ = self._email('outro', '<c@x>')
+
+        with mock.patch('tasks.tasks.extract_fields_from_text', return_value={'assunto': 'prazo'}) as extract:
+            for email in (first, second, other_tenant):
+                process_email(email.pk)
+
+        self.assertEqual(extract.call_count, 2)
+        self.assertEqual(extract.call_args.kwargs['text'], "Prazo de 15 dias.")
+        stored = EmailMessage.objects.get(pk=second.pk)
+        self.assertEqual(stored.extracted_data, {'assunto': 'prazo'})
+        self.assertEqual((stored.preprocessed_text, stored.input_tokens), ("Prazo de 15 dias.", 5))
+
+    def test_shared_profile_reuses_result_across_tenants(self, notify, _):
+        first, profile = self._email('escritorio', '<a@x>')
+        ExtractionProfile.objects.filter(pk=profile.pk).update(cache_scope=ExtractionProfile.CacheScope.SHARED)
+        other_tenant, _ = self._email('outro', '<c@x>', profile=profile)
+
+        with mock.patch('tasks.tasks.extract_fields_from_text', return_value={'assunto': 'prazo'}) as extract:
+            process_email(first.pk)
+            process_email(other_tenant.pk)
+
+        self.assertEqual(extract.call_count, 1)
+
+    @override_settings(EXTRACTION_ASYNC_ENABLED=True)
+    def test_batch_sends_cache_misses_to_async_engine_in_one_call(self, notify, _):
+        cached, profile = self._email('escritorio', '<a@x>')
+        with mock.patch('tasks.tasks.extract_fields_from_text', return_value={'assunto': 'prazo'}):
+            process_email(cached.pk)
+        repeated, _ = self._email('escritorio', '<b@x>', profile=profile)
+        new, _ = self._email('escritorio', '<c@x>', profile=profile)
+        EmailMessage.objects.filter(pk=new.pk).update(body_text="Prazo de 5 dias.")
+        broken, _ = self._email('escritorio', '<d@x>', profile=profile)
+        EmailMessage.objects.filter(pk=broken.pk).update(body_text="Sem prazo.")
+
+        def engine(requests):
+            self.assertEqual([r.text for r in requests], ["Prazo de 5 dias.", "Sem prazo."])
+            return [{'assunto': 'prazo curto'}, RuntimeError("conexão perdida")]
+
+        with mock.patch('tasks.tasks.run_extractions', side_effect=engine) as run:
+            self.assertEqual(process_email_batch([repeated.pk, new.pk, broken.pk]), 3)
+
+        run.assert_called_once()
+        statuses = dict(EmailMessage.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[repeated.pk], 'INTEGRATED')
+        self.assertEqual(statuses[new.pk], 'INTEGRATED')
+        self.assertEqual(statuses[broken.pk], 'FAILED')
+        self.assertEqual(EmailMessage.objects.get(pk=new.pk).extracted_data, {'assunto': 'prazo curto'})
+
+
+@mock.patch('extraction.metrics.get_redis_client', return_value=None)
+@mock.patch('tasks.tasks.get_extraction_cache', return_value=None)
+@mock.patch('tasks.tasks.notify_telegram')
+class FastPathIntegrationTests(TestCase):
+
+    def test_llm_gets_only_the_fields_the_fast_path_missed(self, notify, *_):
+        user = User.objects.create_user(username='juridico', password='x')
+        mailbox = MailBox.objects.create(user=user, name="Jurídico", imap_host="imap.local",
+                                         username="juridico@example.com", password="secret")
+        profile = ExtractionProfile.objects.create(
+            user=user, name="Intimações", system_prompt_template="Resuma a intimação.",
+            pydantic_schema_name="ProcessoJuridicoSchema",
+        )
+        AutomationRule.objects.create(user=user, mailbox=mailbox, name="Tudo", extraction_profile=profile)
+        email = EmailMessage.objects.create(
+            mailbox=mailbox, message_id="<cnj@x>", subject="Intimação", sender="intimacao@tjsp.jus.br",
+            received_at=timezone.now(),
+            body_text="Processo 0001234-37.2025.8.26.0100\nTipo de documento: Intimação\n"
+                      "Fica intimada a parte; prazo de 15 dias, até 03/11/2025.",
+        )
+        answer = {'confidence_score': 80, 'resumo_movimentacao': 'Intimação para manifestação.',
+                  'sugestao_proximo_passo': 'Protocolar manifestação'}
+
+        with mock.patch('tasks.tasks.extract_fields_from_text', return_value=answer) as extract:
+            process_email(email.pk)
+
+        schema = extract.call_args.kwargs['schema']
+        self.assertEqual(set(schema.model_fields), set(answer))
+        stored = EmailMessage.objects.get(pk=email.pk)
+        self.assertEqual(stored.status, 'INTEGRATED')
+        self.assertEqual(stored.extracted_data['numero_processo'], '0001234-37.2025.8.26.0100')
+        self.assertEqual(stored.extracted_data['prazo_fatal'], '2025-11-03')
+        self.assertEqual(stored.extracted_data['resumo_movimentacao'], 'Intimação para manifestação.')
+
+
+@mock.patch('extraction.metrics.get_redis_client', return_value=None)
+@mock.patch('tasks.tasks.get_extraction_cache', return_value=None)
+@mock.patch('tasks.tasks.notify_telegram')
+class PipelineStageTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='etapas', password='x')
+        mailbox = MailBox.objects.create(user=self.user, name="Etapas", imap_host="imap.local",
+                                         username="etapas@example.com", password="secret")
+        profile = ExtractionProfile.objects.create(
+            user=self.user, name="Suporte", system_prompt_template="Extraia o chamado.",
+            pydantic_schema_name="SupportRequestSchema",
+        )
+        AutomationRule.objects.create(user=self.user, mailbox=mailbox, name="Tudo", extraction_profile=profile)
+        self.email = EmailMessage.objects.create(
+            mailbox=mailbox, message_id="<etapas@x>", subject="Chamado", sender="cliente@example.com",
+            received_at=timezone.now(), body_text="O portal caiu.",
+        )
+
+    def test_integration_failure_resumes_without_calling_the_llm_again(self, notify, *_):
+        calls = itertools.count()
+
+        def telegram(email_msg, message):
+            # só o primeiro envio cai; o aviso de erro do próprio pipeline também passa por aqui
+            if next(calls) == 0:
+                raise RuntimeError("502 Bad Gateway")
+            return {'ok': True, 'result': {'message_id': 42}}
+
+        notify.side_effect = telegram
+
+        with mock.patch('tasks.tasks.extract_fields_from_text', return_value={'assunto': 'portal'}) as extract:
+            process_email(self.email.pk)
+            failed = EmailMessage.objects.get(pk=self.email.pk)
+            process_email(self.email.pk)
+
+        self.assertEqual(failed.status, 'FAILED')
+        self.assertEqual(failed.stages['extract']['status'], 'DONE')
+        self.assertEqual(failed.stages['telegram']['status'], 'FAILED')
+        self.assertIn("502", failed.stages['telegram']['error'])
+
+        extract.assert_called_once()
+        email = EmailMessage.objects.get(pk=self.email.pk)
+        self.assertEqual(email.status, 'INTEGRATED')
+        self.assertEqual(email.extracted_data, {'assunto': 'portal'})
+        self.assertEqual(email.stages['telegram'], {**email.stages['telegram'], 'status': 'DONE', 'attempts': 2,
+                                                    'result': {'message_id': 42}, 'error': None})
+        self.assertEqual(email.stages['extract']['attempts'], 1)
+
+    @mock.patch('emails.views.async_task')
+    def test_reprocess_endpoint_enqueues_the_real_task(self, async_task, *_):
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(f'/api/v1/emails/{self.email.pk}/reprocess/', {'restart': True}, format='json')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['new_status'], 'Pendente de Processamento')
+        async_task.assert_called_once_with('tasks.tasks.process_email', self.email.pk)
+
+
+class FakeBatchAPI:
+    """Fake local dos endpoints de arquivos e lotes da OpenAI (files.create/content, batches.create/retrieve)."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._files = {}
+        self._batches = {}
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=lambda batch_id: self._batches[batch_id])
+
+    def _create_file(self, file, purpose):
+        file_id = f"file-{next(self._ids)}"
+        self._files[file_id] = file[1].decode('utf-8')
+        return SimpleNamespace(id=file_id)
+
+    def _file_content(self, file_id):
+        return SimpleNamespace(text=self._files[file_id])
+
+    def _create_batch(self, input_file_id, endpoint, completion_window):
+        batch = SimpleNamespace(id=f"batch-{next(self._ids)}", input_file_id=input_file_id, status='validating',
+                                output_file_id=None, error_file_id=None)
+        self._batches[batch.id] = batch
+        return batch
+
+    def requests(self, batch_id):
+        return [json.loads(line) for line in self._files[self._batches[batch_id].input_file_id].splitlines()]
+
+    def complete(self, batch_id, respond):
+        """Conclui o lote respondendo cada requisição com respond(user_prompt)."""
+        lines = [
+            {"custom_id": r["custom_id"], "error": None, "response": {"status_code": 200, "body": {
+                "choices": [{"message": {"content": respond(r["body"]["messages"][1]["content"])}}]}}}
+            for r in self.requests(batch_id)
+        ]
+        output_id = f"file-{next(self._ids)}"
+        self._files[output_id] = "\n".join(json.dumps(line) for line in lines)
+        self._batches[batch_id].output_file_id = output_id
+        self._batches[batch_id].status = 'completed'
+
+
+SUPPORT_JSON = json.dumps({
+    "document_type": "SUPPORT_REQUEST", "confidence_score": 90, "system_affected": "CRM",
+    "issue_summary": "Erro", "is_critical": False, "requester_email": "a@b.com",
+})
+
+
+@override_settings(EXTRACTION_BATCH_MIN_ITEMS=2, EXTRACTION_BATCH_MAX_WAIT_SECONDS=600)
+@mock.patch('extraction.metrics.get_redis_client', return_value=None)
+@mock.patch('tasks.tasks.get_extraction_cache', return_value=None)
+@mock.patch('tasks.tasks.notify_telegram')
+class BatchDeliveryTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='lote', password='x')
+        mailbox = MailBox.objects.create(user=user, name="Lote", imap_host="imap.local",
+                                         username="lote@example.com", password="secret")
+        profile = ExtractionProfile.objects.create(
+            user=user, name="Suporte em massa", system_prompt_template="Extraia o chamado.",
+            pydantic_schema_name="SupportRequestSchema", delivery_mode=ExtractionProfile.DeliveryMode.BATCH,
+        )
+        AutomationRule.objects.create(user=user, mailbox=mailbox, name="Suporte", extraction_profile=profile)
+        self.emails = [
+            EmailMessage.objects.create(mailbox=mailbox, message_id=f"<lote-{i}@x>", subject="Chamado",
+                                        sender="cliente@example.com", received_at=timezone.now(),
+                                        body_text=f"Chamado {i}")
+            for i in range(2)
+        ]
+        self.api = FakeBatchAPI()
+
+    def _status(self, email):
+        return EmailMessage.objects.get(pk=email.pk).status
+
+    def test_batch_roundtrip_with_validation_retry(self, notify, *_):
+        with mock.patch('tasks.tasks.run_extractions') as run:
+            process_email_batch([e.pk for e in self.emails])
+        run.assert_not_called()
+        self.assertTrue(Schedule.objects.filter(name=BATCH_SCHEDULE_NAME).exists())
+        self.assertEqual([self._status(e) for e in self.emails], ['PROCESSING', 'PROCESSING'])
+
+        [job] = submit_pending_batches(client=self.api)
+        requests = self.api.requests(job.openai_batch_id)
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[0]["url"], "/v1/chat/completions")
+        self.assertIn("SCHEMA JSON", requests[0]["body"]["messages"][0]["content"])
+
+        # o primeiro volta válido; o segundo falha na validação e entra no próximo lote com a correção
+        self.api.complete(job.openai_batch_id, lambda prompt: SUPPORT_JSON if "Chamado 0" in prompt else '{}')
+        self.assertEqual(poll_extraction_batches(client=self.api)[0]['retried'], 1)
+        self.assertEqual(self._status(self.emails[0]), 'INTEGRATED')
+        self.assertEqual(EmailMessage.objects.get(pk=self.emails[0].pk).extracted_data['system_affected'], "CRM")
+        self.assertEqual(self._status(self.emails[1]), 'PROCESSING')
+
+        with self.settings(EXTRACTION_BATCH_MAX_WAIT_SECONDS=0):
+            [retry_job] = submit_pending_batches(client=self.api)
+        [retry] = self.api.requests(retry_job.openai_batch_id)
+        self.assertIn("Corrija os erros de schema", retry["body"]["messages"][1]["content"])
+
+        self.api.complete(retry_job.openai_batch_id, lambda prompt: SUPPORT_JSON)
+        poll_extraction_batches(client=self.api)
+        self.assertEqual(self._status(self.emails[1]), 'INTEGRATED')
+        self.assertFalse(ExtractionBatchJob.objects.exclude(status='completed').exists())
+
+    def test_failure_while_applying_is_retried_on_next_poll(self, *_):
+        process_email_batch([e.pk for e in self.emails])
+        [job] = submit_pending_batches(client=self.api)
+        self.api.complete(job.openai_batch_id, lambda prompt: SUPPORT_JSON)
+
+        calls = itertools.count()
+
+        def flaky_finish(item, extracted_data):
+            if next(calls) == 1:
+                raise ConnectionError("banco fora do ar")
+            _finish_item(item, extracted_data)
+
+        with mock.patch('tasks.batch._finish_item', side_effect=flaky_finish):
+            [result] = poll_extraction_batches(client=self.api)
+        self.assertIn('error', result)
+        self.assertIsNone(ExtractionBatchJob.objects.get(pk=job.pk).applied_at)
+        self.assertEqual([self._status(e) for e in self.emails], ['INTEGRATED', 'PROCESSING'])
+
+        [result] = poll_extraction_batches(client=self.api)
+        self.assertEqual(result['extracted'], 1)
+        self.assertEqual([self._status(e) for e in self.emails], ['INTEGRATED', 'INTEGRATED'])
+        self.assertIsNotNone(ExtractionBatchJob.objects.get(pk=job.pk).applied_at)
+        self.assertEqual(poll_extraction_batches(client=self.api), [])
+
+    def test_failed_batch_without_output_requeues_items(self, *_):
+        process_email_batch([e.pk for e in self.emails])
+        [job] = submit_pending_batches(client=self.api)
+        self.api._batches[job.openai_batch_id].status = 'failed'
+
+        [result] = poll_extraction_batches(client=self.api)
+
+        self.assertEqual((result['requeued'], result['failed']), (2, 0))
+        self.assertEqual([self._status(e) for e in self.emails], ['PROCESSING', 'PROCESSING'])
+        requeued = ExtractionBatchItem.objects.filter(job__isnull=True)
+        self.assertEqual(sorted(requeued.values_list('email_id', flat=True)), [e.pk for e in self.emails])
+        self.assertEqual(set(requeued.values_list('attempt', flat=True)), {1})
+
+    def test_waits_for_volume_or_age_before_submitting(self, *_):
+        process_email(self.emails[0].pk)
+
+        self.assertEqual(submit_pending_batches(client=self.api), [])
+        later = timezone.now() + timedelta(minutes=11)
+        self.assertEqual(len(submit_pending_batches(client=self.api, now=later)), 1)
+        self.assertFalse(ExtractionBatchItem.objects.filter(job__isnull=True).exists())
+
+
+class ParsingStageTests(TestCase):
+
+    def test_pool_preserves_order_and_isolates_bad_messages(self):
+        self.addCleanup(shutdown_executor)
+        items = [(uid, make_raw_email(uid, subject=f"Assunto {uid}")) for uid in range(1, 41)]
+        items[10] = (11, None)  # mensagem corrompida no meio do lote
+
+        results = list(iter_parsed(items, workers=2, min_batch=0))
+
+        self.assertEqual([uid for uid, _, _ in results], list(range(1, 41)))
+        self.assertIsNotNone(results[10][2])
+        ok = [record for _, record, error in results if not error]
+        self.assertEqual(len(ok), 39)
+        self.assertEqual(ok[0]['subject'], 'Assunto 1')
+        self.assertEqual(len(ok[0]['sha256']), 64)
+
+    def test_small_batches_are_parsed_inline(self):
+        with mock.patch('tasks.parsing.get_executor') as get_executor:
+            results = list(iter_parsed([(1, make_raw_email(1))], workers=4, min_batch=32))
+        get_executor.assert_not_called()
+        self.assertEqual(results[0][1]['message_id'], '<msg-1@tjsp.jus.br>')
+
+
+class PartialFetchTests(TestCase):
+    """Fetch header-first: a fase 2 pede apenas a seção de texto, nunca o anexo."""
+
+    ENVELOPE = (
+        b'ENVELOPE ("Mon, 17 Nov 2025 10:00:00 -0300" "=?utf-8?q?Intima=C3=A7=C3=A3o?=" '
+        b'(("TJSP" NIL "intimacao" "tjsp.jus.br")) NIL NIL (("Escritorio" NIL "adv" "example.com")) '
+        b'NIL NIL NIL "<msg-7@tjsp.jus.br>")'
+    )
+
+    class Server:
+        def __init__(self, responses):
+            self.responses = responses
+            self.calls = []
+
+        def fetch(self, uids, items):
+            self.calls.append(list(items))
+            return parse_fetch_response(self.responses[items[-1]])
+
+    def test_fetches_only_text_section_of_multipart_with_attachment(self):
+        structure = (
+            b'BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "QUOTED-PRINTABLE" 27 1 NIL NIL NIL)'
+            b'("APPLICATION" "PDF" ("NAME" "peticao.pdf") NIL NIL "BASE64" 900000 NIL '
+            b'("ATTACHMENT" ("FILENAME" "peticao.pdf")) NIL) "MIXED" ("BOUNDARY" "x") NIL NIL)'
+        )
+        server = self.Server({
+            'RFC822.SIZE': [b'1 (UID 7 RFC822.SIZE 901234 ' + self.ENVELOPE + b' ' + structure + b')'],
+            'BODY.PEEK[1]<0.4096>': [(b'1 (UID 7 BODY[1]<0> {27}', b'Prazo de 15 dias =C3=BAteis'), b')'],
+        })
+
+        records = fetch_batch_partial(server, [7], max_bytes=4096)
+
+        self.assertEqual(server.calls[1], ['BODY.PEEK[1]<0.4096>'])
+        record = records[0]
+        self.assertEqual(record['message_id'], '<msg-7@tjsp.jus.br>')
+        self.assertEqual(record['subject'], 'Intimação')
+        self.assertEqual(record['from_addr'], 'TJSP <intimacao@tjsp.jus.br>')
+        self.assertEqual(record['body_text'], 'Prazo de 15 dias úteis')
+        self.assertEqual(record['size'], 901234)
+
+    def test_truncated_base64_body_respects_size_ceiling(self):
+        encoded = base64.b64encode(('Decisão proferida. ' * 20).encode('utf-8'))
+        structure = (
+            b'BODYSTRUCTURE ("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "BASE64" '
+            + str(len(encoded)).encode() + b' 1 NIL NIL NIL)'
+        )
+        chunk = encoded[:30]
+        server = self.Server({
+            'RFC822.SIZE': [b'1 (UID 8 RFC822.SIZE 600 ' + self.ENVELOPE + b' ' + structure + b')'],
+            'BODY.PEEK[1]<0.30>': [(b'1 (UID 8 BODY[1]<0> {30}', chunk), b')'],
+        })
+
+        records = fetch_batch_partial(server, [8], max_bytes=30)
+
+        self.assertTrue(records[0]['body_text'].startswith('Decisão proferida.'))
+        self.assertLess(len(records[0]['body_text']), 30)
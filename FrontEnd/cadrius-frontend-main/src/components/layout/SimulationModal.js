@@ -34,9 +34,12 @@ function SimulationModal({ isOpen, onClose }) {
         
         setLoading(true);
         try {
-            // Chama o endpoint de simulação que já existe no seu backend
-            await api.post('emails/simulate/', formData);
-            alert('✅ E-mail simulado injetado!\n\nO sistema vai processá-lo agora. Verifique a tela de "Processos" ou "Comunicação" em alguns segundos.');
+            // Avalia as regras da caixa para este e-mail (nada é gravado nem processado)
+            const res = await api.post('emails/simulate/', formData);
+            const rule = res.data.matched_rule;
+            alert(rule
+                ? `✅ A regra "${rule.name}" pegaria este e-mail${rule.extraction_profile ? ` (perfil: ${rule.extraction_profile})` : ''}.`
+                : '⚠️ Nenhuma regra ativa pegaria este e-mail: ele seria ignorado.');
             onClose();
         } catch (error) {
             console.error("Erro na simulação:", error);
@@ -58,7 +61,7 @@ function SimulationModal({ isOpen, onClose }) {
 
                 <div className={styles.form_body}>
                     <p style={{fontSize: '0.875rem', color: '#6B7280', marginBottom: '1rem'}}>
-                        Teste suas regras injetando um e-mail falso diretamente no sistema.
+                        Teste suas regras com um e-mail de exemplo, sem gravá-lo no sistema.
                     </p>
 
                     {/* Seleção da Caixa */}